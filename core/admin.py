@@ -1,9 +1,18 @@
 from django.contrib import admin
 
-from .models import Program, Hall, Wing, StudentProfile, EmergencyContact
+from .models import Program, Hall, Wing, StudentProfile, EmergencyContact, BackupManifest
 
 admin.site.register(Program)
 admin.site.register(Hall)
 admin.site.register(Wing)
-admin.site.register(StudentProfile)
-admin.site.register(EmergencyContact)
\ No newline at end of file
+
+
+@admin.register(StudentProfile)
+class StudentProfileAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'email', 'id_picture_status', 'created_at')
+    list_filter = ('id_picture_status',)
+    readonly_fields = ('id_picture_status', 'id_picture_staged', 'id_picture_error')
+
+
+admin.site.register(EmergencyContact)
+admin.site.register(BackupManifest)
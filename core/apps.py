@@ -6,16 +6,18 @@ class CoreConfig(AppConfig):
     name = 'core'
     
     def ready(self):
-        """Configure storage when app is ready"""
+        """Configure storage and connect signal handlers when app is ready"""
         from django.conf import settings
+        from . import signals  # noqa: F401
         if getattr(settings, 'USE_CLOUDINARY', False):
             try:
                 from cloudinary_storage.storage import MediaCloudinaryStorage
                 from .models import StudentProfile
-                # Get the field and set its storage
-                field = StudentProfile._meta.get_field('id_picture')
-                field.storage = MediaCloudinaryStorage()
-                print(f"[APPS] Set Cloudinary storage on id_picture field: {type(field.storage).__name__}")
+                # Get the picture fields and set their storage
+                storage = MediaCloudinaryStorage()
+                for name in ('id_picture', 'id_picture_medium', 'id_picture_thumbnail'):
+                    StudentProfile._meta.get_field(name).storage = storage
+                print(f"[APPS] Set Cloudinary storage on id_picture fields: {type(storage).__name__}")
             except Exception as e:
                 print(f"[APPS] Error setting Cloudinary storage: {e}")
                 import traceback
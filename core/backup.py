@@ -0,0 +1,938 @@
+"""
+SQL backup generation for /api/backup/.
+
+The dump is produced by generators so it can be streamed to the client:
+rows are read from a server-side cursor in batches of BATCH_SIZE and the SQL
+text is flushed in CHUNK_SIZE pieces, so memory use does not grow with the
+size of the tables.
+
+Two formats are available:
+
+- ``sql``: schema plus one INSERT statement per row.
+- ``copy``: schema plus ``COPY ... FROM stdin`` blocks streamed straight from
+  PostgreSQL's ``COPY ... TO STDOUT``, with no per-value work in Python. On
+  databases without COPY (SQLite in development) the data is written as
+  multi-row INSERTs instead.
+
+Incremental backups (``?since=`` or ``?manifest=``) contain only the students
+changed after a watermark, with their emergency contacts and wings, as
+upserts to apply on top of a full backup.
+
+Either format can be compressed on the fly with gzip or zstd; the result is a
+plain psql script once decompressed.
+"""
+import datetime as dt
+import logging
+import zlib
+from dataclasses import dataclass, field
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection
+from django.db.migrations.recorder import MigrationRecorder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched from the server-side cursor per round trip
+BATCH_SIZE = 2000
+# Approximate size of each chunk handed to the response
+CHUNK_SIZE = 64 * 1024
+# Rows per statement for multi-row INSERTs
+INSERT_BATCH_SIZE = 500
+# Incremental backups also re-read rows changed shortly before the watermark,
+# so transactions still committing when the previous backup started are not
+# missed. Upserts make the overlap harmless.
+WATERMARK_OVERLAP = dt.timedelta(minutes=5)
+
+FORMATS = ('sql', 'copy')
+COMPRESSIONS = {
+    # name: (file extension, content type)
+    'none': ('', 'application/sql'),
+    'gzip': ('.gz', 'application/gzip'),
+    'zstd': ('.zst', 'application/zstd'),
+}
+
+SEPARATOR = "-- ============================================"
+
+
+# ============================================
+# STORAGE CONFIGURATION
+# ============================================
+
+def get_cloud_name():
+    cloudinary_config = getattr(settings, 'CLOUDINARY_STORAGE', {})
+    return cloudinary_config.get('CLOUD_NAME', 'dtm2fwxth')
+
+
+def get_storage_backend_name():
+    storage_backend = getattr(settings, 'DEFAULT_FILE_STORAGE',
+                              'django.core.files.storage.FileSystemStorage')
+    if isinstance(storage_backend, str):
+        return storage_backend
+    if hasattr(storage_backend, '__name__'):
+        return storage_backend.__name__
+    if hasattr(storage_backend, '__class__'):
+        return storage_backend.__class__.__name__
+    return str(storage_backend)
+
+
+def is_cloudinary_storage():
+    if getattr(settings, 'USE_CLOUDINARY', False):
+        return True
+    return 'cloudinary' in get_storage_backend_name().lower()
+
+
+def storage_header(is_cloudinary):
+    lines = [SEPARATOR, "-- STORAGE CONFIGURATION", SEPARATOR]
+    if is_cloudinary:
+        lines.append("-- STORAGE: Cloudinary (Production)")
+        lines.append("-- Images are stored in Cloudinary cloud storage")
+        lines.append("-- Image URLs will remain accessible after restore")
+        if getattr(settings, 'CLOUDINARY_STORAGE', {}):
+            cloud_name = get_cloud_name()
+            lines.append(f"-- Cloud Name: {cloud_name}")
+            lines.append(f"-- Image URLs format: https://res.cloudinary.com/{cloud_name}/image/upload/...")
+    else:
+        lines.append("-- STORAGE: Local (Development)")
+        lines.append(f"-- Storage backend: {get_storage_backend_name()}")
+        lines.append("-- WARNING: Images are stored locally and NOT included in this backup")
+        lines.append("-- To backup images, manually copy the 'media' folder")
+    lines.append(SEPARATOR)
+    lines.append("")
+    return lines
+
+
+def cloudinary_url(image_path, cloud_name):
+    """
+    Convert a stored image path such as ``id_pictures/soy.png`` to a full
+    Cloudinary URL. Paths are kept exactly as stored (no extension is added,
+    Cloudinary picks the right one when serving), and values that are already
+    URLs are returned unchanged.
+    """
+    if not image_path or str(image_path).startswith('http'):
+        return image_path
+    clean_path = str(image_path).lstrip('/')
+    if clean_path.startswith('media/'):
+        clean_path = clean_path[len('media/'):]
+    return f"https://res.cloudinary.com/{cloud_name}/image/upload/{clean_path}"
+
+
+# ============================================
+# SCHEMA
+# ============================================
+
+@dataclass
+class Column:
+    name: str
+    type_sql: str = ''
+    not_null: bool = False
+    default: str = ''
+    # pg_attribute.attidentity: 'a' (ALWAYS), 'd' (BY DEFAULT) or ''
+    identity: str = ''
+
+    @property
+    def is_serial(self):
+        return self.default.startswith('nextval(')
+
+    @property
+    def has_sequence(self):
+        return bool(self.identity) or self.is_serial
+
+    def definition_sql(self):
+        type_sql = self.type_sql
+        if self.is_serial:
+            # The sequence is not part of the dump; a serial type recreates it
+            type_sql = {'bigint': 'BIGSERIAL', 'smallint': 'SMALLSERIAL'}.get(type_sql, 'SERIAL')
+        sql = f'"{self.name}" {type_sql}'
+        if self.not_null:
+            sql += " NOT NULL"
+        if self.identity:
+            sql += " GENERATED ALWAYS AS IDENTITY" if self.identity == 'a' else " GENERATED BY DEFAULT AS IDENTITY"
+        elif self.default and not self.is_serial:
+            sql += f" DEFAULT {self.default}"
+        return sql
+
+
+@dataclass
+class Constraint:
+    name: str
+    # pg_constraint.contype: 'p' (primary key), 'u' (unique), 'f' (foreign key)
+    kind: str
+    definition: str
+    referenced_table: str = ''
+
+
+@dataclass
+class TableSchema:
+    name: str
+    columns: list = field(default_factory=list)
+    constraints: list = field(default_factory=list)
+    # CREATE INDEX statements for indexes not backing a constraint
+    indexes: list = field(default_factory=list)
+
+    @property
+    def column_names(self):
+        return [column.name for column in self.columns]
+
+    @property
+    def parents(self):
+        return [c.referenced_table for c in self.constraints if c.kind == 'f' and c.referenced_table != self.name]
+
+    @property
+    def sequence_columns(self):
+        return [column.name for column in self.columns if column.has_sequence]
+
+
+@dataclass
+class Schema:
+    """
+    Introspected layout of the ``core_*`` tables, in dependency order (parent
+    tables before the tables referencing them). ``ddl`` is False when only
+    column names and relations are known, as with the model-based fallback.
+    """
+    tables: dict
+    ddl: bool = True
+
+    def __getitem__(self, table_name):
+        return self.tables[table_name]
+
+    @property
+    def extensions(self):
+        """Extensions the index definitions depend on"""
+        indexes = [index for table in self.tables.values() for index in table.indexes]
+        return sorted({
+            extension for opclass, extension in EXTENSION_OPCLASSES.items()
+            if any(opclass in index for index in indexes)
+        })
+
+
+# Operator classes used by index definitions -> extension providing them
+EXTENSION_OPCLASSES = {'gin_trgm_ops': 'pg_trgm'}
+
+
+# Schemas by (database alias, applied migrations); see read_schema()
+_schema_cache = {}
+
+
+def migration_state():
+    """A hashable key that changes whenever a migration is applied or unapplied"""
+    return frozenset(MigrationRecorder.Migration.objects.values_list('app', 'name'))
+
+
+def read_schema():
+    """
+    Introspect the ``core_*`` tables.
+
+    Uses the PostgreSQL catalogs when available and falls back to the Django
+    models elsewhere. The result only changes with migrations, so it is
+    cached per migration state and repeated backups skip introspection.
+    """
+    key = (connection.alias, migration_state())
+    schema = _schema_cache.get(key)
+    if schema is None:
+        schema = read_pg_schema() if connection.vendor == 'postgresql' else read_model_schema()
+        _schema_cache.clear()
+        _schema_cache[key] = schema
+    return schema
+
+
+def read_pg_schema():
+    """Read the ``core_*`` tables with one query each for columns, constraints and indexes"""
+    tables = {}
+    with connection.cursor() as cursor:
+        cursor.execute(r"""
+            SELECT c.relname,
+                   a.attname,
+                   format_type(a.atttypid, a.atttypmod),
+                   a.attnotnull,
+                   coalesce(pg_get_expr(d.adbin, d.adrelid), ''),
+                   a.attidentity
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+            LEFT JOIN pg_attrdef d ON d.adrelid = c.oid AND d.adnum = a.attnum
+            WHERE n.nspname = current_schema()
+              AND c.relkind IN ('r', 'p')
+              AND c.relname LIKE 'core\_%%'
+            ORDER BY c.relname, a.attnum;
+        """)
+        for table_name, name, type_sql, not_null, default, identity in cursor.fetchall():
+            table = tables.setdefault(table_name, TableSchema(table_name))
+            table.columns.append(Column(name, type_sql, not_null, default, identity))
+
+        cursor.execute(r"""
+            SELECT c.relname,
+                   con.conname,
+                   con.contype,
+                   pg_get_constraintdef(con.oid),
+                   coalesce(rc.relname, '')
+            FROM pg_constraint con
+            JOIN pg_class c ON c.oid = con.conrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            LEFT JOIN pg_class rc ON rc.oid = con.confrelid
+            WHERE n.nspname = current_schema()
+              AND c.relname LIKE 'core\_%%'
+              AND con.contype IN ('p', 'u', 'f')
+            ORDER BY c.relname, con.contype, con.conname;
+        """)
+        for table_name, name, kind, definition, referenced_table in cursor.fetchall():
+            if table_name in tables:
+                tables[table_name].constraints.append(Constraint(name, kind, definition, referenced_table))
+
+        cursor.execute(r"""
+            SELECT c.relname, pg_get_indexdef(i.indexrelid)
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = current_schema()
+              AND c.relname LIKE 'core\_%%'
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint con WHERE con.conindid = i.indexrelid)
+            ORDER BY c.relname, i.indexrelid;
+        """)
+        for table_name, definition in cursor.fetchall():
+            if table_name in tables:
+                tables[table_name].indexes.append(definition)
+
+    return Schema(sort_tables(tables))
+
+
+def read_model_schema():
+    """
+    Table layout of the core app taken from the Django models.
+
+    Used where the PostgreSQL catalogs are not available (SQLite). Only the
+    column names and foreign keys are known, so no DDL can be generated from
+    it, but it is enough to export the data in dependency order.
+    """
+    tables = {}
+    for model in apps.get_app_config('core').get_models(include_auto_created=True):
+        opts = model._meta
+        tables[opts.db_table] = TableSchema(
+            opts.db_table,
+            columns=[Column(f.column) for f in opts.concrete_fields],
+            constraints=[
+                Constraint('', 'f', '', f.related_model._meta.db_table)
+                for f in opts.concrete_fields if f.is_relation
+            ],
+        )
+    return Schema(sort_tables(tables), ddl=False)
+
+
+def sort_tables(tables):
+    """Topologically sort tables so parents are created (and filled) first"""
+    sorted_tables = {}
+    temp_marked = set()
+
+    def visit(table_name):
+        if table_name in sorted_tables:
+            return
+        if table_name in temp_marked:
+            raise ValueError(f"Circular dependency detected with table {table_name}")
+
+        temp_marked.add(table_name)
+        for parent in tables[table_name].parents:
+            if parent in tables:  # Only consider core_ tables
+                visit(parent)
+        temp_marked.remove(table_name)
+        sorted_tables[table_name] = tables[table_name]
+
+    for table_name in sorted(tables):
+        visit(table_name)
+    return sorted_tables
+
+
+def create_table_sql(table):
+    """DROP/CREATE TABLE statements for one table"""
+    definitions = [f"    {column.definition_sql()}" for column in table.columns]
+    definitions += [
+        f'    CONSTRAINT "{constraint.name}" {constraint.definition}'
+        for constraint in table.constraints
+    ]
+    return [
+        f"-- Table: {table.name}",
+        f"DROP TABLE IF EXISTS \"{table.name}\" CASCADE;",
+        f"CREATE TABLE \"{table.name}\" (",
+        ",\n".join(definitions),
+        ");",
+        "",
+    ]
+
+
+def finalize_schema_sql(schema):
+    """
+    Statements run after the data is loaded: indexes (cheaper to build once
+    than to maintain row by row) and sequence positions, so new rows get ids
+    after the restored ones.
+    """
+    if not schema.ddl:
+        return []
+    lines = [SEPARATOR, "-- INDEXES AND SEQUENCES", SEPARATOR, ""]
+    # Run the deferred foreign key checks now; tables with pending trigger
+    # events cannot be indexed
+    lines += ["SET CONSTRAINTS ALL IMMEDIATE;", ""]
+    for table in schema.tables.values():
+        lines += [f"{definition};" for definition in table.indexes]
+        for column in table.sequence_columns:
+            lines.append(
+                f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', '{column}'), "
+                f"coalesce(max(\"{column}\"), 1), max(\"{column}\") IS NOT NULL) FROM \"{table.name}\";"
+            )
+    lines.append("")
+    return lines
+
+
+# ============================================
+# DATA
+# ============================================
+
+def sql_literal(val):
+    if val is None:
+        return 'NULL'
+    if isinstance(val, bool):
+        return 'TRUE' if val else 'FALSE'
+    if isinstance(val, (int, float)):
+        return str(val)
+    if isinstance(val, (dt.date, dt.datetime)):
+        return f"'{val.isoformat()}'"
+    # standard_conforming_strings is on, so only single quotes need escaping
+    escaped = str(val).replace("'", "''")
+    return f"'{escaped}'"
+
+
+def iter_row_batches(table_name, columns):
+    """Yield the rows of a table in batches of BATCH_SIZE"""
+    col_list = ', '.join(f'"{col}"' for col in columns)
+    return iter_query_batches(f'SELECT {col_list} FROM "{table_name}" ORDER BY id;')
+
+
+def iter_query_batches(query, params=None):
+    """
+    Yield the rows of a query in batches of BATCH_SIZE.
+
+    Uses Django's chunked cursor, which is a named server-side cursor on
+    PostgreSQL, so only one batch is held in memory at a time.
+    """
+    cursor = connection.chunked_cursor()
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def iter_insert_statements(table_name, columns, picture_index=None, cloud_name=None):
+    """
+    Yield one multi-row INSERT per INSERT_BATCH_SIZE rows. Used by the copy
+    format where COPY is not available.
+    """
+    col_list = ', '.join(f'"{col}"' for col in columns)
+    pending = []
+    for rows in iter_row_batches(table_name, columns):
+        for row in rows:
+            if picture_index is not None and row[picture_index]:
+                row = list(row)
+                row[picture_index] = cloudinary_url(row[picture_index], cloud_name)
+            pending.append(f"({', '.join(sql_literal(val) for val in row)})")
+            if len(pending) >= INSERT_BATCH_SIZE:
+                yield f'INSERT INTO "{table_name}" ({col_list}) VALUES\n' + ',\n'.join(pending) + ';'
+                pending = []
+    if pending:
+        yield f'INSERT INTO "{table_name}" ({col_list}) VALUES\n' + ',\n'.join(pending) + ';'
+
+
+def values_sql(rows, picture_index=None, cloud_name=None):
+    values = []
+    for row in rows:
+        if picture_index is not None and row[picture_index]:
+            row = list(row)
+            row[picture_index] = cloudinary_url(row[picture_index], cloud_name)
+        values.append(f"({', '.join(sql_literal(val) for val in row)})")
+    return ',\n'.join(values)
+
+
+def upsert_sql(table_name, columns, rows, picture_index=None, cloud_name=None):
+    """Multi-row INSERT that overwrites existing rows with the same id"""
+    col_list = ', '.join(f'"{col}"' for col in columns)
+    updates = ', '.join(f'"{col}" = EXCLUDED."{col}"' for col in columns if col != 'id')
+    return (
+        f'INSERT INTO "{table_name}" ({col_list}) VALUES\n'
+        f'{values_sql(rows, picture_index, cloud_name)}\n'
+        f'ON CONFLICT ("id") DO UPDATE SET {updates};'
+    )
+
+
+def supports_copy():
+    """COPY ... TO STDOUT is streamed through psycopg 3's copy API"""
+    if connection.vendor != 'postgresql':
+        return False
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    return is_psycopg3
+
+
+def iter_copy_data(table_name, columns, cloud_name=None):
+    """
+    Yield the raw ``COPY ... TO STDOUT`` text-format output of a table.
+
+    When cloud_name is given, id_picture paths are turned into Cloudinary
+    URLs inside the COPY query, matching cloudinary_url().
+    """
+    from psycopg import sql
+
+    if cloud_name and 'id_picture' in columns:
+        picture_url = sql.SQL(
+            "CASE WHEN {col} IS NULL OR {col} = '' OR {col} LIKE 'http%%' THEN {col} "
+            "ELSE {prefix} || regexp_replace({col}, '^/*(media/)?', '') END"
+        ).format(
+            col=sql.Identifier('id_picture'),
+            prefix=sql.Literal(f"https://res.cloudinary.com/{cloud_name}/image/upload/"),
+        )
+        select_list = sql.SQL(', ').join(
+            picture_url if col == 'id_picture' else sql.Identifier(col) for col in columns
+        )
+        query = sql.SQL("COPY (SELECT {} FROM {}) TO STDOUT").format(
+            select_list, sql.Identifier(table_name)
+        )
+    else:
+        query = sql.SQL("COPY {} ({}) TO STDOUT").format(
+            sql.Identifier(table_name),
+            sql.SQL(', ').join(sql.Identifier(col) for col in columns),
+        )
+
+    with connection.cursor() as cursor:
+        with cursor.cursor.copy(query) as copy:
+            for data in copy:
+                yield bytes(data)
+
+
+def image_summary_sql():
+    lines = [SEPARATOR, "-- IMAGE METADATA SUMMARY", SEPARATOR, ""]
+    cloud_name = get_cloud_name()
+    with connection.cursor() as cursor:
+        cursor.execute("""
+                       SELECT COUNT(*)                     as total_students,
+                              COUNT(id_picture)            as students_with_pictures,
+                              COUNT(*) - COUNT(id_picture) as students_without_pictures
+                       FROM core_studentprofile
+                       """)
+        counts = cursor.fetchone()
+        if counts:
+            total, with_pics, without_pics = counts
+            lines.append(f"-- Total students: {total}")
+            lines.append(f"-- Students with ID pictures: {with_pics}")
+            lines.append(f"-- Students without ID pictures: {without_pics}")
+            lines.append("")
+
+        lines.append("-- All images are stored in Cloudinary at:")
+        if cloud_name:
+            lines.append(f"-- https://res.cloudinary.com/{cloud_name}/image/upload/")
+        lines.append("")
+
+        # A few sample image URLs to show the format
+        cursor.execute("""
+                       SELECT id, first_name, last_name, id_picture
+                       FROM core_studentprofile
+                       WHERE id_picture IS NOT NULL
+                       LIMIT 3
+                       """)
+        sample_images = cursor.fetchall()
+
+    if sample_images:
+        lines.append("-- Sample image URLs (as stored in database):")
+        for student_id, first_name, last_name, image_url in sample_images:
+            if image_url:
+                display_url = image_url if len(image_url) <= 80 else image_url[:77] + "..."
+                lines.append(f"-- Student {student_id}: {first_name} {last_name}")
+                lines.append(f"--   URL: {display_url}")
+        lines.append("")
+    return lines
+
+
+def backup_preamble(schema, is_cloudinary, data_description, manifest=None):
+    """Header comments, BEGIN and the schema section shared by both formats"""
+    yield "-- NUPS Database Complete Backup"
+    yield f"-- Generated: {dt.datetime.now().isoformat()}"
+    yield f"-- Database: {connection.display_name}"
+    if manifest is not None:
+        yield f"-- Manifest: {manifest.pk}"
+        yield f"-- Watermark: {manifest.watermark.isoformat()}"
+    yield from storage_header(is_cloudinary)
+
+    if schema.ddl:
+        yield f"-- This backup includes schema (CREATE TABLE) and data ({data_description})"
+    else:
+        yield f"-- This backup includes data only ({data_description})"
+        yield "-- Create the schema with 'python manage.py migrate' before restoring"
+    yield "-- Restore using: psql -d database_name < backup.sql"
+    yield ""
+    yield "BEGIN;"
+    yield ""
+
+    if schema.ddl:
+        yield SEPARATOR
+        yield "-- SCHEMA: Table Definitions"
+        yield SEPARATOR
+        yield ""
+        for extension in schema.extensions:
+            yield f"CREATE EXTENSION IF NOT EXISTS {extension};"
+        if schema.extensions:
+            yield ""
+        for table in schema.tables.values():
+            yield from create_table_sql(table)
+
+
+def picture_column_index(table_name, columns, is_cloudinary):
+    """Index of the id_picture column when its paths should become Cloudinary URLs"""
+    if table_name != 'core_studentprofile' or not is_cloudinary or not get_cloud_name():
+        return None
+    if 'id_picture' not in columns:
+        logger.warning("id_picture column not found in %s", table_name)
+        return None
+    return columns.index('id_picture')
+
+
+def generate_sql_backup(schema, is_cloudinary, manifest=None):
+    """Yield the lines of a complete schema + data SQL backup"""
+    yield from backup_preamble(schema, is_cloudinary, "INSERT", manifest)
+
+    yield SEPARATOR
+    yield "-- DATA: Insert Statements"
+    yield SEPARATOR
+    yield ""
+
+    cloud_name = get_cloud_name()
+    for table_name, table in schema.tables.items():
+        columns = table.column_names
+        col_list = ', '.join(f'"{col}"' for col in columns)
+
+        # Convert relative image paths to full Cloudinary URLs
+        picture_index = picture_column_index(table_name, columns, is_cloudinary)
+
+        count = 0
+        for rows in iter_row_batches(table_name, columns):
+            if count == 0:
+                yield f"-- Data for {table_name}"
+                yield ""
+            for row in rows:
+                if picture_index is not None and row[picture_index]:
+                    row = list(row)
+                    row[picture_index] = cloudinary_url(row[picture_index], cloud_name)
+                values = ', '.join(sql_literal(val) for val in row)
+                yield f'INSERT INTO "{table_name}" ({col_list}) VALUES ({values});'
+            count += len(rows)
+        if count:
+            yield f"-- {count} records"
+            yield ""
+
+    yield from finalize_schema_sql(schema)
+
+    if is_cloudinary:
+        yield from image_summary_sql()
+
+    yield "COMMIT;"
+
+
+def generate_copy_backup(schema, is_cloudinary, manifest=None):
+    """
+    Yield a schema + data backup whose data is written with COPY.
+
+    Text parts are yielded as str and COPY payloads as bytes; encode_chunks()
+    turns everything into bytes for the response.
+    """
+    use_copy = supports_copy()
+    data_description = "COPY" if use_copy else "multi-row INSERT"
+    yield from iter_chunks(backup_preamble(schema, is_cloudinary, data_description, manifest))
+    yield from iter_chunks([SEPARATOR, f"-- DATA: {data_description}", SEPARATOR, ""])
+
+    cloud_name = get_cloud_name() if is_cloudinary else None
+    for table_name, table in schema.tables.items():
+        columns = table.column_names
+        col_list = ', '.join(f'"{col}"' for col in columns)
+        picture_index = picture_column_index(table_name, columns, is_cloudinary)
+
+        yield f"-- Data for {table_name}\n"
+        if use_copy:
+            yield f'COPY "{table_name}" ({col_list}) FROM stdin;\n'
+            yield from iter_copy_data(table_name, columns, cloud_name if picture_index is not None else None)
+            yield "\\.\n\n"
+        else:
+            yield from iter_chunks(iter_insert_statements(table_name, columns, picture_index, cloud_name))
+            yield "\n"
+
+    yield from iter_chunks(finalize_schema_sql(schema))
+    if is_cloudinary:
+        yield from iter_chunks(image_summary_sql())
+    yield "COMMIT;\n"
+
+
+# ============================================
+# STREAMING
+# ============================================
+
+def generate_incremental_backup(schema, since, manifest, is_cloudinary):
+    """
+    Yield the lines of an incremental backup.
+
+    Exports the students whose row or emergency contact changed after
+    ``since`` (less WATERMARK_OVERLAP) as upserts. Their emergency contacts
+    and wing memberships are deleted and re-inserted, so removals are carried
+    over too. The small lookup tables are always exported in full. Deleted
+    students are not tracked; a periodic full backup remains the baseline.
+    A student whose e-mail now belongs to an exported row under another id
+    (deleted, then registered again) is removed, so the upsert does not
+    fail on the unique e-mail.
+    """
+    from .models import EmergencyContact, Hall, Program, StudentProfile, Wing
+
+    yield "-- NUPS Database Incremental Backup"
+    yield f"-- Generated: {dt.datetime.now().isoformat()}"
+    yield f"-- Database: {connection.display_name}"
+    yield f"-- Changes since: {since.isoformat()}"
+    yield f"-- Manifest: {manifest.pk}"
+    yield f"-- Watermark: {manifest.watermark.isoformat()}"
+    yield "-- Apply on top of a full backup, then later incrementals in order:"
+    yield "--   psql -d database_name < backup.sql"
+    yield "-- Deleted students are not included; take a full backup periodically."
+    yield ""
+    yield "BEGIN;"
+    yield ""
+
+    def columns_of(model):
+        return schema[model._meta.db_table].column_names
+
+    for model in (Program, Hall, Wing):
+        table_name = model._meta.db_table
+        columns = columns_of(model)
+        yield f"-- Data for {table_name}"
+        for rows in iter_row_batches(table_name, columns):
+            yield upsert_sql(table_name, columns, rows)
+        yield ""
+
+    cloud_name = get_cloud_name()
+    student_table = StudentProfile._meta.db_table
+    student_columns = columns_of(StudentProfile)
+    picture_index = picture_column_index(student_table, student_columns, is_cloudinary)
+    id_index = student_columns.index('id')
+    email_index = student_columns.index('email')
+
+    contact_table = EmergencyContact._meta.db_table
+    contact_columns = columns_of(EmergencyContact)
+    wings_through = StudentProfile.wings.through
+    wings_table = wings_through._meta.db_table
+    wings_columns = columns_of(wings_through)
+    wings_student_column = StudentProfile.wings.field.m2m_column_name()
+
+    changed_after = since - WATERMARK_OVERLAP
+    col_list = ', '.join(f'"{col}"' for col in student_columns)
+    query = (
+        f'SELECT {col_list} FROM "{student_table}" '
+        f'WHERE "updated_at" > %s '
+        f'OR "id" IN (SELECT "student_id" FROM "{contact_table}" WHERE "updated_at" > %s) '
+        f'ORDER BY "id";'
+    )
+
+    yield f"-- Data for {student_table} and dependent rows"
+    count = 0
+    for rows in iter_query_batches(query, [changed_after, changed_after]):
+        student_ids = [row[id_index] for row in rows]
+        id_list = ', '.join(str(pk) for pk in student_ids)
+
+        # A row holding one of these e-mails under another id was deleted
+        # (or gave up the e-mail) since; drop it before the upsert trips
+        # over the unique e-mail
+        pairs = ', '.join(f'({row[id_index]}, {sql_literal(row[email_index])})' for row in rows)
+        stale = (
+            f'SELECT s."id" FROM "{student_table}" s '
+            f'JOIN (VALUES {pairs}) AS incoming ("id", "email") '
+            f'ON s."email" = incoming."email" AND s."id" <> incoming."id"'
+        )
+        yield f'DELETE FROM "{wings_table}" WHERE "{wings_student_column}" IN ({stale});'
+        yield f'DELETE FROM "{contact_table}" WHERE "student_id" IN ({stale});'
+        yield f'DELETE FROM "{student_table}" WHERE "id" IN ({stale});'
+
+        yield upsert_sql(student_table, student_columns, rows, picture_index, cloud_name)
+        yield f'DELETE FROM "{wings_table}" WHERE "{wings_student_column}" IN ({id_list});'
+        yield f'DELETE FROM "{contact_table}" WHERE "student_id" IN ({id_list});'
+
+        for table_name, columns, student_column in (
+            (contact_table, contact_columns, 'student_id'),
+            (wings_table, wings_columns, wings_student_column),
+        ):
+            dependent_col_list = ', '.join(f'"{col}"' for col in columns)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT {dependent_col_list} FROM "{table_name}" '
+                    f'WHERE "{student_column}" IN ({id_list}) ORDER BY "id";'
+                )
+                dependent_rows = cursor.fetchall()
+            if dependent_rows:
+                yield upsert_sql(table_name, columns, dependent_rows)
+        count += len(rows)
+    yield f"-- {count} changed students"
+    yield ""
+    yield "COMMIT;"
+
+
+def iter_chunks(lines, chunk_size=CHUNK_SIZE):
+    """Join lines into chunks of roughly chunk_size characters"""
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line) + 1
+        if size >= chunk_size:
+            yield '\n'.join(buffer) + '\n'
+            buffer = []
+            size = 0
+    if buffer:
+        yield '\n'.join(buffer) + '\n'
+
+
+def guard_stream(chunks, filename, manifest=None):
+    """
+    Log failures that happen mid-stream. The status line has already been
+    sent by then, so end the file with a ROLLBACK that stops a restore from
+    committing a partial dump. The manifest is marked complete only once the
+    last chunk has gone out.
+    """
+    try:
+        yield from chunks
+    except Exception as e:
+        logger.error("Backup %s failed while streaming: %s", filename, e, exc_info=True)
+        yield f"\n-- BACKUP FAILED: {e}\nROLLBACK;\n"
+    else:
+        if manifest is not None:
+            manifest.completed_at = timezone.now()
+            manifest.save(update_fields=['completed_at'])
+        logger.info("Database backup streamed: %s", filename)
+
+
+def encode_chunks(chunks):
+    for chunk in chunks:
+        yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+def compress_chunks(chunks, compression):
+    """Compress a stream of bytes chunks with gzip or zstd as they are produced"""
+    if compression == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        flush = compressor.flush
+    elif compression == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        flush = compressor.flush
+    else:
+        yield from chunks
+        return
+
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield flush()
+
+
+def check_options(backup_format, compression):
+    """Return an error message for unsupported format/compression options"""
+    if backup_format not in FORMATS:
+        return f"Unknown format '{backup_format}'. Use one of: {', '.join(FORMATS)}."
+    if compression not in COMPRESSIONS:
+        return f"Unknown compression '{compression}'. Use one of: {', '.join(COMPRESSIONS)}."
+    if compression == 'zstd' and zstandard is None:
+        return "zstd compression requires the 'zstandard' package."
+    return None
+
+
+def parse_since(since_param, manifest_param):
+    """
+    Resolve the starting point of an incremental backup from either an ISO
+    timestamp or a previous backup's manifest ID.
+
+    Returns (since, error message).
+    """
+    from .models import BackupManifest
+
+    if manifest_param:
+        try:
+            manifest = BackupManifest.objects.get(pk=manifest_param)
+        except (BackupManifest.DoesNotExist, ValidationError, ValueError):
+            return None, f"Unknown backup manifest '{manifest_param}'."
+        # A backup that failed or was cut off part way did not hold every row
+        # up to its watermark
+        if manifest.completed_at is None:
+            return None, f"Backup manifest '{manifest_param}' is from a backup that did not complete."
+        return manifest.watermark, None
+
+    try:
+        since = parse_datetime(since_param)
+        if since is None:
+            date = parse_date(since_param)
+            since = dt.datetime.combine(date, dt.time.min) if date else None
+    except ValueError:
+        since = None
+    if since is None:
+        return None, "'since' must be an ISO 8601 date or datetime."
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, dt.timezone.utc)
+    return since, None
+
+
+def backup_filename(timestamp, compression, incremental=False):
+    kind = "_incremental" if incremental else ""
+    return f"nups_backup{kind}_{timestamp}.sql{COMPRESSIONS[compression][0]}"
+
+
+class SQLBackupRenderer(JSONRenderer):
+    """
+    DRF reads ?format= to pick a renderer. These renderers let ?format=sql and
+    ?format=copy reach the backup view; error responses still render as JSON.
+    """
+    format = 'sql'
+
+
+class CopyBackupRenderer(JSONRenderer):
+    format = 'copy'
+
+
+async def aiter_sync(iterator):
+    """
+    Consume a sync iterator one item at a time from async code.
+
+    Django's ASGI handler would otherwise read a sync streaming iterator into
+    a list before sending it. thread_sensitive keeps every step on the thread
+    (and so the database connection) that ran the view.
+    """
+    sentinel = object()
+    next_item = sync_to_async(next, thread_sensitive=True)
+    while True:
+        item = await next_item(iterator, sentinel)
+        if item is sentinel:
+            break
+        yield item
+
+
+def streaming_backup_response(request, chunks, filename, compression='none', manifest=None):
+    chunks = compress_chunks(encode_chunks(guard_stream(chunks, filename, manifest)), compression)
+    content_type = COMPRESSIONS[compression][1]
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = aiter_sync(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if manifest is not None:
+        response['X-Backup-Manifest'] = str(manifest.pk)
+        response['X-Backup-Watermark'] = manifest.watermark.isoformat()
+    return response
@@ -0,0 +1,379 @@
+"""
+Benchmarks of the core API endpoints.
+
+run() seeds students (see seeding.py) up to each dataset size and times
+requests made through the test client, in process: the numbers cover URL
+routing, middleware, views, serialization and the database, not a network
+or an ASGI server, and a staff user is authenticated without a token.
+Requests are made one after the other, so throughput is that of a single
+client (requests per second of wall time).
+
+Each endpoint is run a few times as warm-up, then ``iterations`` times
+(scaled down for the slow ones, see ENDPOINTS). The result for one endpoint
+and size holds the latency percentiles, the throughput and the number of
+queries of one request, which unlike timings does not vary between runs.
+
+With ``concurrency``, run() instead sends GET requests that many at a time
+straight to the ASGI application (with the liveness probe in front, as in
+nups/asgi.py), as uvicorn would, from one event loop.
+The results then show how a worker copes with concurrent clients: the
+throughput is requests per second of wall time, latencies include the time
+spent waiting for the worker, and ``threads`` is the most threads alive at
+once. Requests are authenticated with a JWT.
+
+compare() checks results against a baseline run and reports the endpoints
+that got slower by more than a threshold or run more queries.
+"""
+import asyncio
+import platform
+import random
+import statistics
+import threading
+import time
+from itertools import count
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.db import connection
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import seeding
+from .metrics import QueryCounter
+from .models import Hall, Program, StudentProfile, Wing
+from .probes import LivenessProbe
+
+SIZES = (100, 1000, 10000)
+ITERATIONS = 100
+WARMUP = 3
+# Percentage change beyond which compare() reports a regression
+THRESHOLD = 20
+# Latency changes smaller than this many milliseconds are noise
+MIN_DIFFERENCE_MS = 1.0
+# Distinct placeholder pictures seeded with ``pictures``
+PICTURES = 20
+# Compared with the baseline, in this order
+COMPARED = ('p50_ms', 'p95_ms', 'queries')
+
+USERNAME = 'benchmark'
+
+
+class Benchmark:
+    """What the endpoint functions need: a client and the data to ask for"""
+
+    def __init__(self, client, seed=0):
+        self.client = client
+        self.rng = random.Random(seed)
+        self.numbers = count()
+        self.program_id = Program.objects.values_list('id', flat=True).first()
+        self.hall_id = Hall.objects.values_list('id', flat=True).first()
+        self.wing_id = Wing.objects.values_list('id', flat=True).first()
+        self.student_ids = list(StudentProfile.objects.values_list('id', flat=True))
+        self.created = []
+
+    def registration(self):
+        number = next(self.numbers)
+        return {
+            'first_name': 'Bench', 'last_name': 'Mark', 'date_of_birth': '2001-02-03',
+            'gender': 'Female', 'marital_status': 'Single', 'contact': '0240000000',
+            'email': f'benchmark.{number}@{seeding.EMAIL_DOMAIN}', 'place_of_residence': 'Kumasi',
+            'program_id': self.program_id, 'hall_id': self.hall_id, 'wing_ids': [self.wing_id],
+            'emergency_contact_data': {'name': 'Parent', 'phone': '0200000000'},
+        }
+
+    def cleanup(self):
+        """Remove the students created by the create endpoint"""
+        StudentProfile.objects.filter(pk__in=self.created).delete()
+        self.created = []
+
+
+def read(response):
+    """Consume a response (streamed ones included) and check its status"""
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request['PATH_INFO']} returned {response.status_code}")
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def bench_list(bench):
+    return read(bench.client.get('/api/students/'))
+
+
+def bench_list_page(bench):
+    return read(bench.client.get('/api/students/?page_size=50'))
+
+
+def bench_search(bench):
+    return read(bench.client.get('/api/students/?page_size=50&q=mensah'))
+
+
+def bench_retrieve(bench):
+    return read(bench.client.get(f'/api/students/{bench.rng.choice(bench.student_ids)}/'))
+
+
+def bench_create(bench):
+    response = read(bench.client.post('/api/students/', bench.registration(), format='json'))
+    bench.created.append(response.data['id'])
+    return response
+
+
+def bench_programs(bench):
+    return read(bench.client.get('/api/programs/'))
+
+
+def bench_halls(bench):
+    return read(bench.client.get('/api/halls/'))
+
+
+def bench_wings(bench):
+    return read(bench.client.get('/api/wings/'))
+
+
+def bench_form_bootstrap(bench):
+    return read(bench.client.get('/api/form-bootstrap/'))
+
+
+def bench_backup(bench):
+    return read(bench.client.get('/api/backup/'))
+
+
+# name: (function, share of the iterations); the unpaginated list and the
+# backup read every student, so fewer runs of them are enough
+ENDPOINTS = {
+    'list': (bench_list, 0.1),
+    'list_page': (bench_list_page, 1),
+    'search': (bench_search, 1),
+    'retrieve': (bench_retrieve, 1),
+    'create': (bench_create, 1),
+    'programs': (bench_programs, 1),
+    'halls': (bench_halls, 1),
+    'wings': (bench_wings, 1),
+    'form_bootstrap': (bench_form_bootstrap, 1),
+    'backup': (bench_backup, 0.05),
+}
+
+# name: function returning the path to GET, for the concurrent benchmarks
+CONCURRENT_ENDPOINTS = {
+    'list_page': lambda bench: '/api/students/?page_size=50',
+    'search': lambda bench: '/api/students/?page_size=50&q=mensah',
+    'retrieve': lambda bench: f'/api/students/{bench.rng.choice(bench.student_ids)}/',
+    'programs': lambda bench: '/api/programs/',
+    'halls': lambda bench: '/api/halls/',
+    'wings': lambda bench: '/api/wings/',
+    'form_bootstrap': lambda bench: '/api/form-bootstrap/',
+    'user_info': lambda bench: '/api/user-info/',
+    'health': lambda bench: '/api/health/',
+    'ready': lambda bench: '/ready/',
+}
+
+
+def percentile(sorted_values, fraction):
+    """Linear interpolation between the closest ranks"""
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(durations):
+    """Latency and throughput figures of a list of request durations in seconds"""
+    ordered = sorted(durations)
+    total = sum(ordered)
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        'requests': len(ordered),
+        'throughput': round(len(ordered) / total, 2) if total else None,
+        'mean_ms': ms(statistics.fmean(ordered)),
+        'p50_ms': ms(percentile(ordered, 0.50)),
+        'p95_ms': ms(percentile(ordered, 0.95)),
+        'p99_ms': ms(percentile(ordered, 0.99)),
+        'max_ms': ms(ordered[-1]),
+    }
+
+
+def run_endpoint(bench, function, iterations, warmup=WARMUP):
+    for _ in range(warmup):
+        function(bench)
+    queries = QueryCounter()
+    with connection.execute_wrapper(queries):
+        function(bench)
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function(bench)
+        durations.append(time.perf_counter() - start)
+    return dict(summarize(durations), queries=queries.count)
+
+
+async def asgi_get(application, path, headers=()):
+    """GET path from an ASGI application the way a server would; return the status"""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+        'root_path': '', 'headers': [(b'host', b'testserver'), *headers],
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+    finished = asyncio.Event()
+    requested = False
+    status = None
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body' and not message.get('more_body'):
+            finished.set()
+
+    await application(scope, receive, send)
+    if status is None or status >= 400:
+        raise RuntimeError(f"{path} returned {status}")
+    return status
+
+
+async def run_concurrent(application, bench, path, requests, concurrency, headers, warmup=WARMUP):
+    """Send ``requests`` GETs to path(bench), ``concurrency`` at a time"""
+    for _ in range(warmup):
+        await asgi_get(application, path(bench), headers)
+    numbers = iter(range(requests))
+    durations = []
+    threads = threading.active_count()
+
+    async def client():
+        nonlocal threads
+        for _ in numbers:
+            start = time.perf_counter()
+            await asgi_get(application, path(bench), headers)
+            durations.append(time.perf_counter() - start)
+            threads = max(threads, threading.active_count())
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return dict(summarize(durations), throughput=round(requests / elapsed, 2), threads=threads)
+
+
+def benchmark_client():
+    user, _ = get_user_model().objects.get_or_create(username=USERNAME, defaults={'is_staff': True})
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def database_version():
+    if connection.vendor == 'postgresql':
+        connection.ensure_connection()
+        return str(connection.pg_version)
+    return getattr(connection.Database, 'sqlite_version', None)
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.display_name,
+        'database_version': database_version(),
+        'platform': platform.platform(),
+        'started_at': timezone.now().isoformat(),
+    }
+
+
+def run(sizes=SIZES, endpoints=None, iterations=ITERATIONS, pictures=False, seed=0, concurrency=None, log=None):
+    """
+    Seed up to each size in turn (smallest first) and benchmark the
+    endpoints, ``concurrency`` requests at a time if given. Works on the
+    current database; returns the report dict.
+    """
+    endpoints = list(endpoints or (CONCURRENT_ENDPOINTS if concurrency else ENDPOINTS))
+    client = benchmark_client()
+    if concurrency:
+        application = LivenessProbe(get_asgi_application(), settings.LIVENESS_PATHS)
+        token = AccessToken.for_user(get_user_model().objects.get(username=USERNAME))
+        headers = [(b'authorization', f'Bearer {token}'.encode())]
+    results = []
+    for size in sorted(sizes):
+        missing = size - seeding.seeded_count()
+        if missing > 0:
+            started = time.perf_counter()
+            seeding.seed_students(missing, pictures=PICTURES if pictures else 0)
+            if log:
+                log(f'Seeded {missing} students in {time.perf_counter() - started:.1f}s (total {size})')
+        bench = Benchmark(client, seed)
+        for name in endpoints:
+            if concurrency:
+                result = asyncio.run(run_concurrent(
+                    application, bench, CONCURRENT_ENDPOINTS[name], max(iterations, concurrency), concurrency, headers,
+                ))
+            else:
+                function, share = ENDPOINTS[name]
+                result = run_endpoint(bench, function, max(3, round(iterations * share)))
+                bench.cleanup()
+            results.append(dict(result, size=size, endpoint=name))
+            if log:
+                log(format_result(results[-1]))
+    return {
+        'environment': environment(),
+        'options': {
+            'sizes': sorted(sizes), 'iterations': iterations, 'pictures': pictures, 'seed': seed,
+            'concurrency': concurrency,
+        },
+        'results': results,
+    }
+
+
+def format_result(result):
+    line = (
+        f"{result['size']:>7} {result['endpoint']:<15} {result['throughput']:>9.1f}/s "
+        f"p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+        f"p99 {result['p99_ms']:>9.2f}ms"
+    )
+    if 'queries' in result:
+        line += f"  {result['queries']:>3} queries"
+    if 'threads' in result:
+        line += f"  {result['threads']:>3} threads"
+    return line
+
+
+def compare(report, baseline, threshold=THRESHOLD, min_difference_ms=MIN_DIFFERENCE_MS):
+    """
+    Regressions of report against baseline, as a list of dicts with the
+    size, endpoint, metric, both values and the change in percent. Results
+    missing from either run are ignored.
+    """
+    previous = {(result['size'], result['endpoint']): result for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        before = previous.get((result['size'], result['endpoint']))
+        if before is None:
+            continue
+        for metric in COMPARED:
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None or new <= old:
+                continue
+            if metric == 'queries':
+                slower = True
+            else:
+                slower = new - old >= min_difference_ms and new > old * (1 + threshold / 100)
+            if slower:
+                regressions.append({
+                    'size': result['size'],
+                    'endpoint': result['endpoint'],
+                    'metric': metric,
+                    'baseline': old,
+                    'current': new,
+                    'change': round((new - old) / old * 100, 1) if old else None,
+                })
+    return regressions
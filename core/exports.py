@@ -0,0 +1,191 @@
+"""
+Streaming export of the member list as CSV, NDJSON or XLSX.
+
+Students are read with ``queryset.iterator(chunk_size=...)``: relations are
+joined in and the wings are prefetched one chunk at a time, so memory use
+stays flat however many students are exported. CSV and NDJSON are streamed
+as they are produced. An XLSX file is a zip archive that cannot be sent
+before it is complete, so it is built with openpyxl's write-only workbook
+(rows go to a temporary file, not memory) and then streamed from disk.
+
+Values come from public registrations, so none is exported as a live
+spreadsheet formula: in CSV they get a leading quote, in XLSX they are
+explicit string cells.
+"""
+import csv
+import json
+import tempfile
+
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .backup import aiter_sync
+from .serializers import resolve_image_url
+
+try:
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+except ImportError:  # XLSX export is unavailable without it
+    openpyxl = None
+
+# Students fetched (and wings prefetched) per database round trip
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+# format: (content type, file extension)
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+# A cell starting with one of these is read as a formula by spreadsheet apps
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+COLUMNS = [
+    'id', 'first_name', 'last_name', 'other_name', 'date_of_birth', 'gender', 'marital_status',
+    'contact', 'email', 'place_of_residence', 'program', 'hall', 'wings',
+    'emergency_contact_name', 'emergency_contact_phone', 'id_picture', 'created_at',
+]
+
+
+def export_rows(queryset):
+    """Yield one dict per student, in COLUMNS order"""
+    for student in queryset.iterator(chunk_size=CHUNK_SIZE):
+        contact = getattr(student, 'emergency_contact', None)
+        yield {
+            'id': student.id,
+            'first_name': student.first_name,
+            'last_name': student.last_name,
+            'other_name': student.other_name or '',
+            'date_of_birth': student.date_of_birth,
+            'gender': student.gender,
+            'marital_status': student.marital_status,
+            'contact': student.contact,
+            'email': student.email,
+            'place_of_residence': student.place_of_residence,
+            'program': student.program.name if student.program else '',
+            'hall': student.hall_of_affiliation.name if student.hall_of_affiliation else '',
+            'wings': [wing.name for wing in student.wings.all()],
+            'emergency_contact_name': contact.name if contact else '',
+            'emergency_contact_phone': contact.phone if contact else '',
+            'id_picture': resolve_image_url(student.id_picture) or '',
+            'created_at': student.created_at,
+        }
+
+
+def buffered(pieces, size=BUFFER_SIZE):
+    """Join small strings into chunks of roughly size characters"""
+    buffer = []
+    length = 0
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+class LineWriter:
+    """File-like object whose write() returns the line for csv.writer to hand back"""
+
+    def write(self, value):
+        return value
+
+
+def is_formula(value):
+    return isinstance(value, str) and value.startswith(FORMULA_PREFIXES)
+
+
+def csv_value(value):
+    """Quote-prefix values a spreadsheet would run as a formula (they come from public registrations)"""
+    return "'" + value if is_formula(value) else value
+
+
+def iter_csv(rows):
+    writer = csv.writer(LineWriter())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        row['wings'] = '; '.join(row['wings'])
+        yield writer.writerow([csv_value(value) for value in row.values()])
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def xlsx_value(sheet, value):
+    """
+    Drop the control characters XML cannot hold (registrations accept them);
+    openpyxl would raise on them part way through the export. Values that
+    look like formulas are written as explicit string cells, which are
+    never evaluated, and keep their text.
+    """
+    if not isinstance(value, str):
+        return value
+    value = ILLEGAL_CHARACTERS_RE.sub('', value)
+    if is_formula(value):
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.data_type = 's'
+        return cell
+    return value
+
+
+def iter_xlsx(rows):
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Members')
+    sheet.append(COLUMNS)
+    for row in rows:
+        row['wings'] = '; '.join(row['wings'])
+        # Excel has no time zones
+        row['created_at'] = timezone.localtime(row['created_at']).replace(tzinfo=None)
+        sheet.append([xlsx_value(sheet, value) for value in row.values()])
+    with tempfile.TemporaryFile() as f:
+        workbook.save(f)
+        f.seek(0)
+        while chunk := f.read(BUFFER_SIZE):
+            yield chunk
+
+
+def iter_export(queryset, export_format):
+    rows = export_rows(queryset)
+    if export_format == 'xlsx':
+        return iter_xlsx(rows)
+    if export_format == 'ndjson':
+        return buffered(iter_ndjson(rows))
+    return buffered(iter_csv(rows))
+
+
+def export_filename(export_format):
+    timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+    return f"nups_members_{timestamp}.{FORMATS[export_format][1]}"
+
+
+def streaming_export_response(request, queryset, export_format):
+    chunks = iter_export(queryset, export_format)
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = aiter_sync(chunks)
+    response = StreamingHttpResponse(chunks, content_type=FORMATS[export_format][0])
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(export_format)}"'
+    return response
+
+
+class CSVExportRenderer(JSONRenderer):
+    """Lets ?format=csv reach the export action; see backup.SQLBackupRenderer"""
+    format = 'csv'
+
+
+class NDJSONExportRenderer(JSONRenderer):
+    format = 'ndjson'
+
+
+class XLSXExportRenderer(JSONRenderer):
+    format = 'xlsx'
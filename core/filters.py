@@ -0,0 +1,133 @@
+from asgiref.sync import sync_to_async
+from django.db.models import Count
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend
+
+from . import search
+from .models import StudentProfile
+
+
+class StudentFilterBackend(BaseFilterBackend):
+    """
+    Filter students by query parameters used on the admin member list:
+
+    - ?gender=Male|Female
+    - ?hall=<hall id>
+    - ?program=<program id>
+    - ?wing=<wing id>
+    - ?q=<text> - free-text search over names, e-mail, contact and residence
+
+    Every filter is an equality match on an indexed column (the gender index,
+    the hall/program foreign keys or the wings through table). The search
+    uses the GIN indexes described in search.py, and ranks the results.
+    """
+    search_param = 'q'
+
+    # query parameter -> ORM lookup
+    lookups = {
+        'gender': 'gender',
+        'hall': 'hall_of_affiliation_id',
+        'program': 'program_id',
+        'wing': 'wings__id',
+    }
+
+    def get_filters(self, request, exclude=None):
+        filters = {}
+        errors = {}
+        for param, lookup in self.lookups.items():
+            if param == exclude:
+                continue
+            value = request.query_params.get(param)
+            if value in (None, ''):
+                continue
+            if param == 'gender':
+                valid = dict(StudentProfile.GENDER_CHOICES)
+                if value not in valid:
+                    errors[param] = f"Must be one of: {', '.join(valid)}."
+                    continue
+            else:
+                try:
+                    value = int(value)
+                except ValueError:
+                    errors[param] = 'A valid integer is required.'
+                    continue
+            filters[lookup] = value
+        if errors:
+            raise serializers.ValidationError(errors)
+        return filters
+
+    def get_search(self, request):
+        return request.query_params.get(self.search_param, '').strip()
+
+    def filter_queryset(self, request, queryset, view, exclude=None, ranked=True):
+        filters = self.get_filters(request, exclude=exclude)
+        if filters:
+            queryset = queryset.filter(**filters)
+        q = self.get_search(request)
+        if q:
+            queryset = search.search_students(queryset, q, ranked=ranked)
+        return queryset
+
+    async def afilter_queryset(self, request, queryset, view):
+        """filter_queryset() for async views; a search may query the database (see search.py)"""
+        if self.get_search(request):
+            return await sync_to_async(self.filter_queryset)(request, queryset, view)
+        return self.filter_queryset(request, queryset, view)
+
+    def get_facets(self, request, queryset):
+        """
+        Count students per value of each filter dimension, in SQL.
+
+        Each dimension is counted with every other active filter applied but
+        not its own, so a dropdown keeps listing its alternatives after one of
+        them has been picked.
+        """
+        def grouped(dimension, *fields):
+            rows = (
+                self.filter_queryset(request, queryset, None, exclude=dimension, ranked=False)
+                .order_by()
+                .exclude(**{f"{fields[0]}__isnull": True})
+                .values(*fields)
+                .annotate(count=Count('id'))
+                .order_by(fields[-1])
+            )
+            return list(rows)
+
+        return {
+            'total': self.filter_queryset(request, queryset, None, ranked=False).order_by().count(),
+            'gender': [
+                {'value': row['gender'], 'count': row['count']}
+                for row in grouped('gender', 'gender')
+            ],
+            'hall': [
+                {'id': row['hall_of_affiliation_id'], 'name': row['hall_of_affiliation__name'], 'count': row['count']}
+                for row in grouped('hall', 'hall_of_affiliation_id', 'hall_of_affiliation__name')
+            ],
+            'program': [
+                {'id': row['program_id'], 'name': row['program__name'], 'count': row['count']}
+                for row in grouped('program', 'program_id', 'program__name')
+            ],
+            'wing': [
+                {'id': row['wings__id'], 'name': row['wings__name'], 'count': row['count']}
+                for row in grouped('wing', 'wings__id', 'wings__name')
+            ],
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': param,
+                'required': False,
+                'in': 'query',
+                'schema': {'type': 'string' if param == 'gender' else 'integer'},
+            }
+            for param in self.lookups
+        ] + [
+            {
+                'name': self.search_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Search names, e-mail, contact and place of residence.',
+                'schema': {'type': 'string'},
+            },
+        ]
@@ -0,0 +1,85 @@
+"""
+Normalization and resizing of uploaded ID pictures.
+
+Every picture is turned into three JPEG renditions before it is stored:
+
+- ``id_picture``: the picture itself, upright and with a capped resolution
+- ``id_picture_medium``: the student detail view
+- ``id_picture_thumbnail``: the admin member list
+
+Decoding and resampling are CPU bound, so render_picture() runs in a process
+pool rather than on the upload threads (see uploads.py).
+"""
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+# Longest side in pixels for each rendition, by field name
+RENDITIONS = {
+    'id_picture': 1600,
+    'id_picture_medium': 600,
+    'id_picture_thumbnail': 160,
+}
+JPEG_QUALITY = 85
+
+
+def encode_jpeg(image, max_size):
+    image = image.copy()
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def render_picture(path):
+    """
+    Read the picture at ``path`` and return ``{field name: JPEG bytes}``.
+
+    The EXIF orientation is applied to the pixels (phone cameras store most
+    photos rotated), the remaining metadata is dropped and transparency is
+    flattened onto white.
+    """
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        return {field: encode_jpeg(image, max_size) for field, max_size in RENDITIONS.items()}
+
+
+def rendition_name(name):
+    """File name of a rendition of the upload ``name``"""
+    return f"{os.path.splitext(os.path.basename(name))[0]}.jpg"
+
+
+_process_pool = None
+_process_pool_lock = Lock()
+
+
+def process_pool():
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            # Spawned, not forked: the server process runs threads and holds
+            # database connections that children must not inherit
+            _process_pool = ProcessPoolExecutor(
+                max_workers=settings.ID_PICTURE_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _process_pool
+
+
+def render_in_pool(path):
+    """render_picture() in the process pool; inline when the pool is disabled"""
+    if not settings.ID_PICTURE_PROCESS_WORKERS:
+        return render_picture(path)
+    return process_pool().submit(render_picture, path).result()
@@ -0,0 +1,344 @@
+"""
+Bulk import of student profiles from CSV or JSON.
+
+Rows are validated in batches without per-row queries: programs, halls and
+wings are resolved from maps loaded once, and e-mail uniqueness is checked
+with one query per batch. Valid rows are written with bulk_create (profiles,
+emergency contacts and the wings through table) inside one transaction. A
+batch that hits a unique constraint anyway (a row written concurrently) is
+retried row by row, and the conflicting rows are reported as errors.
+
+Each row is a flat record with the registration form fields plus:
+
+- ``program`` (name) or ``program_id``; unknown program names are created,
+  as with "Other" on the registration form
+- ``hall`` (name) or ``hall_id``
+- ``wings``: wing names or ids, a list in JSON or ``;``-separated in CSV
+- ``emergency_contact_name`` and ``emergency_contact_phone``
+
+Rows are numbered from 1 in the report (the line after the CSV header).
+"""
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+
+from .lookups import lookup_cache
+from .programs import get_or_create_programs, name_key, program_names
+from .models import EmergencyContact, Hall, Program, StudentProfile, Wing
+
+BATCH_SIZE = 1000
+FORMATS = ('csv', 'json')
+
+
+class StudentImportRowSerializer(serializers.Serializer):
+    """Field validation for one imported row; relations are resolved separately"""
+    first_name = serializers.CharField(max_length=100)
+    last_name = serializers.CharField(max_length=100)
+    other_name = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+    date_of_birth = serializers.DateField()
+    gender = serializers.ChoiceField(choices=StudentProfile.GENDER_CHOICES)
+    marital_status = serializers.ChoiceField(choices=StudentProfile.MARITAL_STATUS_CHOICES)
+    contact = serializers.CharField(max_length=20)
+    email = serializers.EmailField(max_length=254)
+    place_of_residence = serializers.CharField(max_length=255)
+    program = serializers.CharField(max_length=200, required=False)
+    program_id = serializers.IntegerField(required=False)
+    hall = serializers.CharField(max_length=100, required=False)
+    hall_id = serializers.IntegerField(required=False)
+    wings = serializers.ListField(child=serializers.CharField(), required=False)
+    emergency_contact_name = serializers.CharField(max_length=200, required=False)
+    emergency_contact_phone = serializers.CharField(max_length=20, required=False)
+
+    def validate(self, data):
+        if 'program' not in data and 'program_id' not in data:
+            raise serializers.ValidationError({'program': 'Either program or program_id is required.'})
+        if 'hall' not in data and 'hall_id' not in data:
+            raise serializers.ValidationError({'hall': 'Either hall or hall_id is required.'})
+        if ('emergency_contact_name' in data) != ('emergency_contact_phone' in data):
+            raise serializers.ValidationError(
+                {'emergency_contact': 'Give both emergency_contact_name and emergency_contact_phone.'}
+            )
+        return data
+
+
+class LookupMaps:
+    """
+    Programs, halls and wings by id and by case-insensitive name, loaded
+    once per import. Program names are keyed as the Lower(name) unique
+    index compares them (see programs.py).
+    """
+
+    def __init__(self):
+        self.programs = self.index(Program.objects.all(), key=name_key)
+        self.halls = self.index(Hall.objects.all())
+        self.wings = self.index(Wing.objects.all())
+        # Programs named by rows but not in the database yet, by folded name
+        self.new_programs = {}
+
+    @staticmethod
+    def index(queryset, key=str.casefold):
+        rows = list(queryset)
+        return {
+            'id': {row.pk: row for row in rows},
+            'name': {key(row.name): row for row in rows},
+        }
+
+    @staticmethod
+    def find(index, value):
+        value = str(value).strip()
+        if value.isdigit() and int(value) in index['id']:
+            return index['id'][int(value)]
+        return index['name'].get(value.casefold())
+
+    def resolve(self, data, errors):
+        """Return (program, hall, wings) for validated row data, adding to errors"""
+        program = hall = None
+        if 'program_id' in data:
+            program = self.programs['id'].get(data['program_id'])
+            if program is None:
+                errors['program_id'] = f"Program {data['program_id']} does not exist."
+        else:
+            key = name_key(data['program'])
+            program = self.programs['name'].get(key)
+            if program is None:
+                program = self.new_programs.setdefault(key, Program(name=data['program']))
+
+        if 'hall_id' in data:
+            hall = self.halls['id'].get(data['hall_id'])
+            if hall is None:
+                errors['hall_id'] = f"Hall {data['hall_id']} does not exist."
+        else:
+            hall = self.halls['name'].get(data['hall'].strip().casefold())
+            if hall is None:
+                errors['hall'] = f"Hall {data['hall']!r} does not exist."
+
+        wings = []
+        for value in data.get('wings', []):
+            wing = self.find(self.wings, value)
+            if wing is None:
+                errors.setdefault('wings', []).append(f"Wing {value!r} does not exist.")
+            elif wing not in wings:
+                wings.append(wing)
+        return program, hall, wings
+
+    def save_new_programs(self):
+        """Create the programs named by imported rows; returns how many"""
+        pending = [program for program in self.new_programs.values() if program.pk is None]
+        if not pending:
+            return 0
+        created = get_or_create_programs(pending)
+        for program in pending:
+            self.programs['id'][program.pk] = program
+            self.programs['name'][name_key(program.name)] = program
+        return created
+
+
+@dataclass
+class ImportResult:
+    total: int = 0
+    created: int = 0
+    programs_created: int = 0
+    errors: list = field(default_factory=list)
+    dry_run: bool = False
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'created': self.created,
+            'programs_created': self.programs_created,
+            'dry_run': self.dry_run,
+            'errors': self.errors,
+        }
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def build_batch(batch, maps, seen_emails, result):
+    """
+    Validate a batch of (row number, row) pairs.
+
+    Returns a list of (row number, student, emergency contact or None,
+    wings) for the valid rows; errors are added to ``result``.
+    """
+    valid = []
+    # One serializer for every row: building its fields is the costly part
+    row_serializer = StudentImportRowSerializer()
+    for number, row in batch:
+        try:
+            data = row_serializer.run_validation(row)
+        except serializers.ValidationError as e:
+            result.errors.append({'row': number, 'errors': e.detail})
+            continue
+        errors = {}
+        program, hall, wings = maps.resolve(data, errors)
+        if data['email'] in seen_emails:
+            errors['email'] = 'Duplicate email in this import.'
+        seen_emails.add(data['email'])
+        if errors:
+            result.errors.append({'row': number, 'errors': errors})
+            continue
+
+        student = StudentProfile(
+            first_name=data['first_name'],
+            last_name=data['last_name'],
+            other_name=data.get('other_name') or None,
+            date_of_birth=data['date_of_birth'],
+            gender=data['gender'],
+            marital_status=data['marital_status'],
+            contact=data['contact'],
+            email=data['email'],
+            place_of_residence=data['place_of_residence'],
+            program=program,
+            hall_of_affiliation=hall,
+        )
+        contact = None
+        if 'emergency_contact_name' in data:
+            contact = EmergencyContact(
+                name=data['emergency_contact_name'], phone=data['emergency_contact_phone']
+            )
+        valid.append((number, student, contact, wings))
+
+    # One query for the e-mails of the whole batch already in the database
+    taken = set(
+        StudentProfile.objects.filter(email__in=[student.email for _, student, _, _ in valid])
+        .values_list('email', flat=True)
+    )
+    if taken:
+        for number, student, _, _ in valid:
+            if student.email in taken:
+                result.errors.append({'row': number, 'errors': {'email': 'A student with this email already exists.'}})
+        valid = [entry for entry in valid if entry[1].email not in taken]
+    return valid
+
+
+def insert_rows(entries):
+    students = StudentProfile.objects.bulk_create([student for _, student, _, _ in entries])
+    contacts = []
+    links = []
+    WingLink = StudentProfile.wings.through
+    for _, student, contact, wings in entries:
+        if contact is not None:
+            contact.student = student
+            contacts.append(contact)
+        links.extend(WingLink(studentprofile_id=student.pk, wing_id=wing.pk) for wing in wings)
+    EmergencyContact.objects.bulk_create(contacts)
+    WingLink.objects.bulk_create(links)
+    return len(students)
+
+
+def conflict_errors(student, error):
+    if StudentProfile.objects.filter(email=student.email).exists():
+        return {'email': 'A student with this email already exists.'}
+    return {'non_field_errors': [f'Could not be saved: {error}']}
+
+
+def write_batch(entries, maps, result):
+    result.programs_created += maps.save_new_programs()
+    try:
+        with transaction.atomic():
+            result.created += insert_rows(entries)
+        return
+    except IntegrityError:
+        pass
+    # A row conflicts with one written since the batch was checked (say a
+    # registration with the same e-mail): write the rows one at a time to
+    # report the conflicting ones
+    for entry in entries:
+        number, student = entry[:2]
+        # The batch's failed insert may have handed out ids it rolled back
+        student.pk = None
+        student._state.adding = True
+        try:
+            with transaction.atomic():
+                result.created += insert_rows([entry])
+        except IntegrityError as e:
+            result.errors.append({'row': number, 'errors': conflict_errors(student, e)})
+
+
+def import_students(rows, partial=False, dry_run=False, batch_size=BATCH_SIZE):
+    """
+    Import an iterable of row dicts and return an ImportResult.
+
+    Nothing is written if any row is invalid, unless ``partial`` is set, in
+    which case the valid rows are imported and the others reported. With
+    ``dry_run`` the rows are validated and written, then rolled back.
+    """
+    result = ImportResult(dry_run=dry_run)
+    maps = LookupMaps()
+    seen_emails = set()
+    with transaction.atomic():
+        for batch in batched(enumerate(rows, start=1), batch_size):
+            result.total += len(batch)
+            entries = build_batch(batch, maps, seen_emails, result)
+            # Once a row failed without partial, keep validating to report
+            # every error but stop writing
+            if entries and (partial or not result.errors):
+                write_batch(entries, maps, result)
+        if dry_run or (result.errors and not partial):
+            transaction.set_rollback(True)
+            if not dry_run:
+                result.created = result.programs_created = 0
+    if result.programs_created and not dry_run:
+        # bulk_create sends no post_save signals
+        lookup_cache.invalidate()
+        program_names.clear()
+    return result
+
+
+def clean_row(row):
+    """Drop empty values so blank cells count as missing fields"""
+    cleaned = {}
+    for key, value in row.items():
+        if key is None or value is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+            if not value:
+                continue
+        cleaned[key.strip()] = value
+    return cleaned
+
+
+def read_csv(binary_file):
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    for row in csv.DictReader(text):
+        row = clean_row(row)
+        if 'wings' in row:
+            row['wings'] = [wing for wing in (w.strip() for w in row['wings'].split(';')) if wing]
+        yield row
+
+
+def read_json(binary_file):
+    data = json.load(binary_file)
+    if isinstance(data, dict):
+        data = data.get('students')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON list of students or {"students": [...]}.')
+    for row in data:
+        if isinstance(row, dict):
+            contact = row.pop('emergency_contact', None)
+            if isinstance(contact, dict):
+                row.setdefault('emergency_contact_name', contact.get('name'))
+                row.setdefault('emergency_contact_phone', contact.get('phone'))
+            yield clean_row(row)
+        else:
+            yield row
+
+
+def read_rows(binary_file, file_format):
+    """Iterate the rows of an uploaded CSV or JSON file"""
+    return read_csv(binary_file) if file_format == 'csv' else read_json(binary_file)
+
+
+def detect_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return extension if extension in FORMATS else None
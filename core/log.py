@@ -0,0 +1,195 @@
+"""
+Queued, structured and sampled logging.
+
+configure() is the LOGGING_CONFIG function: it applies the LOGGING dict,
+then puts the handlers of the root logger and of every logger it configures
+behind a QueueHandler. A request thread (or the event loop) only appends a
+record to an in-memory queue; a QueueListener thread formats it and writes
+it out. The queue holds at most LOG_QUEUE_SIZE records; when the writer
+falls that far behind, records are dropped rather than blocking requests.
+
+JSONFormatter writes one JSON object per line, with the fields passed in
+``extra`` alongside the standard ones.
+
+SamplingFilter keeps only a share of the records below WARNING from the
+loggers named in LOG_SAMPLING (and their children), e.g.
+``{"core.views": 0.1}`` keeps one record in ten. Warnings and errors are
+always kept.
+
+Dropped and sampled-out records are counted and reported to /metrics.
+"""
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.config
+import logging.handlers
+import os
+import queue
+import threading
+
+from django.conf import settings
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                    .isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and key not in entry:
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep ``rate`` (0 to 1) of the records below WARNING of each logger in
+    ``rates``, and of its children unless they have a rate of their own.
+    Records are kept at even intervals, not at random.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self.seen = {}
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def rate(self, name):
+        while name:
+            if name in self.rates:
+                return name, self.rates[name]
+            name = name.rpartition('.')[0]
+        return None, 1
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        name, rate = self.rate(record.name)
+        if rate >= 1:
+            return True
+        with self._lock:
+            seen = self.seen[name] = self.seen.get(name, 0) + 1
+            # True whenever the running total of kept records, seen * rate, passes a whole number
+            keep = int(seen * rate) != int((seen - 1) * rate)
+            if not keep:
+                self.dropped += 1
+        return keep
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Hands records to a QueueListener thread; drops them when the queue is full"""
+
+    def __init__(self, handlers, size=0):
+        super().__init__(queue.Queue(size))
+        self.handlers = handlers
+        self.size = size
+        self.dropped = 0
+        self.listener = None
+
+    def start(self):
+        self.listener = logging.handlers.QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def restart(self):
+        """After a fork: the listener thread did not survive it, and the queue's lock may be held"""
+        self.listener = None
+        self.queue = queue.Queue(self.size)
+        self.start()
+
+    def prepare(self, record):
+        # The message and traceback are rendered now, while the arguments and
+        # frames are as they were at the call; the JSON is left to the listener
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# The QueueHandlers installed by configure(), one per distinct set of handlers
+queue_handlers = []
+sampling = SamplingFilter()
+
+
+def configure(config):
+    """Apply the LOGGING dict, then queue the configured loggers' handlers"""
+    for handler in queue_handlers:
+        handler.stop()
+    queue_handlers.clear()
+    logging.config.dictConfig(config)
+    sampling.rates = dict(getattr(settings, 'LOG_SAMPLING', {}))
+    if not getattr(settings, 'LOG_QUEUE', True):
+        return
+    loggers = [logging.getLogger()] + [logging.getLogger(name) for name in config.get('loggers', {})]
+    by_handlers = {}
+    for logger in loggers:
+        if not logger.handlers:
+            continue
+        key = tuple(logger.handlers)
+        handler = by_handlers.get(key)
+        if handler is None:
+            handler = by_handlers[key] = QueueHandler(list(key), getattr(settings, 'LOG_QUEUE_SIZE', 0))
+            handler.addFilter(sampling)
+            handler.start()
+            queue_handlers.append(handler)
+        logger.handlers = [handler]
+
+
+def stop():
+    """Write out the queued records"""
+    for handler in queue_handlers:
+        handler.stop()
+
+
+def restart_after_fork():
+    for handler in queue_handlers:
+        handler.restart()
+
+
+def stats():
+    return {
+        'dropped': sum(handler.dropped for handler in queue_handlers),
+        'sampled_out': sampling.dropped,
+        'queued': sum(handler.queue.qsize() for handler in queue_handlers),
+    }
+
+
+atexit.register(stop)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=restart_after_fork)
@@ -0,0 +1,116 @@
+"""
+Process-wide cache of the registration form lookup lists.
+
+Programs, halls and wings change rarely but are read on every form load.
+Their serialized JSON is kept in memory together with an ETag (a hash of the
+body) and Last-Modified time, so repeat requests are answered without
+touching the database and clients holding the current ETag get a 304.
+
+Saving or deleting a lookup row bumps the cache version (see signals.py),
+which drops every cached payload in that process. The other server workers
+do not see the signal, so entries also expire after LOOKUP_CACHE_TTL
+seconds; since the ETag is derived from the content, every worker agrees on
+it once they have rebuilt.
+"""
+import gzip
+import hashlib
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+
+
+@dataclass(frozen=True)
+class CachedPayload:
+    body: bytes
+    etag: str
+    last_modified: float
+    version: int
+    built_at: float
+    # Pre-compressed copy of body, for payloads cached with compress=True
+    gzip_body: bytes = None
+
+
+class LookupCache:
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.version = 0
+        self._payloads = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, build, compress=False):
+        """
+        Return the payload cached under ``key``, calling ``build()`` for the
+        data to serialize when it is missing, stale or expired. With
+        ``compress`` a gzipped copy of the body is kept as well.
+        """
+        payload, previous = self.lookup(key)
+        if payload is None:
+            payload = self.store(key, build(), previous, compress)
+        return payload
+
+    async def aget(self, key, build, compress=False):
+        """get() for a coroutine function ``build``"""
+        payload, previous = self.lookup(key)
+        if payload is None:
+            payload = self.store(key, await build(), previous, compress)
+        return payload
+
+    def lookup(self, key):
+        """(the fresh payload or None, (the version read under, the stale payload))"""
+        with self._lock:
+            version = self.version
+            cached = self._payloads.get(key)
+        if cached and cached.version == version and time.time() - cached.built_at < self.ttl:
+            return cached, None
+        return None, (version, cached)
+
+    def store(self, key, data, previous, compress):
+        version, cached = previous
+        now = time.time()
+        body = JSONRenderer().render(data)
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        # An expired entry rebuilt with the same content keeps its date
+        last_modified = cached.last_modified if cached and cached.etag == etag else now
+        gzip_body = gzip.compress(body, mtime=0) if compress else None
+        payload = CachedPayload(body, etag, last_modified, version, now, gzip_body)
+        with self._lock:
+            # Do not store data read while an invalidation happened
+            if self.version == version:
+                self._payloads[key] = payload
+        return payload
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._payloads.clear()
+
+
+lookup_cache = LookupCache(settings.LOOKUP_CACHE_TTL)
+
+
+accepts_gzip = re.compile(r'\bgzip\b')
+
+
+def cached_json_response(request, payload, **cache_control):
+    """A JSON response for ``payload``, or a 304 if the client already has it"""
+    if payload.gzip_body is not None and accepts_gzip.search(request.headers.get('Accept-Encoding', '')):
+        response = HttpResponse(payload.gzip_body, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(payload.body, content_type='application/json')
+    if payload.gzip_body is not None:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    response['ETag'] = payload.etag
+    response['Last-Modified'] = http_date(payload.last_modified)
+    patch_cache_control(response, **cache_control)
+    return get_conditional_response(
+        request, etag=payload.etag, last_modified=int(payload.last_modified), response=response
+    )
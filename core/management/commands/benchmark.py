@@ -0,0 +1,126 @@
+import json
+import logging
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from core import benchmarks
+
+
+def sizes(value):
+    try:
+        return sorted({int(size) for size in value.split(',')})
+    except ValueError:
+        raise CommandError(f"--sizes takes comma-separated numbers, not {value!r}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the core API endpoints at several dataset sizes on a throwaway database "
+        "(see core/benchmarks.py)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", default=",".join(map(str, benchmarks.SIZES)),
+            help="Comma-separated numbers of students to benchmark with (default: %(default)s)",
+        )
+        parser.add_argument("--iterations", type=int, default=benchmarks.ITERATIONS,
+                            help="Timed requests per endpoint and size (default: %(default)s)")
+        parser.add_argument(
+            "--endpoint", action="append", dest="endpoints",
+            choices=sorted(set(benchmarks.ENDPOINTS) | set(benchmarks.CONCURRENT_ENDPOINTS)),
+            help="Endpoint to benchmark; repeat for several (default: all)",
+        )
+        parser.add_argument(
+            "--concurrency", type=int,
+            help="Send this many GET requests at a time through the ASGI application, "
+                 "as a server would, instead of one after the other through the test client",
+        )
+        parser.add_argument("--pictures", action="store_true", help="Give every student a placeholder picture")
+        parser.add_argument("--seed", type=int, default=0, help="Seed for the choice of students to retrieve")
+        parser.add_argument("--output", help="Write the results to this JSON file")
+        parser.add_argument("--compare", metavar="BASELINE",
+                            help="JSON results of an earlier run; fail if any endpoint regressed")
+        parser.add_argument("--threshold", type=float, default=benchmarks.THRESHOLD,
+                            help="Slowdown in percent counted as a regression (default: %(default)s)")
+        parser.add_argument(
+            "--keepdb", action="store_true",
+            help="Keep the benchmark database (and its seeded students) for the next run",
+        )
+
+    def handle(self, *args, **options):
+        options["sizes"] = sizes(options["sizes"])
+        if options["concurrency"] is not None:
+            if options["concurrency"] < 1:
+                raise CommandError("--concurrency must be at least 1")
+            unsupported = set(options["endpoints"] or ()) - set(benchmarks.CONCURRENT_ENDPOINTS)
+            if unsupported:
+                raise CommandError(f"Not benchmarked with --concurrency: {', '.join(sorted(unsupported))}")
+        else:
+            unsupported = set(options["endpoints"] or ()) - set(benchmarks.ENDPOINTS)
+            if unsupported:
+                raise CommandError(f"Only benchmarked with --concurrency: {', '.join(sorted(unsupported))}")
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read {options['compare']}: {e}")
+
+        report = self.run_benchmarks(options)
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            regressions = benchmarks.compare(report, baseline, threshold=options["threshold"])
+            for regression in regressions:
+                self.stderr.write(
+                    "{size:>7} {endpoint:<15} {metric:<8} {baseline} -> {current} ({change:+}%)".format(**regression)
+                    if regression["change"] is not None else
+                    "{size:>7} {endpoint:<15} {metric:<8} {baseline} -> {current}".format(**regression)
+                )
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressions against {options['compare']}")
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['compare']}"))
+
+    def run_benchmarks(self, options):
+        """benchmarks.run() on a test database and a temporary MEDIA_ROOT"""
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        old_name = connection.settings_dict["NAME"]
+        old_test_name = test_settings.get("NAME")
+        if connection.vendor != "sqlite":
+            # Apart from the database `manage.py test` uses
+            test_settings["NAME"] = f"{old_name}_benchmark"
+        media_root = tempfile.mkdtemp()
+        if options["verbosity"] < 2:
+            # The views log every request at INFO
+            logging.disable(logging.INFO)
+        setup_test_environment()
+        try:
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+            try:
+                with override_settings(MEDIA_ROOT=media_root):
+                    return benchmarks.run(
+                        sizes=options["sizes"],
+                        endpoints=options["endpoints"],
+                        iterations=options["iterations"],
+                        pictures=options["pictures"],
+                        seed=options["seed"],
+                        concurrency=options["concurrency"],
+                        log=self.stdout.write,
+                    )
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+        finally:
+            teardown_test_environment()
+            logging.disable(logging.NOTSET)
+            test_settings["NAME"] = old_test_name
+            shutil.rmtree(media_root, ignore_errors=True)
@@ -0,0 +1,46 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import importer
+
+
+class Command(BaseCommand):
+    help = "Bulk import students from a CSV or JSON file (see core/importer.py for the row format)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSON file to import")
+        parser.add_argument("--format", choices=importer.FORMATS, help="File format (default: from the extension)")
+        parser.add_argument(
+            "--partial", action="store_true",
+            help="Import the valid rows even if other rows have errors",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Validate without saving")
+        parser.add_argument("--batch-size", type=int, default=importer.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        file_format = options["format"] or importer.detect_format(options["path"])
+        if file_format is None:
+            raise CommandError("Cannot tell the file format from its name; pass --format csv|json")
+
+        try:
+            with open(options["path"], "rb") as f:
+                result = importer.import_students(
+                    importer.read_rows(f, file_format),
+                    partial=options["partial"],
+                    dry_run=options["dry_run"],
+                    batch_size=options["batch_size"],
+                )
+        except (OSError, ValueError, csv.Error) as e:
+            raise CommandError(f"Could not read {options['path']}: {e}")
+
+        for error in result.errors:
+            self.stderr.write(f"Row {error['row']}: {json.dumps(error['errors'])}")
+        verb = "Would import" if options["dry_run"] else "Imported"
+        self.stdout.write(
+            f"{verb} {result.created} of {result.total} students "
+            f"({result.programs_created} new programs, {len(result.errors)} rows with errors)"
+        )
+        if result.errors and not options["partial"]:
+            raise CommandError("Nothing was imported because some rows have errors; fix them or use --partial")
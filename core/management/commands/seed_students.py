@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import seeding
+
+
+class Command(BaseCommand):
+    help = (
+        "Add synthetic students with programs, halls, wings and emergency contacts, "
+        "using COPY on PostgreSQL (see core/seeding.py)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, required=True, help="Number of students to add")
+        parser.add_argument(
+            "--start", type=int,
+            help="Number of the first student (default: after the students seeded before)",
+        )
+        parser.add_argument(
+            "--pictures", type=int, default=0, metavar="N",
+            help="Store N placeholder ID pictures and hand them out to the students",
+        )
+        parser.add_argument("--no-copy", action="store_true", help="Use bulk_create even where COPY is available")
+
+    def handle(self, *args, **options):
+        if options["count"] < 1:
+            raise CommandError("--count must be at least 1")
+        if options["pictures"] < 0:
+            raise CommandError("--pictures cannot be negative")
+
+        started = time.perf_counter()
+
+        def progress(done):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{done} of {options['count']} students ({done / elapsed:.0f}/s)")
+
+        use_copy = False if options["no_copy"] else None
+        created = seeding.seed_students(
+            options["count"],
+            start=options["start"],
+            pictures=options["pictures"],
+            use_copy=use_copy,
+            progress=progress if options["verbosity"] > 0 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {created} students in {time.perf_counter() - started:.1f}s"
+        ))
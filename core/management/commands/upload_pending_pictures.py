@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from core.models import StudentProfile
+from core.uploads import claimable, upload_picture
+
+
+class Command(BaseCommand):
+    help = (
+        "Upload ID pictures left pending or failed by the background upload pool, "
+        "or stuck uploading for longer than ID_PICTURE_UPLOAD_CLAIM_TIMEOUT"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--failed-only", action="store_true",
+            help="Only retry uploads that already failed or were left uploading",
+        )
+
+    def handle(self, *args, **options):
+        statuses = ("failed",) if options["failed_only"] else ("pending", "failed")
+        student_ids = list(
+            StudentProfile.objects.filter(claimable(statuses))
+            .order_by("created_at")
+            .values_list("id", flat=True)
+        )
+        uploaded = sum(1 for student_id in student_ids if upload_picture(student_id))
+        self.stdout.write(f"Uploaded {uploaded} of {len(student_ids)} ID pictures")
@@ -0,0 +1,444 @@
+"""
+Request metrics in the Prometheus text format.
+
+MetricsMiddleware records, per view, method and status code:
+
+- latency until the view's response is returned (a histogram)
+- database queries and their total time, counted by an execute wrapper
+  on every connection, in whichever thread the request's queries run
+- response size in bytes (a histogram); a streamed response is counted as
+  it is sent and recorded when it ends
+
+Latency and queries of a streamed response (exports, backups, rosters)
+cover the view only, not the streaming that follows.
+
+Each worker process keeps its own numbers and writes them to
+METRICS_ROOT/<pid>-<nonce>.json at most every METRICS_FLUSH_INTERVAL
+seconds, from a short-lived background thread rather than the request. The
+nonce is drawn once per process, so a new process given a dead worker's pid
+does not take over its file. The directory is shared by the workers on a
+machine, and ``/metrics`` sums the files of the workers still running,
+deleting the others (and a pid's older files, left by a process that had
+the pid before). Counters therefore drop when a worker exits, which
+Prometheus treats as a counter reset.
+
+Other modules add process-wide numbers (cache and pool statistics) by
+appending to ``metrics.collectors``.
+"""
+import bisect
+import contextvars
+import json
+import logging
+import os
+import secrets
+import tempfile
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+
+from . import log
+from .storage_urls import image_url_cache
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# name: (type, help, buckets or None)
+REQUEST_METRICS = {
+    'latency': ('histogram', 'Seconds until the view returned its response', LATENCY_BUCKETS),
+    'queries': ('histogram', 'Database queries run by the view', QUERY_BUCKETS),
+    'size': ('histogram', 'Response body size in bytes', SIZE_BUCKETS),
+    'db_seconds': ('counter', 'Seconds spent in database queries run by the view', None),
+}
+METRIC_NAMES = {
+    'latency': 'nups_http_request_duration_seconds',
+    'queries': 'nups_http_request_db_queries',
+    'size': 'nups_http_response_size_bytes',
+    'db_seconds': 'nups_http_request_db_duration_seconds_total',
+}
+LABELS = ('view', 'method', 'status')
+
+
+def new_stats():
+    stats = {}
+    for name, (kind, _, buckets) in REQUEST_METRICS.items():
+        if kind == 'histogram':
+            # One count per bucket plus +Inf, not cumulative; then the sum
+            stats[name] = [0] * (len(buckets) + 1) + [0]
+        else:
+            stats[name] = 0
+    return stats
+
+
+def observe(histogram, buckets, value):
+    histogram[bisect.bisect_left(buckets, value)] += 1
+    histogram[-1] += value
+
+
+class Metrics:
+    """Thread-safe per-process request metrics, flushed to a shared directory"""
+
+    def __init__(self):
+        # (view, method, status) -> stats
+        self._requests = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._flushed_at = 0
+        # (pid, nonce) of the process writing; drawn again in a forked child
+        self._owner = None
+        # Functions returning [(name, type, help, value)] of process-wide metrics
+        self.collectors = []
+
+    def record(self, labels, **values):
+        """Add one request's values (any of REQUEST_METRICS) under labels"""
+        with self._lock:
+            stats = self._requests.get(labels)
+            if stats is None:
+                stats = self._requests[labels] = new_stats()
+            for name, value in values.items():
+                kind, _, buckets = REQUEST_METRICS[name]
+                if kind == 'histogram':
+                    observe(stats[name], buckets, value)
+                else:
+                    stats[name] += value
+
+    def snapshot(self):
+        with self._lock:
+            requests = [[list(labels), {name: (list(value) if isinstance(value, list) else value)
+                                        for name, value in stats.items()}]
+                        for labels, stats in self._requests.items()]
+        samples = []
+        for collect in self.collectors:
+            samples.extend(collect())
+        return {'pid': os.getpid(), 'requests': requests, 'samples': samples}
+
+    def clear(self):
+        with self._lock:
+            self._requests.clear()
+
+    def flush(self, force=False):
+        """
+        Write this process's snapshot to METRICS_ROOT, unless done recently.
+        Unless forced, the writing is left to a background thread: the caller
+        may be a request, or the event loop.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._flushed_at < settings.METRICS_FLUSH_INTERVAL:
+                return
+            self._flushed_at = now
+        if force:
+            self.write(settings.METRICS_ROOT)
+        else:
+            threading.Thread(target=self.write, args=(settings.METRICS_ROOT,), name='metrics-flush',
+                             daemon=True).start()
+
+    def file_name(self):
+        if self._owner is None or self._owner[0] != os.getpid():
+            self._owner = (os.getpid(), secrets.token_hex(4))
+        return '%s-%s.json' % self._owner
+
+    def write(self, root):
+        # One write at a time, so an older snapshot never replaces a newer one
+        with self._write_lock:
+            try:
+                os.makedirs(root, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=root, suffix='.tmp')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(self.snapshot(), f)
+                os.replace(tmp_path, os.path.join(root, self.file_name()))
+            except OSError:
+                logger.warning("Could not write metrics to %s", root, exc_info=True)
+
+
+metrics = Metrics()
+
+
+def cache_samples():
+    stats = image_url_cache.stats()
+    return [
+        ('nups_image_url_cache_hits_total', 'counter', 'Media URLs served from memory', stats['hits']),
+        ('nups_image_url_cache_misses_total', 'counter', 'Media URLs built by the storage backend', stats['misses']),
+        ('nups_image_url_cache_entries', 'gauge', 'Media URLs held in memory', stats['size']),
+    ]
+
+
+metrics.collectors.append(cache_samples)
+
+
+def log_samples():
+    stats = log.stats()
+    return [
+        ('nups_log_records_dropped_total', 'counter', 'Log records dropped because the queue was full', stats['dropped']),
+        ('nups_log_records_sampled_out_total', 'counter', 'Log records left out by LOG_SAMPLING', stats['sampled_out']),
+        ('nups_log_records_queued', 'gauge', 'Log records waiting to be written', stats['queued']),
+    ]
+
+
+metrics.collectors.append(log_samples)
+
+
+def pool_samples():
+    """Statistics of the default database's connection pool, if it has one"""
+    database = connections['default']
+    if not database.settings_dict['OPTIONS'].get('pool'):
+        return []
+    stats = database.pool.get_stats()
+    return [
+        ('nups_db_pool_connections', 'gauge', 'Open connections in the pool', stats['pool_size']),
+        ('nups_db_pool_connections_in_use', 'gauge', 'Pooled connections checked out',
+         stats['pool_size'] - stats['pool_available']),
+        ('nups_db_pool_requests_waiting', 'gauge', 'Requests waiting for a connection',
+         stats.get('requests_waiting', 0)),
+        ('nups_db_pool_checkouts_total', 'counter', 'Connections handed out by the pool', stats.get('requests_num', 0)),
+        ('nups_db_pool_checkouts_queued_total', 'counter', 'Checkouts that had to wait for a connection',
+         stats.get('requests_queued', 0)),
+        ('nups_db_pool_wait_seconds_total', 'counter', 'Seconds spent waiting for a connection',
+         stats.get('requests_wait_ms', 0) / 1000),
+        ('nups_db_pool_timeouts_total', 'counter', 'Checkouts that timed out or failed',
+         stats.get('requests_errors', 0)),
+        ('nups_db_pool_connections_opened_total', 'counter', 'Connections opened by the pool',
+         stats.get('connections_num', 0)),
+        ('nups_db_pool_connections_lost_total', 'counter', 'Pooled connections found broken and discarded',
+         stats.get('connections_lost', 0) + stats.get('returns_bad', 0)),
+    ]
+
+
+metrics.collectors.append(pool_samples)
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # running as another user
+        return True
+    return True
+
+
+def read_snapshots(root):
+    """
+    The snapshot of every running worker in root. Files of workers that have
+    exited, and all but the newest file of each pid, are deleted.
+    """
+    try:
+        names = os.listdir(root)
+    except FileNotFoundError:
+        return []
+    # pid -> (modified time, path, snapshot) of its newest file
+    newest = {}
+    stale = []
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        path = os.path.join(root, name)
+        try:
+            modified = os.stat(path).st_mtime
+            with open(path) as f:
+                snapshot = json.load(f)
+            pid = snapshot['pid']
+        except (OSError, ValueError, KeyError, TypeError):  # removed meanwhile, or not ours
+            continue
+        if not is_running(pid):
+            stale.append(path)
+            continue
+        current = newest.get(pid)
+        if current is None or modified > current[0]:
+            if current is not None:
+                stale.append(current[1])
+            newest[pid] = (modified, path, snapshot)
+        else:
+            stale.append(path)
+    for path in stale:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return [snapshot for _, _, snapshot in newest.values()]
+
+
+def merge(snapshots):
+    """
+    Sum snapshots into ({labels: stats}, {name: [type, help, value]}).
+    Gauges of workers that have exited are left out.
+    """
+    requests = {}
+    samples = {}
+    for snapshot in snapshots:
+        running = is_running(snapshot['pid'])
+        for labels, stats in snapshot['requests']:
+            total = requests.setdefault(tuple(labels), new_stats())
+            for name, value in stats.items():
+                if isinstance(value, list):
+                    total[name] = [a + b for a, b in zip(total[name], value)]
+                else:
+                    total[name] += value
+        for name, kind, help_text, value in snapshot['samples']:
+            if kind == 'gauge' and not running:
+                continue
+            sample = samples.setdefault(name, [kind, help_text, 0])
+            sample[2] += value
+    return requests, samples
+
+
+def number(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def label_text(labels, **extra):
+    pairs = list(zip(LABELS, labels)) + list(extra.items())
+    return '{' + ','.join(f'{key}="{label_value(value)}"' for key, value in pairs) + '}'
+
+
+def render(requests, samples):
+    """The Prometheus text exposition of merged metrics"""
+    lines = []
+    for metric, (kind, help_text, buckets) in REQUEST_METRICS.items():
+        name = METRIC_NAMES[metric]
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for labels, stats in sorted(requests.items()):
+            value = stats[metric]
+            if kind != 'histogram':
+                lines.append(f'{name}{label_text(labels)} {number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), value[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{label_text(labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{label_text(labels)} {number(value[-1])}')
+            lines.append(f'{name}_count{label_text(labels)} {cumulative}')
+    for name, (kind, help_text, value) in sorted(samples.items()):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {number(value)}']
+    return '\n'.join(lines) + '\n'
+
+
+def exposition():
+    """Metrics of every worker on this machine, including this one's latest"""
+    metrics.flush(force=True)
+    return render(*merge(read_snapshots(settings.METRICS_ROOT)))
+
+
+class QueryCounter:
+    """connection.execute_wrapper() hook counting queries and their time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+# The QueryCounter of the request being handled. A context variable, not a
+# wrapper on the request thread's connection: the queries of an async view
+# run on another thread, and sync_to_async carries the context over to it.
+request_queries = contextvars.ContextVar('request_queries', default=None)
+
+
+def count_request_query(execute, sql, params, many, context):
+    queries = request_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    return queries(execute, sql, params, many, context)
+
+
+def install_query_counter(connection, **kwargs):
+    if count_request_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_request_query)
+
+
+connection_created.connect(install_query_counter)
+
+
+def counted_bytes(chunks, done):
+    """Pass chunks through, then call done(total bytes)"""
+    total = 0
+    try:
+        for chunk in chunks:
+            total += len(chunk)
+            yield chunk
+    finally:
+        done(total)
+
+
+async def acounted_bytes(chunks, done):
+    total = 0
+    try:
+        async for chunk in chunks:
+            total += len(chunk)
+            yield chunk
+    finally:
+        done(total)
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+class MetricsMiddleware:
+    """Record latency, database use and response size of every request"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Connections opened before this module was imported have no counter
+        install_query_counter(connection)
+        queries = QueryCounter()
+        token = request_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_queries.reset(token)
+        return self.record(request, response, time.perf_counter() - start, queries)
+
+    async def __acall__(self, request):
+        queries = QueryCounter()
+        token = request_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_queries.reset(token)
+        return self.record(request, response, time.perf_counter() - start, queries)
+
+    def record(self, request, response, latency, queries):
+        labels = (view_label(request), request.method, str(response.status_code))
+        values = {'latency': latency, 'queries': queries.count, 'db_seconds': queries.seconds}
+        if not response.streaming:
+            metrics.record(labels, size=len(response.content), **values)
+        else:
+            metrics.record(labels, **values)
+            done = lambda size: metrics.record(labels, size=size)
+            if response.is_async:
+                response.streaming_content = acounted_bytes(response.streaming_content, done)
+            else:
+                response.streaming_content = counted_bytes(response.streaming_content, done)
+        metrics.flush()
+        return response
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:20
+
+from django.db import migrations, models
+
+
+def mark_existing_pictures_ready(apps, schema_editor):
+    # Pictures saved before background uploads were stored synchronously
+    StudentProfile = apps.get_model('core', 'StudentProfile')
+    StudentProfile.objects.exclude(id_picture__isnull=True).exclude(id_picture='').update(id_picture_status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_incremental_backups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentprofile',
+            name='id_picture_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='studentprofile',
+            name='id_picture_staged',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='studentprofile',
+            name='id_picture_status',
+            field=models.CharField(choices=[('none', 'No picture'), ('pending', 'Pending'), ('uploading', 'Uploading'), ('ready', 'Ready'), ('failed', 'Failed')], default='none', max_length=10),
+        ),
+        migrations.RunPython(mark_existing_pictures_ready, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_studentprofile_id_picture_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentprofile',
+            name='id_picture_medium',
+            field=models.ImageField(blank=True, null=True, upload_to='id_pictures/medium/'),
+        ),
+        migrations.AddField(
+            model_name='studentprofile',
+            name='id_picture_thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='id_pictures/thumbnails/'),
+        ),
+    ]
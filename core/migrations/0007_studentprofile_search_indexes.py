@@ -0,0 +1,42 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# The searched text of core/search.py (search.text_sql()); queries must use
+# the same expressions for PostgreSQL to pick these indexes
+SEARCH_TEXT = (
+    "coalesce(\"first_name\", '') || ' ' || coalesce(\"last_name\", '') || ' ' || "
+    "coalesce(\"other_name\", '') || ' ' || coalesce(\"email\", '') || ' ' || "
+    "coalesce(\"contact\", '') || ' ' || coalesce(\"place_of_residence\", '')"
+)
+
+# Expression indexes, PostgreSQL only
+INDEXES = {
+    'core_student_search_idx': f"USING gin ((to_tsvector('simple'::regconfig, {SEARCH_TEXT})))",
+    'core_student_trgm_idx': f"USING gin ((lower({SEARCH_TEXT})) gin_trgm_ops)",
+}
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, definition in INDEXES.items():
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON core_studentprofile {definition}')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_studentprofile_picture_renditions'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def merge_case_duplicates(apps, schema_editor):
+    """
+    Merge programs whose names differ only in case into the one with the
+    most students (the oldest among equals), ahead of the Lower(name)
+    unique constraint.
+    """
+    Program = apps.get_model('core', 'Program')
+    StudentProfile = apps.get_model('core', 'StudentProfile')
+    duplicated = (
+        Program.objects.annotate(name_lower=Lower('name'))
+        .values('name_lower').annotate(n=Count('id')).filter(n__gt=1)
+        .values_list('name_lower', flat=True)
+    )
+    for name_lower in list(duplicated):
+        programs = list(
+            Program.objects.annotate(name_lower=Lower('name'), students=Count('studentprofile'))
+            .filter(name_lower=name_lower).order_by('-students', 'id')
+        )
+        keep, others = programs[0], [program.id for program in programs[1:]]
+        StudentProfile.objects.filter(program_id__in=others).update(program_id=keep.id)
+        Program.objects.filter(id__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_studentprofile_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_case_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:39
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_merge_case_duplicate_programs'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='program',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('name'), name='core_program_name_ci_unique', violation_error_message='A program with this name already exists.'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_program_name_ci_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backupmanifest',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
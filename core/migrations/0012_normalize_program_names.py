@@ -0,0 +1,34 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def normalize_program_names(apps, schema_editor):
+    """
+    Collapse the whitespace of stored program names, as the API now does on
+    save, merging programs that then differ only in case or spacing into
+    the one with the most students (the oldest among equals).
+    """
+    Program = apps.get_model('core', 'Program')
+    StudentProfile = apps.get_model('core', 'StudentProfile')
+    by_key = {}
+    for program in Program.objects.annotate(students=Count('studentprofile')).order_by('-students', 'id'):
+        by_key.setdefault(' '.join(program.name.split()).lower(), []).append(program)
+    for programs in by_key.values():
+        keep, others = programs[0], [program.id for program in programs[1:]]
+        if others:
+            StudentProfile.objects.filter(program_id__in=others).update(program_id=keep.id)
+            Program.objects.filter(id__in=others).delete()
+        name = ' '.join(keep.name.split())
+        if name != keep.name:
+            Program.objects.filter(id=keep.id).update(name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_picture_status_invalid'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_program_names, migrations.RunPython.noop),
+    ]
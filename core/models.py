@@ -1,4 +1,7 @@
+import uuid
+
 from django.db import models
+from django.db.models.functions import Lower
 from django.conf import settings
 
 
@@ -9,6 +12,16 @@ from django.conf import settings
 class Program(models.Model):
     name = models.CharField(max_length=200, unique=True)
 
+    class Meta:
+        constraints = [
+            # Names are matched case-insensitively (see programs.py)
+            models.UniqueConstraint(
+                Lower('name'),
+                name='core_program_name_ci_unique',
+                violation_error_message='A program with this name already exists.',
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -91,7 +104,49 @@ class StudentProfile(models.Model):
         null=True
     )
 
+    # Smaller renditions for the admin list and detail view (see images.py)
+    id_picture_medium = models.ImageField(
+        upload_to="id_pictures/medium/",
+        blank=True,
+        null=True
+    )
+    id_picture_thumbnail = models.ImageField(
+        upload_to="id_pictures/thumbnails/",
+        blank=True,
+        null=True
+    )
+
+    # Pictures are staged on local disk at registration and uploaded to the
+    # id_picture storage in the background (see uploads.py)
+    PICTURE_STATUS_CHOICES = [
+        ("none", "No picture"),
+        ("pending", "Pending"),
+        ("uploading", "Uploading"),
+        ("ready", "Ready"),
+        ("failed", "Failed"),
+        # The staged file is missing or not a readable image: not retried
+        ("invalid", "Invalid picture"),
+    ]
+    id_picture_status = models.CharField(
+        max_length=10,
+        choices=PICTURE_STATUS_CHOICES,
+        default="none"
+    )
+    # Name of the staged file while the upload is pending
+    id_picture_staged = models.CharField(max_length=255, blank=True, default="")
+    id_picture_error = models.TextField(blank=True, default="")
+
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also bumped when the student's wings change (see signals.py);
+    # incremental backups export rows changed after their watermark
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Backs the (created_at, id) keyset used by the list endpoint
+            models.Index(fields=['-created_at', '-id'], name='core_student_created_id_idx'),
+            models.Index(fields=['gender'], name='core_student_gender_idx'),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -109,6 +164,34 @@ class EmergencyContact(models.Model):
     )
     name = models.CharField(max_length=200)
     phone = models.CharField(max_length=20)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.name} ({self.student})"
+
+
+# =========================
+# BACKUPS
+# =========================
+
+class BackupManifest(models.Model):
+    """
+    Record of a database backup. The watermark is the time the backup
+    started; an incremental backup taken from this manifest exports the
+    rows changed after it. completed_at is set once the whole backup has
+    been streamed; only completed manifests can be backed up from.
+    """
+    KIND_CHOICES = [
+        ("full", "Full"),
+        ("incremental", "Incremental"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    since = models.DateTimeField(blank=True, null=True)
+    watermark = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.kind} backup up to {self.watermark.isoformat()}"
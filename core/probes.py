@@ -0,0 +1,154 @@
+"""
+Liveness and readiness probes.
+
+LivenessProbe wraps the ASGI application (see nups/asgi.py) and answers the
+LIVENESS_PATHS itself, before Django's middleware, URL resolution or
+sessions run: it only says that the process is up and its event loop is
+turning. It never touches the database, so the keep-alive pinger costs next
+to nothing.
+
+Readiness (/ready/) checks what a request needs: that the database answers
+and that the storage pictures are uploaded to can be reached. Failures are
+logged; the endpoint, which is public, only says which check failed. The
+outcome is kept for READINESS_CACHE_TTL seconds, and only one check runs at
+a time in a worker, so however often the probes come, a worker queries the
+database at most once per TTL.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def liveness_payload():
+    return {
+        'status': 'healthy',
+        'service': 'NUPS API',
+        'timestamp': timezone.now().isoformat(),
+        'message': 'Service is running'
+    }
+
+
+class LivenessProbe:
+    """ASGI middleware answering GET and HEAD on ``paths`` without calling Django"""
+
+    def __init__(self, application, paths):
+        self.application = application
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths or scope['method'] not in ('GET', 'HEAD'):
+            return await self.application(scope, receive, send)
+        body = json.dumps(liveness_payload()).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'cache-control', b'no-store'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+
+
+# --------------------------------------------------
+# Readiness
+# --------------------------------------------------
+def check_database():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+
+
+def writable(path):
+    """Whether ``path``, or the nearest of its parents that exists, can be written to"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return False
+        path = parent
+    return os.access(path, os.W_OK)
+
+
+def picture_storage():
+    """The storage pictures are uploaded to: Cloudinary is set on the field (see apps.py)"""
+    from .models import StudentProfile
+    return StudentProfile._meta.get_field('id_picture').storage
+
+
+def check_storage():
+    storage = picture_storage()
+    # A remote storage (Cloudinary) raises when it cannot be reached; the
+    # answer itself does not matter
+    storage.exists('readiness-probe')
+    location = getattr(storage, 'location', None)
+    if location and not writable(location):
+        raise OSError(f'{location} is not writable')
+    if not writable(settings.ID_PICTURE_STAGING_ROOT):
+        raise OSError(f'{settings.ID_PICTURE_STAGING_ROOT} is not writable')
+
+
+CHECKS = {
+    'database': check_database,
+    'storage': check_storage,
+}
+
+
+class Readiness:
+    """The outcome of the readiness checks, rerun at most every ``ttl`` seconds"""
+
+    def __init__(self, ttl, checks=CHECKS):
+        self.ttl = ttl
+        self.checks = checks
+        self.runs = 0
+        self._result = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def fresh(self):
+        if self._result is not None and time.monotonic() - self._checked_at < self.ttl:
+            return self._result
+        return None
+
+    def check(self):
+        """(ready, {check name: 'ok' or 'failed'})"""
+        result = self.fresh()
+        if result is not None:
+            return result
+        # Probes arriving during a check wait for it rather than starting their own
+        with self._lock:
+            result = self.fresh()
+            if result is None:
+                result = self._result = self.run()
+                self._checked_at = time.monotonic()
+        return result
+
+    def run(self):
+        self.runs += 1
+        results = {}
+        for name, check in self.checks.items():
+            try:
+                check()
+            except Exception:
+                # The error stays in the log: the endpoint is public
+                logger.exception("Readiness check %s failed", name)
+                results[name] = 'failed'
+            else:
+                results[name] = 'ok'
+        return all(value == 'ok' for value in results.values()), results
+
+    def clear(self):
+        with self._lock:
+            self._result = None
+
+
+readiness = Readiness(getattr(settings, 'READINESS_CACHE_TTL', 5))
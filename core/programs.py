@@ -0,0 +1,115 @@
+"""
+Case-insensitive program resolution.
+
+Programs typed in under "Other" on the registration form (or named in an
+import) are matched case-insensitively against the existing ones. Program
+names are unique on ``Lower(name)`` (migration 0009), so lookups are index
+scans and two concurrent registrations cannot create "Computer science"
+next to "Computer Science": the loser of the race gets an IntegrityError,
+rolls back to its savepoint and reads the winner's row.
+
+Most names typed in are programs that already exist, so each process keeps
+a map of lowercased name -> Program, loaded with one query. Saving or
+deleting a program clears it (see signals.py); as with the lookup lists,
+other workers catch up within LOOKUP_CACHE_TTL seconds.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+
+from .models import Program
+
+
+def normalize_name(name):
+    """Strip and collapse whitespace: "  Computer   Science " -> "Computer Science" """
+    return ' '.join(name.split())
+
+
+def name_key(name):
+    """The value of Lower(name) that the unique index compares"""
+    return normalize_name(name).lower()
+
+
+def by_keys(keys):
+    """Programs whose lowercased name is in keys, by key (one index lookup each)"""
+    programs = Program.objects.alias(name_lower=Lower('name')).filter(name_lower__in=keys)
+    return {program.name.lower(): program for program in programs}
+
+
+class ProgramNames:
+    """Per-process map of lowercased program name -> Program"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._programs = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            programs = self._programs
+            fresh = programs is not None and time.monotonic() - self._loaded_at < self.ttl
+        if not fresh:
+            programs = {program.name.lower(): program for program in Program.objects.all()}
+            with self._lock:
+                self._programs = programs
+                self._loaded_at = time.monotonic()
+        return programs.get(key)
+
+    def clear(self):
+        with self._lock:
+            self._programs = None
+
+
+program_names = ProgramNames(settings.LOOKUP_CACHE_TTL)
+
+
+def get_or_create_program(name):
+    """
+    Return (program, created) for a program name, matched case-insensitively.
+    Safe against concurrent creation of the same name.
+    """
+    name = normalize_name(name)
+    key = name.lower()
+    program = program_names.get(key)
+    if program is not None:
+        return program, False
+
+    # Not in this process's map: created since it was loaded, or new
+    program = by_keys([key]).get(key)
+    if program is not None:
+        return program, False
+    try:
+        with transaction.atomic():
+            return Program.objects.create(name=name), True
+    except IntegrityError:
+        # Created concurrently; the unique index made us wait for its commit
+        program = by_keys([key]).get(key)
+        if program is None:
+            raise
+        return program, False
+
+
+def get_or_create_programs(programs):
+    """
+    Save unsaved Program instances, matching names case-insensitively.
+
+    Instances whose name turns out to exist already get the existing row's
+    id and name. Returns the number of names that were new (a name created
+    concurrently by someone else still counts).
+    """
+    programs = {name_key(program.name): program for program in programs}
+    existing = by_keys(list(programs))
+    missing = [program for key, program in programs.items() if key not in existing]
+    for program in missing:
+        program.name = normalize_name(program.name)
+    # Rows inserted by someone else meanwhile are skipped, then read back
+    Program.objects.bulk_create(missing, ignore_conflicts=True)
+    existing = by_keys(list(programs))
+    for key, program in programs.items():
+        program.pk = existing[key].pk
+        program.name = existing[key].name
+    return len(missing)
@@ -0,0 +1,241 @@
+"""
+Server-rendered roster PDFs, cached on disk.
+
+A roster is the member list for one set of filters (gender, hall, program,
+wing) laid out as the admin page's client-side PDF used to be. Rendering a
+large roster takes seconds, so finished files are kept in ROSTER_CACHE_ROOT
+under a key made of the filters and the data version:
+
+- the number of students and their latest ``updated_at``, which change
+  whenever a profile is added, edited, deleted or has its wings changed
+- a hash of the program, hall and wing names shown in the roster
+
+The version is one aggregate query, so a repeat download of an unchanged
+roster costs that query and a file read. The directory is shared by every
+worker on the machine; files are written under a temporary name and renamed
+into place, and the least recently used ones are removed beyond
+ROSTER_CACHE_MAX_FILES.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Max
+from django.http import FileResponse
+from django.utils import timezone
+
+from .backup import aiter_sync
+from .lookups import lookup_cache
+from .models import Hall, Program, StudentProfile, Wing
+
+try:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+except ImportError:  # roster PDFs are unavailable without it
+    colors = None
+
+logger = logging.getLogger(__name__)
+
+# Rows per platypus Table: one huge table is slow to split across pages
+ROWS_PER_TABLE = 200
+
+COLUMNS = ['Name', 'Gender', 'Contact', 'Residence', 'Program', 'Hall', 'Wings']
+# Widths in mm, filling an A4 page with 10 mm margins
+COLUMN_WIDTHS = [36, 16, 24, 30, 42, 22, 20]
+# Left plus right padding of a table cell, in points
+CELL_PADDING = 12
+
+
+def available():
+    return colors is not None
+
+
+def lookup_names():
+    """Names of every program, hall and wing, by id"""
+    return {
+        'programs': list(Program.objects.order_by('id').values_list('id', 'name')),
+        'halls': list(Hall.objects.order_by('id').values_list('id', 'name')),
+        'wings': list(Wing.objects.order_by('id').values_list('id', 'name')),
+    }
+
+
+def data_version():
+    """A string that changes whenever the data shown in a roster changes"""
+    state = StudentProfile.objects.order_by().aggregate(count=Count('id'), updated=Max('updated_at'))
+    updated = state['updated'].isoformat() if state['updated'] else ''
+    # Held in the lookup cache, so it costs no query while lookups are unchanged
+    lookups = lookup_cache.get('roster-lookups', lookup_names).etag.strip('"')
+    return f"{state['count']}:{updated}:{lookups}"
+
+
+def cache_key(filters, version):
+    data = json.dumps({'filters': filters, 'version': version}, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()[:32]
+
+
+def roster_title(filters):
+    """The heading for a filter set, e.g. "All Female Members in Choir from Unity Hall" """
+    if not filters:
+        return 'All Registered Members'
+    title = 'All'
+    if 'gender' in filters:
+        title += f" {filters['gender']}"
+    title += ' Members'
+    if 'wings__id' in filters:
+        wing = Wing.objects.filter(pk=filters['wings__id']).first()
+        title += f" in {wing.name if wing else 'Unknown Wing'}"
+    if 'hall_of_affiliation_id' in filters:
+        hall = Hall.objects.filter(pk=filters['hall_of_affiliation_id']).first()
+        title += f" from {hall.name if hall else 'Unknown Hall'}"
+    if 'program_id' in filters:
+        program = Program.objects.filter(pk=filters['program_id']).first()
+        title += f" studying {program.name if program else 'Unknown Program'}"
+    if 'search' in filters:
+        title += f' matching "{filters["search"]}"'
+    return title
+
+
+def roster_rows(queryset, fit):
+    for student in queryset.iterator(chunk_size=2000):
+        name = ' '.join(part for part in (student.first_name, student.other_name, student.last_name) if part)
+        yield [
+            fit(0, name),
+            student.gender or '—',
+            student.contact or '—',
+            fit(3, student.place_of_residence or '—'),
+            fit(4, student.program.name if student.program else '—'),
+            fit(5, student.hall_of_affiliation.name if student.hall_of_affiliation else '—'),
+            fit(6, ', '.join(wing.name for wing in student.wings.all()) or '—'),
+        ]
+
+
+def escape(text):
+    """Escape text for a reportlab Paragraph (which parses markup)"""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def cell_fitter(widths, styles):
+    """
+    Return fit(column, text): the text itself when it fits the column on
+    one line, else a wrapping Paragraph. Paragraphs are several times
+    slower to lay out, so they are kept for the cells that need them.
+    """
+    def fit(column, text):
+        style = styles[column]
+        if stringWidth(text, style.fontName, style.fontSize) <= widths[column] - CELL_PADDING:
+            return text
+        return Paragraph(escape(text), style)
+    return fit
+
+
+def render_roster(path, queryset, title):
+    """Write the roster PDF for queryset to path"""
+    styles = getSampleStyleSheet()
+    cell_style = ParagraphStyle('RosterCell', parent=styles['BodyText'], fontSize=8, leading=10)
+    name_style = ParagraphStyle('RosterName', parent=cell_style, fontName='Helvetica-Bold')
+    table_style = TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor('#c7d2fe')),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f5f9ff')]),
+    ])
+    widths = [width * mm for width in COLUMN_WIDTHS]
+    fit = cell_fitter(widths, [name_style] + [cell_style] * (len(COLUMNS) - 1))
+
+    total = queryset.count()
+    story = [
+        Paragraph(escape(title), styles['Title']),
+        Paragraph(f'Total Members: {total}', styles['Normal']),
+        Paragraph(f"Generated on: {timezone.localdate():%d %B %Y}", styles['Normal']),
+        Spacer(1, 6 * mm),
+    ]
+    rows = []
+    for row in roster_rows(queryset, fit):
+        rows.append(row)
+        if len(rows) == ROWS_PER_TABLE:
+            story.append(Table([COLUMNS] + rows, colWidths=widths, repeatRows=1, style=table_style))
+            rows = []
+    if rows or total == 0:
+        story.append(Table([COLUMNS] + rows, colWidths=widths, repeatRows=1, style=table_style))
+
+    doc = SimpleDocTemplate(
+        path, pagesize=A4, title=title,
+        leftMargin=10 * mm, rightMargin=10 * mm, topMargin=15 * mm, bottomMargin=15 * mm,
+    )
+    doc.build(story)
+
+
+def prune_cache(root, keep):
+    """Remove all but the ``keep`` most recently used roster files"""
+    entries = []
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.name.endswith('.pdf'):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+    entries.sort(reverse=True)
+    for _, path in entries[keep:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:  # removed by another worker
+            pass
+
+
+def roster_key(filters):
+    """The cache key of the roster for filters at the current data version"""
+    return cache_key(filters, data_version())
+
+
+def cached_roster(queryset, filters, key):
+    """
+    Return (open file, hit) for the roster PDF of queryset, rendering it
+    into the cache if there is none under key yet.
+    """
+    root = settings.ROSTER_CACHE_ROOT
+    path = os.path.join(root, f'{key}.pdf')
+    try:
+        # An open file stays readable even if another worker prunes it
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        pass
+    else:
+        os.utime(f.fileno())  # recently used, see prune_cache
+        return f, True
+
+    os.makedirs(root, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=root, suffix='.tmp')
+    os.close(fd)
+    try:
+        render_roster(tmp_path, queryset, roster_title(filters))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    f = open(path, 'rb')
+    logger.info("Rendered roster %s (%s bytes)", key, os.fstat(f.fileno()).st_size)
+    prune_cache(root, settings.ROSTER_CACHE_MAX_FILES)
+    return f, False
+
+
+def roster_response(request, f, key):
+    filename = f"nups_roster_{timezone.localdate():%Y%m%d}.pdf"
+    response = FileResponse(f, as_attachment=True, filename=filename, content_type='application/pdf')
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        response.streaming_content = aiter_sync(iter(response.streaming_content))
+    response['ETag'] = f'"{key}"'
+    return response
@@ -0,0 +1,153 @@
+"""
+Free-text search over students (``?q=``).
+
+On PostgreSQL a student matches when any of these holds:
+
+- every word of the query is a prefix of a word in the student's names,
+  e-mail, contact or place of residence (full-text search on a ``simple``
+  tsvector, so names are not stemmed)
+- the query occurs in that text (trigram-indexed LIKE, for e-mail and phone
+  fragments)
+- when nothing matches either way and the query is made of letters only,
+  every word is close to a word of the text (trigram word similarity of at
+  least SEARCH_SIMILARITY_THRESHOLD, which tolerates typos such as "Mensha"
+  for "Mensah"; digits and e-mail fragments would fuzzily match every other
+  phone number and address)
+
+Both the tsvector and the lowercased text are GIN-indexed expressions
+(migration 0007); the SQL below must stay identical to the indexed
+expressions for PostgreSQL to use them. Matches are ranked by ts_rank, or
+by word similarity for typo-tolerant matches.
+
+Other databases get a case-insensitive "every word occurs in some field"
+filter without ranking, which is enough to run the tests locally.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import StudentProfile
+
+FIELDS = ('first_name', 'last_name', 'other_name', 'email', 'contact', 'place_of_residence')
+
+# Queries shorter than this do not use the trigram conditions: trigram
+# indexes cannot narrow down one- and two-character patterns
+MIN_TRIGRAM_LENGTH = 3
+
+words = re.compile(r'\w+')
+letters_only = re.compile(r'[^\W\d_]+(\s+[^\W\d_]+)*')
+
+
+def text_sql(table=None):
+    """The searched text: every field, NULLs as '', separated by spaces"""
+    prefix = f'"{table}".' if table else ''
+    return " || ' ' || ".join(f"coalesce({prefix}\"{field}\", '')" for field in FIELDS)
+
+
+def document_sql(table=None):
+    return f"to_tsvector('simple'::regconfig, {text_sql(table)})"
+
+
+def trigram_sql(table=None):
+    return f"lower({text_sql(table)})"
+
+
+def prefix_query(q):
+    """A to_tsquery() string requiring every word of q as a prefix, or ''"""
+    return ' & '.join(f'{word}:*' for word in words.findall(q.lower()))
+
+
+def like_pattern(q):
+    escaped = q.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def is_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def exact_condition(q):
+    """(WHERE sql, params) matching q by word prefixes or as a substring"""
+    table = StudentProfile._meta.db_table
+    conditions = []
+    params = []
+    tsquery = prefix_query(q)
+    if tsquery:
+        conditions.append(f"{document_sql(table)} @@ to_tsquery('simple'::regconfig, %s)")
+        params.append(tsquery)
+    if len(q) >= MIN_TRIGRAM_LENGTH:
+        conditions.append(f"{trigram_sql(table)} LIKE %s")
+        params.append(like_pattern(q))
+    return ' OR '.join(conditions), params
+
+
+def fuzzy_words(q):
+    """The words of q to match with typo tolerance (none unless q is letters only)"""
+    if not letters_only.fullmatch(q):
+        return []
+    return [word.lower() for word in q.split() if len(word) >= MIN_TRIGRAM_LENGTH]
+
+
+def has_rows(queryset):
+    """
+    queryset.exists(), planned for every matching row. Under exists()'s
+    LIMIT 1 PostgreSQL expects a match within the first few rows and scans
+    the table instead of the search indexes, which is slowest exactly when
+    nothing matches. A materialized CTE is planned on its own.
+    """
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'WITH matches AS MATERIALIZED ({sql}) SELECT EXISTS (SELECT 1 FROM matches)', params)
+        return cursor.fetchone()[0]
+
+
+def postgres_search(queryset, q, ranked):
+    table = StudentProfile._meta.db_table
+    sql, params = exact_condition(q)
+    fuzzy = fuzzy_words(q)
+    if sql:
+        exact = queryset.filter(RawSQL(f'({sql})', params, output_field=BooleanField()))
+        # Typo tolerance is only needed when nothing matches as typed, and
+        # it is several times costlier per candidate row
+        if not fuzzy or has_rows(exact):
+            if not ranked:
+                return exact
+            tsquery = prefix_query(q)
+            if not tsquery:
+                return exact
+            rank = RawSQL(f"ts_rank({document_sql(table)}, to_tsquery('simple'::regconfig, %s))",
+                          [tsquery], output_field=FloatField())
+            return exact.annotate(search_rank=rank).order_by('-search_rank', '-created_at', '-id')
+    if not fuzzy:
+        return queryset.none()
+
+    # Every word close to a word of the text
+    sql = ' AND '.join(f"%s <%% {trigram_sql(table)}" for _ in fuzzy)
+    matches = queryset.filter(RawSQL(f'({sql})', fuzzy, output_field=BooleanField()))
+    if not ranked:
+        return matches
+    rank = RawSQL(' + '.join(f"word_similarity(%s, {trigram_sql(table)})" for _ in fuzzy),
+                  fuzzy, output_field=FloatField())
+    return matches.annotate(search_rank=rank).order_by('-search_rank', '-created_at', '-id')
+
+
+def search_students(queryset, q, ranked=True):
+    """
+    Restrict queryset to the students matching q; with ``ranked``, order
+    them best first (newest first among equals).
+    """
+    q = q.strip()
+    if not q:
+        return queryset
+    if is_postgres():
+        return postgres_search(queryset, q, ranked)
+
+    condition = Q()
+    for word in q.split():
+        matches_word = Q()
+        for field in FIELDS:
+            matches_word |= Q(**{f'{field}__icontains': word})
+        condition &= matches_word
+    return queryset.filter(condition)
@@ -0,0 +1,248 @@
+"""
+Synthetic students for benchmarks and reproducing scaling problems locally.
+
+Each student gets a program, a hall, zero to two wings and (mostly) an
+emergency contact. Programs and halls are skewed the way real ones are: the
+first of each list is the most common, the next half as common, and so on.
+Values come from a random generator seeded with the student's number, so
+the same numbers always produce the same rows however they are split
+across runs. Seeded e-mails end in ``@seed.example.com``.
+
+On PostgreSQL the rows are written with ``COPY`` (student ids are taken from
+the table's sequence up front, so contacts and wing memberships can be
+copied too) and the tables are analyzed afterwards; elsewhere they are
+written with bulk_create. Either way a million students take minutes.
+
+With ``pictures``, that many placeholder ID pictures (and renditions) are
+saved to the media storage and handed out to the students in turn.
+"""
+import datetime
+import io
+import random
+from itertools import accumulate
+
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from . import images
+from .backup import supports_copy
+from .importer import batched
+from .lookups import lookup_cache
+from .models import EmergencyContact, Hall, Program, StudentProfile, Wing
+from .programs import program_names
+
+BATCH_SIZE = 2000
+# Rows per COPY batch: one sequence query and three COPY statements each
+COPY_BATCH_SIZE = 20000
+EMAIL_DOMAIN = 'seed.example.com'
+
+PROGRAMS = [
+    'Computer Science', 'Nursing', 'Mechanical Engineering', 'Accounting', 'Law', 'Medicine',
+    'Economics', 'Architecture', 'Pharmacy', 'Civil Engineering', 'Agriculture', 'Education',
+]
+HALLS = ['Unity Hall', 'Independence Hall', 'Republic Hall', 'Queens Hall', 'Africa Hall']
+WINGS = ['Youth Wing', 'Choir', 'Ushering', 'Evangelism', 'Welfare', 'Media']
+FIRST_NAMES = [
+    'Ama', 'Kofi', 'Akosua', 'Kwame', 'Abena', 'Yaw', 'Esi', 'Kwabena', 'Afua', 'Kojo',
+    'Adwoa', 'Kwaku', 'Efua', 'Kweku', 'Yaa', 'Fiifi', 'Aba', 'Nana', 'Serwaa', 'Mensima',
+]
+LAST_NAMES = [
+    'Mensah', 'Owusu', 'Boateng', 'Asante', 'Osei', 'Agyeman', 'Appiah', 'Darko', 'Ofori', 'Addo',
+    'Amoah', 'Badu', 'Frimpong', 'Gyamfi', 'Kyei', 'Nkrumah', 'Opoku', 'Quaye', 'Sarpong', 'Tetteh',
+]
+TOWNS = ['Kumasi', 'Accra', 'Takoradi', 'Cape Coast', 'Tamale', 'Ho', 'Sunyani', 'Koforidua', 'Ayeduase', 'Bomso']
+# Number of wings a student joins, and how often
+WING_COUNTS = (0, 1, 2)
+WING_COUNT_WEIGHTS = (30, 50, 20)
+PICTURE_COLORS = ['#c7d2fe', '#fde68a', '#bbf7d0', '#fecaca', '#e9d5ff', '#bae6fd']
+
+# StudentProfile columns written by COPY, after the id
+STUDENT_FIELDS = [
+    'first_name', 'last_name', 'other_name', 'date_of_birth', 'gender', 'marital_status', 'contact',
+    'email', 'place_of_residence', 'program_id', 'hall_of_affiliation_id',
+    'id_picture', 'id_picture_medium', 'id_picture_thumbnail', 'id_picture_status',
+    'id_picture_staged', 'id_picture_error', 'created_at', 'updated_at',
+]
+
+
+class Choices:
+    """Skewed choice among ids: each is half as likely as the one before"""
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.cum_weights = list(accumulate(0.5 ** rank for rank in range(len(ids))))
+
+    def pick(self, rng):
+        return rng.choices(self.ids, cum_weights=self.cum_weights)[0]
+
+
+def seed_lookups():
+    """Create the seed programs, halls and wings that are missing; return their ids in list order"""
+    lookups = ((Program, PROGRAMS), (Hall, HALLS), (Wing, WINGS))
+    created = 0
+    for model, names in lookups:
+        existing = set(model.objects.filter(name__in=names).values_list('name', flat=True))
+        missing = [model(name=name) for name in names if name not in existing]
+        # Rows created concurrently (or a program differing only in case) are skipped
+        model.objects.bulk_create(missing, ignore_conflicts=True)
+        created += len(missing)
+    if created:
+        # bulk_create sends no post_save signals
+        lookup_cache.invalidate()
+        program_names.clear()
+    ids = []
+    for model, names in lookups:
+        by_name = dict(model.objects.filter(name__in=names).values_list('name', 'id'))
+        ids.append([by_name[name] for name in names if name in by_name])
+    return ids
+
+
+def placeholder_picture(number):
+    """A portrait-shaped PNG standing in for an uploaded ID picture"""
+    image = Image.new('RGB', (600, 800), PICTURE_COLORS[number % len(PICTURE_COLORS)])
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((180, 140, 420, 380), fill='#1e40af')
+    draw.rectangle((120, 440, 480, 800), fill='#1e40af')
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer
+
+
+def save_placeholder_pictures(count):
+    """Store ``count`` placeholders' renditions; return a {field name: stored name} dict for each"""
+    pictures = []
+    for number in range(count):
+        renditions = images.render_picture(placeholder_picture(number))
+        names = {}
+        for field_name, content in renditions.items():
+            field = StudentProfile._meta.get_field(field_name)
+            names[field_name] = field.storage.save(f'{field.upload_to}seed-{number}.jpg', ContentFile(content))
+        pictures.append(names)
+    return pictures
+
+
+def student_row(number, programs, halls, wing_ids):
+    """(field values, emergency contact (name, phone) or None, wing ids) for seed student ``number``"""
+    rng = random.Random(number)
+    first_name = rng.choice(FIRST_NAMES)
+    last_name = rng.choice(LAST_NAMES)
+    values = {
+        'first_name': first_name,
+        'last_name': last_name,
+        'other_name': rng.choice(FIRST_NAMES) if rng.random() < 0.3 else None,
+        'date_of_birth': datetime.date(1995, 1, 1) + datetime.timedelta(days=rng.randrange(3650)),
+        'gender': rng.choice(('Male', 'Female')),
+        'marital_status': 'Single' if rng.random() < 0.9 else 'Married',
+        'contact': f'0{rng.choice((20, 24, 26, 27, 50, 54, 55, 59))}{number % 10 ** 7:07d}',
+        'email': f'{first_name}.{last_name}.{number}@{EMAIL_DOMAIN}'.lower(),
+        'place_of_residence': rng.choice(TOWNS),
+        'program_id': programs.pick(rng),
+        'hall_of_affiliation_id': halls.pick(rng),
+    }
+    contact = None
+    if rng.random() < 0.8:
+        contact = (f'{rng.choice(FIRST_NAMES)} {last_name}', f'024{rng.randrange(10 ** 7):07d}')
+    wing_count = rng.choices(WING_COUNTS, WING_COUNT_WEIGHTS)[0]
+    return values, contact, rng.sample(wing_ids, min(wing_count, len(wing_ids)))
+
+
+def seeded_count():
+    return StudentProfile.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').count()
+
+
+def picture_values(number, pictures):
+    if not pictures:
+        return {}
+    return dict(pictures[number % len(pictures)], id_picture_status='ready')
+
+
+def write_batch(entries):
+    """bulk_create a batch of (values, contact, wing ids)"""
+    students = StudentProfile.objects.bulk_create([StudentProfile(**values) for values, _, _ in entries])
+    contacts = []
+    links = []
+    WingLink = StudentProfile.wings.through
+    for student, (_, contact, wing_ids) in zip(students, entries):
+        if contact is not None:
+            contacts.append(EmergencyContact(student_id=student.pk, name=contact[0], phone=contact[1]))
+        links.extend(WingLink(studentprofile_id=student.pk, wing_id=wing_id) for wing_id in wing_ids)
+    EmergencyContact.objects.bulk_create(contacts)
+    WingLink.objects.bulk_create(links)
+
+
+def copy_rows(cursor, table, columns, rows):
+    from psycopg import sql
+
+    query = sql.SQL("COPY {} ({}) FROM STDIN").format(
+        sql.Identifier(table), sql.SQL(', ').join(sql.Identifier(column) for column in columns),
+    )
+    with cursor.cursor.copy(query) as copy:
+        for row in rows:
+            copy.write_row(row)
+
+
+def copy_batch(cursor, entries):
+    """COPY a batch of (values, contact, wing ids), with ids taken from the sequence"""
+    table = StudentProfile._meta.db_table
+    cursor.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+        [table, len(entries)],
+    )
+    ids = [row[0] for row in cursor.fetchall()]
+    now = timezone.now()
+    defaults = {
+        'id_picture': None, 'id_picture_medium': None, 'id_picture_thumbnail': None,
+        'id_picture_status': 'none', 'id_picture_staged': '', 'id_picture_error': '',
+        'created_at': now, 'updated_at': now,
+    }
+    copy_rows(cursor, table, ['id'] + STUDENT_FIELDS, (
+        [student_id] + [values.get(name, defaults.get(name)) for name in STUDENT_FIELDS]
+        for student_id, (values, _, _) in zip(ids, entries)
+    ))
+    copy_rows(cursor, EmergencyContact._meta.db_table, ['student_id', 'name', 'phone', 'updated_at'], (
+        (student_id, contact[0], contact[1], now)
+        for student_id, (_, contact, _) in zip(ids, entries) if contact is not None
+    ))
+    copy_rows(cursor, StudentProfile.wings.through._meta.db_table, ['studentprofile_id', 'wing_id'], (
+        (student_id, wing_id)
+        for student_id, (_, _, wing_ids) in zip(ids, entries) for wing_id in wing_ids
+    ))
+
+
+def seed_students(count, start=None, pictures=0, use_copy=None, progress=None):
+    """
+    Add ``count`` seed students numbered from ``start`` (by default after the
+    ones already seeded), using COPY where available unless ``use_copy`` is
+    False. ``progress(done)`` is called after each batch. Returns the number
+    created.
+    """
+    if start is None:
+        start = seeded_count()
+    if use_copy is None:
+        use_copy = supports_copy()
+    program_ids, hall_ids, wing_ids = seed_lookups()
+    programs, halls = Choices(program_ids), Choices(hall_ids)
+    placeholders = save_placeholder_pictures(pictures) if pictures else []
+    done = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        for numbers in batched(range(start, start + count), COPY_BATCH_SIZE if use_copy else BATCH_SIZE):
+            entries = []
+            for number in numbers:
+                values, contact, student_wings = student_row(number, programs, halls, wing_ids)
+                values.update(picture_values(number, placeholders))
+                entries.append((values, contact, student_wings))
+            if use_copy:
+                copy_batch(cursor, entries)
+            else:
+                write_batch(entries)
+            done += len(entries)
+            if progress:
+                progress(done)
+    if use_copy:
+        # Fresh planner statistics, or the first queries plan for empty tables
+        with connection.cursor() as cursor:
+            for model in (StudentProfile, EmergencyContact, StudentProfile.wings.through):
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+    return count
@@ -1,6 +1,13 @@
 import logging
+from functools import partial
+
+from django.db import transaction
+from django.db.models.functions import Lower
 from rest_framework import serializers
+from . import uploads
+from .programs import get_or_create_program, name_key, normalize_name
 from .models import StudentProfile, Program, Hall, Wing, EmergencyContact
+from .storage_urls import image_url_cache
 
 logger = logging.getLogger(__name__)
 
@@ -9,6 +16,18 @@ class ProgramSerializer(serializers.ModelSerializer):
         model = Program
         fields = ['id', 'name']
 
+    def validate_name(self, value):
+        # Stored as the form the lookups compare, so "Computer  Science" is
+        # saved, checked and constrained as "Computer Science"
+        value = normalize_name(value)
+        # The Lower(name) unique constraint is not checked by ModelSerializer
+        programs = Program.objects.alias(name_lower=Lower('name')).filter(name_lower=name_key(value))
+        if self.instance is not None:
+            programs = programs.exclude(pk=self.instance.pk)
+        if programs.exists():
+            raise serializers.ValidationError('A program with this name already exists.')
+        return value
+
 
 class HallSerializer(serializers.ModelSerializer):
     class Meta:
@@ -28,6 +47,71 @@ class EmergencyContactSerializer(serializers.ModelSerializer):
         fields = ['name', 'phone']
 
 
+def resolve_image_url(field_file):
+    """Return the storage URL for an image field, or None when it is empty"""
+    if not field_file:
+        return None
+    try:
+        return image_url_cache.url(field_file.storage, field_file.name)
+    except Exception as e:
+        logger.error("Error getting image URL for %s: %s", field_file.name, e)
+        return str(field_file)
+
+
+def cache_related(student, wings):
+    """
+    Prime a just-created student's relations for serialization: wings from
+    the given list and, unless one is created afterwards, no emergency
+    contact. Spares the response two reads of rows this request wrote.
+    """
+    queryset = student.wings.all()
+    queryset._result_cache = list(wings)
+    queryset._prefetch_done = True
+    student._prefetched_objects_cache = {'wings': queryset}
+    StudentProfile.emergency_contact.related.set_cached_value(student, None)
+
+
+def rendition_url(instance, field_name):
+    """URL of a picture rendition, falling back to the original for pictures stored before renditions existed"""
+    return resolve_image_url(getattr(instance, field_name)) or resolve_image_url(instance.id_picture)
+
+
+class StudentProfileReadSerializer(serializers.ModelSerializer):
+    """
+    Read-only representation used by the list and retrieve endpoints.
+
+    Expects the queryset from StudentViewSet.get_queryset(), which selects and
+    prefetches every relation, so serializing a row never touches the database.
+    The output matches what StudentProfileSerializer returns for reads.
+    """
+    program = ProgramSerializer(read_only=True)
+    hall = HallSerializer(source='hall_of_affiliation', read_only=True)
+    wings = WingSerializer(many=True, read_only=True)
+    emergency_contact = EmergencyContactSerializer(read_only=True)
+    id_picture = serializers.SerializerMethodField()
+    id_picture_medium = serializers.SerializerMethodField()
+    id_picture_thumbnail = serializers.SerializerMethodField()
+
+    class Meta:
+        model = StudentProfile
+        fields = [
+            'id', 'first_name', 'last_name', 'other_name', 'date_of_birth',
+            'gender', 'marital_status', 'contact', 'email', 'emergency_contact',
+            'program', 'hall', 'place_of_residence', 'wings', 'id_picture', 'id_picture_medium',
+            'id_picture_thumbnail', 'id_picture_status', 'created_at'
+        ]
+        read_only_fields = fields
+
+    def get_id_picture(self, instance):
+        return resolve_image_url(instance.id_picture)
+
+    def get_id_picture_medium(self, instance):
+        return rendition_url(instance, 'id_picture_medium')
+
+    def get_id_picture_thumbnail(self, instance):
+        return rendition_url(instance, 'id_picture_thumbnail')
+
+
 class StudentProfileSerializer(serializers.ModelSerializer):
 
     # Accept IDs for program and hall when submitting data
@@ -53,10 +137,9 @@ class StudentProfileSerializer(serializers.ModelSerializer):
     
     # Wings: accept list of wing IDs when writing, return nested objects when reading
     wings = WingSerializer(many=True, read_only=True)
-    wing_ids = serializers.PrimaryKeyRelatedField(
-        queryset=Wing.objects.all(),
+    wing_ids = serializers.ListField(
+        child=serializers.IntegerField(),
         source='wings',
-        many=True,
         write_only=True,
         required=False
     )
@@ -68,6 +151,8 @@ class StudentProfileSerializer(serializers.ModelSerializer):
     
     # Custom ImageField that ensures full URL is returned
     id_picture = serializers.ImageField(required=False, allow_null=True)
+    id_picture_medium = serializers.SerializerMethodField()
+    id_picture_thumbnail = serializers.SerializerMethodField()
     
     def validate(self, data):
         """Custom validation to ensure either program_id or custom_program_name is provided"""
@@ -86,37 +171,25 @@ class StudentProfileSerializer(serializers.ModelSerializer):
         
         return data
     
+    def validate_wing_ids(self, value):
+        """Resolve the wing IDs with one query (PrimaryKeyRelatedField runs one per ID)"""
+        ids = list(dict.fromkeys(value))
+        wings = Wing.objects.in_bulk(ids)
+        missing = [pk for pk in ids if pk not in wings]
+        if missing:
+            raise serializers.ValidationError(f'Invalid pk "{missing[0]}" - object does not exist.')
+        return [wings[pk] for pk in ids]
+
+    def get_id_picture_medium(self, instance):
+        return rendition_url(instance, 'id_picture_medium')
+
+    def get_id_picture_thumbnail(self, instance):
+        return rendition_url(instance, 'id_picture_thumbnail')
+
     def to_representation(self, instance):
-        """Override to ensure id_picture returns full URL"""
+        """Override to return the storage URL of id_picture (full URL on Cloudinary, /media/ path locally)"""
         ret = super().to_representation(instance)
-        if instance.id_picture:
-            # Get the full URL - Cloudinary returns full URL, local returns relative
-            try:
-                # Refresh to ensure we have the latest data
-                instance.refresh_from_db()
-                image_url = instance.id_picture.url
-                logger.info(f"Image URL from instance: {image_url}")
-                logger.info(f"Image storage type: {type(instance.id_picture.storage)}")
-                
-                # If it's a relative URL but we're using Cloudinary, try to get the Cloudinary URL directly
-                if image_url.startswith('/media/') and hasattr(instance.id_picture.storage, 'url'):
-                    # Try to get the Cloudinary URL directly from storage
-                    try:
-                        cloudinary_url = instance.id_picture.storage.url(instance.id_picture.name)
-                        if cloudinary_url.startswith('http'):
-                            logger.info(f"Got Cloudinary URL from storage: {cloudinary_url}")
-                            ret['id_picture'] = cloudinary_url
-                        else:
-                            ret['id_picture'] = image_url
-                    except:
-                        ret['id_picture'] = image_url
-                else:
-                    ret['id_picture'] = image_url
-            except Exception as e:
-                logger.error(f"Error getting image URL: {e}", exc_info=True)
-                ret['id_picture'] = str(instance.id_picture) if instance.id_picture else None
-        else:
-            ret['id_picture'] = None
+        ret['id_picture'] = resolve_image_url(instance.id_picture)
         return ret
 
     class Meta:
@@ -125,90 +198,71 @@ class StudentProfileSerializer(serializers.ModelSerializer):
             'id', 'first_name', 'last_name', 'other_name', 'date_of_birth',
             'gender', 'marital_status', 'contact', 'email', 'emergency_contact', 'emergency_contact_data',
             'program', 'program_id', 'custom_program_name', 'hall', 'hall_id',
-            'place_of_residence', 'wings', 'wing_ids', 'id_picture', 'created_at'
+            'place_of_residence', 'wings', 'wing_ids', 'id_picture', 'id_picture_medium',
+            'id_picture_thumbnail', 'id_picture_status', 'created_at'
         ]
-        read_only_fields = ['program', 'hall', 'emergency_contact', 'wings']
+        read_only_fields = ['program', 'hall', 'emergency_contact', 'wings', 'id_picture_status']
 
     def create(self, validated_data):
+        """
+        Create the profile, its wings and emergency contact in one transaction.
+
+        With wings and an emergency contact this issues 3 INSERTs (profile,
+        wings through rows, contact) after the 4 validation reads (email
+        uniqueness, program, hall, wings), and serializing the result needs
+        no further query. A custom program name adds at most a lookup and an
+        insert, and none when the name is already known (see programs.py).
+        """
         try:
-            logger.info("Serializer create() called")
-            logger.info(f"Validated data keys: {list(validated_data.keys())}")
-            
             # Extract nested data
             emergency_contact_data = validated_data.pop('emergency_contact_data', None)
             wings_data = validated_data.pop('wings', [])
             custom_program_name = validated_data.pop('custom_program_name', None)
-            
-            # Handle custom program name - create or get Program if custom_program_name is provided
-            if custom_program_name and custom_program_name.strip():
-                program_name = custom_program_name.strip()
-                # Check if program exists (case-insensitive) to avoid duplicates
-                try:
-                    # Try to find existing program (case-insensitive)
-                    program = Program.objects.get(name__iexact=program_name)
-                    created = False
-                    logger.info(f"Found existing program: {program.name} (ID: {program.id})")
-                except Program.DoesNotExist:
-                    # Create new program if it doesn't exist
-                    program = Program.objects.create(name=program_name)
-                    created = True
-                    logger.info(f"Created new program: {program.name} (ID: {program.id})")
-                except Program.MultipleObjectsReturned:
-                    # If multiple found (shouldn't happen with unique constraint), get first
-                    program = Program.objects.filter(name__iexact=program_name).first()
-                    created = False
-                    logger.warning(f"Multiple programs found for '{program_name}', using first: {program.name} (ID: {program.id})")
-                
-                validated_data['program'] = program
-            elif not validated_data.get('program'):
-                # If no program_id and no custom_program_name, validation should catch this
-                validated_data['program'] = None
-            
-            logger.info(f"Creating student profile for: {validated_data.get('first_name', 'Unknown')} {validated_data.get('last_name', 'Unknown')}")
-            
-            # Create the student profile instance
-            student = StudentProfile.objects.create(**validated_data)
-            logger.info(f"Student profile created with ID: {student.id}")
-            
-            # Refresh instance to get updated Cloudinary URL (Cloudinary uploads async)
-            student.refresh_from_db()
-            
-            # Log image info after creation to debug Cloudinary URL
-            if student.id_picture:
-                try:
-                    image_url = student.id_picture.url
-                    storage_class = type(student.id_picture.storage).__name__
-                    storage_module = type(student.id_picture.storage).__module__
-                    logger.info(f"Image URL after save and refresh: {image_url}")
-                    logger.info(f"Image field name: {student.id_picture.name}")
-                    logger.info(f"Image storage: {student.id_picture.storage}")
-                    logger.info(f"Image storage class: {storage_class} from {storage_module}")
-                    
-                    # Check if it's Cloudinary storage
-                    if 'cloudinary' in storage_module.lower():
-                        logger.info("✓ Using Cloudinary storage!")
-                    else:
-                        logger.warning(f"✗ NOT using Cloudinary storage! Using {storage_class}")
-                except Exception as e:
-                    logger.error(f"Error getting image URL: {e}", exc_info=True)
-            
-            # Set ManyToMany relationships (wings)
-            if wings_data:
-                logger.info(f"Setting wings: {[w.id for w in wings_data]}")
-                student.wings.set(wings_data)
-            
-            # Create emergency contact if provided
-            if emergency_contact_data:
-                logger.info("Creating emergency contact")
-                EmergencyContact.objects.create(
-                    student=student,
-                    name=emergency_contact_data['name'],
-                    phone=emergency_contact_data['phone']
-                )
-            
-            logger.info(f"Student profile creation completed successfully: {student.id}")
+
+            # The picture is uploaded to storage in the background (see uploads.py);
+            # keep a local copy and answer without waiting for the remote upload
+            id_picture = validated_data.pop('id_picture', None)
+            if id_picture:
+                validated_data['id_picture_staged'] = uploads.stage_picture(id_picture)
+                validated_data['id_picture_status'] = 'pending'
+
+            with transaction.atomic():
+                # Handle custom program name - match an existing program case-insensitively or create it
+                if custom_program_name and custom_program_name.strip():
+                    program, created = get_or_create_program(custom_program_name)
+                    if created:
+                        logger.info("Created new program: %s (ID: %s)", program.name, program.id)
+                    validated_data['program'] = program
+                elif not validated_data.get('program'):
+                    # If no program_id and no custom_program_name, validation should catch this
+                    validated_data['program'] = None
+
+                student = StudentProfile.objects.create(**validated_data)
+
+                # A new profile has no wings yet, so insert the through rows
+                # directly: wings.set() would first read the current ones, and
+                # its m2m_changed handler would bump updated_at again
+                if wings_data:
+                    StudentProfile.wings.through.objects.bulk_create([
+                        StudentProfile.wings.through(studentprofile_id=student.pk, wing_id=wing.pk)
+                        for wing in wings_data
+                    ])
+                cache_related(student, wings_data)
+
+                if emergency_contact_data:
+                    # Assigning student also caches the contact on it
+                    EmergencyContact.objects.create(
+                        student=student,
+                        name=emergency_contact_data['name'],
+                        phone=emergency_contact_data['phone']
+                    )
+
+                if student.id_picture_status == 'pending':
+                    transaction.on_commit(partial(uploads.schedule_upload, student.pk))
+
+            logger.info("Student profile created: %s", student.id)
             return student
-            
+
         except Exception as e:
-            logger.error(f"Error in serializer create(): {str(e)}", exc_info=True)
-            raise
\ No newline at end of file
+            logger.error("Error in serializer create(): %s", e, exc_info=True)
+            raise
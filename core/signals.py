@@ -0,0 +1,52 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .lookups import lookup_cache
+from .models import Hall, Program, StudentProfile, Wing
+from .programs import program_names
+from .storage_urls import image_url_cache
+
+
+@receiver(m2m_changed, sender=StudentProfile.wings.through)
+def touch_student_on_wings_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Bump StudentProfile.updated_at when wing memberships change, so the
+    change is picked up by the next incremental backup.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # Changed from the Wing side: instance is a Wing
+        students = StudentProfile.objects.filter(pk__in=pk_set) if pk_set else None
+        if students is None:
+            return
+    else:
+        students = StudentProfile.objects.filter(pk=instance.pk)
+    students.update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=StudentProfile)
+def forget_picture_urls(sender, instance, **kwargs):
+    """Drop the cached URLs of a deleted student's pictures"""
+    for field_file in (instance.id_picture, instance.id_picture_medium, instance.id_picture_thumbnail):
+        if field_file:
+            image_url_cache.invalidate(field_file.name)
+
+
+@receiver(post_save, sender=Program)
+@receiver(post_save, sender=Hall)
+@receiver(post_save, sender=Wing)
+@receiver(post_delete, sender=Program)
+@receiver(post_delete, sender=Hall)
+@receiver(post_delete, sender=Wing)
+def invalidate_lookup_cache(sender, **kwargs):
+    """Drop the cached lookup lists when a program, hall or wing changes"""
+    lookup_cache.invalidate()
+
+
+@receiver(post_save, sender=Program)
+@receiver(post_delete, sender=Program)
+def clear_program_names(sender, **kwargs):
+    """Reload this process's program name map on next use"""
+    program_names.clear()
@@ -0,0 +1,74 @@
+"""
+Memoized storage URLs.
+
+Building a URL is not free for every storage backend: Cloudinary runs its
+SDK's URL construction (and signing, when enabled) on each call. A stored
+file keeps its URL for as long as it keeps its name, so resolved URLs are
+kept in a bounded LRU keyed by (storage, name).
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class StorageURLCache:
+    """Thread-safe LRU map of (storage, file name) -> URL with hit/miss counters"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._urls = OrderedDict()
+        self._lock = threading.Lock()
+
+    def url(self, storage, name):
+        key = (storage, name)
+        with self._lock:
+            url = self._urls.get(key)
+            if url is not None:
+                self._urls.move_to_end(key)
+                self.hits += 1
+                return url
+            self.misses += 1
+
+        # Resolve outside the lock; two threads missing together both build it
+        url = storage.url(name)
+        with self._lock:
+            self._urls[key] = url
+            self._urls.move_to_end(key)
+            while len(self._urls) > self.maxsize:
+                self._urls.popitem(last=False)
+        return url
+
+    def invalidate(self, name, storage=None):
+        """Forget the URL of ``name`` (in every storage unless one is given)"""
+        with self._lock:
+            for key in [key for key in self._urls if key[1] == name and storage in (None, key[0])]:
+                del self._urls[key]
+
+    def clear(self):
+        with self._lock:
+            self._urls.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._urls),
+                'maxsize': self.maxsize,
+            }
+
+
+image_url_cache = StorageURLCache(settings.IMAGE_URL_CACHE_SIZE)
+
+
+@receiver(setting_changed)
+def clear_on_storage_settings_change(setting, **kwargs):
+    # URLs depend on where media is served from
+    if setting in ('MEDIA_URL', 'STORAGES', 'CLOUDINARY_STORAGE'):
+        image_url_cache.clear()
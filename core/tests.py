@@ -1,3 +1,1636 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import gzip
+import importlib
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from urllib.parse import quote
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import backup, benchmarks, exports, images, importer, log, metrics, probes, programs, rosters, seeding, \
+    uploads
+from .lookups import lookup_cache
+from .storage_urls import StorageURLCache, image_url_cache
+from .models import BackupManifest, EmergencyContact, Hall, Program, StudentProfile, Wing
+from .serializers import StudentProfileReadSerializer
+
+
+def make_student(index, **extra):
+    data = {
+        'first_name': f'First{index}',
+        'last_name': f'Last{index}',
+        'date_of_birth': datetime.date(2000, 1, 1),
+        'gender': 'Male' if index % 2 else 'Female',
+        'marital_status': 'Single',
+        'contact': f'024{index:07d}',
+        'email': f'student{index}@example.com',
+        'place_of_residence': 'Kumasi',
+    }
+    data.update(extra)
+    return StudentProfile.objects.create(**data)
+
+
+class AdminAPITestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_user(
+            username='admin', password='password', is_staff=True
+        )
+        cls.program = Program.objects.create(name='Computer Science')
+        cls.hall = Hall.objects.create(name='Main Hall')
+        cls.wing = Wing.objects.create(name='Youth Wing')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+
+class StudentPaginationTests(AdminAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Several students share a created_at so the id tie-breaker is exercised
+        same_time = timezone.now()
+        self.students = [make_student(i) for i in range(7)]
+        StudentProfile.objects.filter(pk__in=[s.pk for s in self.students[2:5]]).update(created_at=same_time)
+
+    def expected_order(self):
+        return list(StudentProfile.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_unpaginated_list_is_default(self):
+        response = self.client.get('/api/students/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.data, list)
+        self.assertEqual([s['id'] for s in response.data], self.expected_order())
+
+    def test_cursor_walks_every_row_once(self):
+        seen = []
+        url = '/api/students/?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 3)
+            seen.extend(s['id'] for s in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, self.expected_order())
+
+    def test_page_size_is_capped(self):
+        response = self.client.get('/api/students/?page_size=100000')
+        self.assertEqual(response.data['page_size'], 500)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/students/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+class StudentReadPathTests(AdminAPITestCase):
+
+    def add_students(self, start, count):
+        other_hall = Hall.objects.create(name=f'Hall {start}')
+        for i in range(start, start + count):
+            student = make_student(
+                i,
+                program=self.program,
+                hall_of_affiliation=self.hall if i % 2 else other_hall,
+                id_picture=f'id_pictures/student{i}.png',
+            )
+            student.wings.add(self.wing)
+            EmergencyContact.objects.create(student=student, name=f'Parent {i}', phone='0200000000')
+
+    def test_list_query_count_is_constant(self):
+        self.add_students(0, 2)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/students/')
+        self.assertEqual(len(response.data), 2)
+
+        self.add_students(2, 20)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/students/')
+        self.assertEqual(len(response.data), 22)
+
+    def test_paginated_list_query_count_is_constant(self):
+        self.add_students(0, 12)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/students/?page_size=10')
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_read_representation(self):
+        self.add_students(0, 1)
+        student = StudentProfile.objects.get()
+        response = self.client.get(f'/api/students/{student.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['program'], {'id': self.program.pk, 'name': self.program.name})
+        self.assertEqual(response.data['wings'], [{'id': self.wing.pk, 'name': self.wing.name}])
+        self.assertEqual(response.data['emergency_contact'], {'name': 'Parent 0', 'phone': '0200000000'})
+        self.assertEqual(response.data['id_picture'], '/media/id_pictures/student0.png')
+
+    def test_missing_relations_serialize_as_null(self):
+        student = make_student(0)
+        response = self.client.get(f'/api/students/{student.pk}/')
+        self.assertIsNone(response.data['program'])
+        self.assertIsNone(response.data['hall'])
+        self.assertIsNone(response.data['emergency_contact'])
+        self.assertIsNone(response.data['id_picture'])
+        self.assertEqual(response.data['wings'], [])
+
+
+class StudentCreationTests(AdminAPITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_wing = Wing.objects.create(name='Choir')
+
+    def registration(self, **extra):
+        data = {
+            'first_name': 'Ama', 'last_name': 'Mensah', 'date_of_birth': '2001-02-03',
+            'gender': 'Female', 'marital_status': 'Single', 'contact': '0240000000',
+            'email': 'ama@example.com', 'place_of_residence': 'Kumasi',
+            'program_id': self.program.id, 'hall_id': self.hall.id,
+            'emergency_contact_data': {'name': 'Esi Mensah', 'phone': '0200000000'},
+        }
+        data.update(extra)
+        return data
+
+    def register(self, data):
+        with CaptureQueriesContext(connection) as context:
+            response = APIClient().post('/api/students/', data, format='json')
+        statements = [
+            query['sql'] for query in context.captured_queries
+            if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'BEGIN', 'COMMIT'))
+        ]
+        return response, statements
+
+    def test_query_count_is_fixed(self):
+        # 4 validation reads (email, program, hall, wings) and 3 inserts,
+        # however many wings are chosen; the response needs no query
+        for index, wing_ids in enumerate([[self.wing.id], [self.wing.id, self.other_wing.id]]):
+            response, statements = self.register(self.registration(
+                email=f'ama{index}@example.com', wing_ids=wing_ids,
+            ))
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(statements), 7, statements)
+            self.assertEqual([wing['id'] for wing in response.data['wings']], wing_ids)
+            self.assertEqual(response.data['emergency_contact']['name'], 'Esi Mensah')
+
+        student = StudentProfile.objects.get(email='ama1@example.com')
+        self.assertEqual(set(student.wings.values_list('id', flat=True)), {self.wing.id, self.other_wing.id})
+        self.assertEqual(student.emergency_contact.phone, '0200000000')
+
+    def test_without_wings_or_contact(self):
+        data = self.registration()
+        del data['emergency_contact_data']
+        response, statements = self.register(data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(statements), 4, statements)
+        self.assertEqual(response.data['wings'], [])
+        self.assertIsNone(response.data['emergency_contact'])
+
+    def test_invalid_wing(self):
+        response = APIClient().post('/api/students/', self.registration(wing_ids=[self.wing.id, 9999]), format='json')
+        self.assertNotEqual(response.status_code, 201)
+        self.assertIn('9999', response.data['error'])
+        self.assertFalse(StudentProfile.objects.exists())
+
+    def test_failure_rolls_back_the_profile(self):
+        with mock.patch.object(EmergencyContact.objects, 'create', side_effect=RuntimeError('boom')):
+            response = APIClient().post('/api/students/', self.registration(), format='json')
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(StudentProfile.objects.exists())
+
+
+class StudentFilterTests(AdminAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other_hall = Hall.objects.create(name='West Hall')
+        self.other_wing = Wing.objects.create(name='Women Wing')
+        for i in range(6):
+            student = make_student(
+                i,
+                program=self.program if i < 4 else None,
+                hall_of_affiliation=self.hall if i < 3 else self.other_hall,
+            )
+            student.wings.add(self.wing if i % 3 else self.other_wing)
+
+    def ids(self, response):
+        return sorted(s['id'] for s in response.data)
+
+    def test_filters_combine(self):
+        response = self.client.get(f'/api/students/?gender=Male&hall={self.hall.pk}')
+        expected = sorted(StudentProfile.objects.filter(gender='Male', hall_of_affiliation=self.hall)
+                          .values_list('id', flat=True))
+        self.assertEqual(self.ids(response), expected)
+
+    def test_wing_filter(self):
+        response = self.client.get(f'/api/students/?wing={self.other_wing.pk}')
+        self.assertEqual(len(response.data), 2)
+
+    def test_invalid_filter_values(self):
+        response = self.client.get('/api/students/?gender=Other&hall=abc')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('gender', response.data)
+        self.assertIn('hall', response.data)
+
+    def test_facets(self):
+        response = self.client.get('/api/students/facets/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total'], 6)
+        self.assertEqual(response.data['gender'], [
+            {'value': 'Female', 'count': 3},
+            {'value': 'Male', 'count': 3},
+        ])
+        self.assertEqual(response.data['program'], [
+            {'id': self.program.pk, 'name': self.program.name, 'count': 4},
+        ])
+        self.assertEqual(response.data['wing'], [
+            {'id': self.other_wing.pk, 'name': 'Women Wing', 'count': 2},
+            {'id': self.wing.pk, 'name': 'Youth Wing', 'count': 4},
+        ])
+
+    def test_facets_keep_own_dimension_open(self):
+        response = self.client.get(f'/api/students/facets/?hall={self.hall.pk}')
+        self.assertEqual(response.data['total'], 3)
+        # The hall facet ignores the hall filter, other facets respect it
+        self.assertEqual(sum(row['count'] for row in response.data['hall']), 6)
+        self.assertEqual(sum(row['count'] for row in response.data['gender']), 3)
+
+
+class BackupHelperTests(TestCase):
+
+    def test_sql_literal(self):
+        self.assertEqual(backup.sql_literal(None), 'NULL')
+        self.assertEqual(backup.sql_literal(True), 'TRUE')
+        self.assertEqual(backup.sql_literal(3), '3')
+        self.assertEqual(backup.sql_literal("O'Neil \\"), "'O''Neil \\'")
+        self.assertEqual(backup.sql_literal(datetime.date(2024, 1, 2)), "'2024-01-02'")
+
+    def test_cloudinary_url(self):
+        self.assertEqual(
+            backup.cloudinary_url('/media/id_pictures/soy.png', 'demo'),
+            'https://res.cloudinary.com/demo/image/upload/id_pictures/soy.png'
+        )
+        self.assertEqual(backup.cloudinary_url('https://x/y.png', 'demo'), 'https://x/y.png')
+
+    def test_iter_chunks(self):
+        lines = [f'line {i}' for i in range(1000)]
+        chunks = list(backup.iter_chunks(lines, chunk_size=100))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunks), '\n'.join(lines) + '\n')
+
+    def test_compress_chunks(self):
+        chunks = [b'BEGIN;\n', b'x' * 100000, b'COMMIT;\n']
+        compressed = b''.join(backup.compress_chunks(iter(chunks), 'gzip'))
+        self.assertEqual(gzip.decompress(compressed), b''.join(chunks))
+        self.assertEqual(list(backup.compress_chunks(iter(chunks), 'none')), chunks)
+
+    @unittest.skipIf(backup.zstandard is None, 'zstandard is not installed')
+    def test_compress_chunks_zstd(self):
+        chunks = [b'BEGIN;\n', b'x' * 100000, b'COMMIT;\n']
+        compressed = b''.join(backup.compress_chunks(iter(chunks), 'zstd'))
+        decompressed = backup.zstandard.ZstdDecompressor().decompressobj().decompress(compressed)
+        self.assertEqual(decompressed, b''.join(chunks))
+
+    def test_failure_mid_stream_ends_with_rollback(self):
+        def lines():
+            yield 'BEGIN;'
+            raise RuntimeError('connection lost')
+        content = ''.join(backup.guard_stream(lines(), 'test.sql'))
+        self.assertTrue(content.endswith('ROLLBACK;\n'))
+
+
+class BackupSchemaTests(TestCase):
+
+    def setUp(self):
+        backup._schema_cache.clear()
+
+    def test_schema_is_sorted_by_dependency(self):
+        schema = backup.read_schema()
+        tables = list(schema.tables)
+        self.assertLess(tables.index('core_program'), tables.index('core_studentprofile'))
+        self.assertLess(tables.index('core_studentprofile'), tables.index('core_emergencycontact'))
+        self.assertIn('email', schema['core_studentprofile'].column_names)
+        self.assertIn('core_hall', schema['core_studentprofile'].parents)
+
+    def test_schema_is_cached_per_migration_state(self):
+        schema = backup.read_schema()
+        # Only the applied migrations are read again
+        with self.assertNumQueries(1):
+            self.assertIs(backup.read_schema(), schema)
+        with mock.patch.object(backup, 'migration_state', return_value=frozenset({('core', '9999_new')})):
+            self.assertIsNot(backup.read_schema(), schema)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'requires the PostgreSQL catalogs')
+    def test_pg_schema_ddl(self):
+        schema = backup.read_schema()
+        table = schema['core_studentprofile']
+        self.assertIn('id', table.sequence_columns)
+        ddl = '\n'.join(backup.create_table_sql(table))
+        self.assertIn('GENERATED BY DEFAULT AS IDENTITY', ddl)
+        self.assertIn('PRIMARY KEY (id)', ddl)
+        self.assertIn('FOREIGN KEY (program_id) REFERENCES core_program(id)', ddl)
+        finalize = '\n'.join(backup.finalize_schema_sql(schema))
+        self.assertIn('core_student_created_id_idx', finalize)
+        self.assertIn("setval(pg_get_serial_sequence('\"core_studentprofile\"', 'id')", finalize)
+        # The trigram search index needs its extension on restore
+        self.assertEqual(schema.extensions, ['pg_trgm'])
+        preamble = '\n'.join(backup.backup_preamble(schema, False, 'INSERT'))
+        self.assertIn('CREATE EXTENSION IF NOT EXISTS pg_trgm;', preamble)
+
+
+class BackupViewTests(AdminAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            student = make_student(i, program=self.program, hall_of_affiliation=self.hall)
+            student.wings.add(self.wing)
+
+    def download(self, url):
+        with mock.patch.object(backup, 'BATCH_SIZE', 2), mock.patch.object(backup, 'INSERT_BATCH_SIZE', 2):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            self.assertNotIn('Content-Length', response)
+            return response, b''.join(response.streaming_content)
+
+    def test_backup_is_streamed(self):
+        response, content = self.download('/api/backup/')
+        content = content.decode()
+        self.assertEqual(content.count('INSERT INTO "core_studentprofile" '), 5)
+        self.assertEqual(content.count('INSERT INTO "core_studentprofile_wings" '), 5)
+        self.assertTrue(content.rstrip().endswith('COMMIT;'))
+        if connection.vendor == 'postgresql':
+            self.assertIn('CREATE TABLE "core_studentprofile"', content)
+            # Parents are created before the tables that reference them
+            self.assertLess(content.index('CREATE TABLE "core_program"'),
+                            content.index('CREATE TABLE "core_studentprofile"'))
+        # Parents are filled before the tables that reference them
+        self.assertLess(content.index('INSERT INTO "core_program"'),
+                        content.index('INSERT INTO "core_studentprofile"'))
+
+    def test_copy_backup_is_gzipped(self):
+        response, content = self.download('/api/backup/?format=copy')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.sql.gz', response['Content-Disposition'])
+        content = gzip.decompress(content).decode()
+        if connection.vendor == 'postgresql':
+            self.assertIn('COPY "core_studentprofile" (', content)
+            self.assertIn('\\.\n', content)
+        else:
+            # Without COPY the rows are batched into multi-row INSERTs
+            self.assertEqual(content.count('INSERT INTO "core_studentprofile" '), 3)
+        self.assertIn('student4@example.com', content)
+        self.assertTrue(content.rstrip().endswith('COMMIT;'))
+
+    def test_uncompressed_copy_backup(self):
+        response, content = self.download('/api/backup/?format=copy&compression=none')
+        self.assertEqual(response['Content-Type'], 'application/sql')
+        self.assertIn(b'student0@example.com', content)
+
+    def test_invalid_options(self):
+        self.assertEqual(self.client.get('/api/backup/?format=xml').status_code, 404)
+        response = self.client.get('/api/backup/?format=copy&compression=brotli')
+        self.assertEqual(response.status_code, 400)
+
+
+class IncrementalBackupTests(AdminAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.students = [make_student(i) for i in range(4)]
+        for student in self.students:
+            EmergencyContact.objects.create(student=student, name='Parent', phone='0200000000')
+        long_ago = timezone.now() - datetime.timedelta(days=30)
+        StudentProfile.objects.update(updated_at=long_ago)
+        EmergencyContact.objects.update(updated_at=long_ago)
+        self.since = quote((timezone.now() - datetime.timedelta(days=1)).isoformat())
+
+    def download(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_only_changed_students_are_exported(self):
+        self.students[0].first_name = 'Renamed'
+        self.students[0].save()
+        contact = self.students[1].emergency_contact
+        contact.phone = '0555555555'
+        contact.save()
+        self.students[2].wings.add(self.wing)
+
+        response, content = self.download(f'/api/backup/?since={self.since}')
+        self.assertIn('incremental', response['Content-Disposition'])
+        self.assertIn('Renamed', content)
+        self.assertIn('0555555555', content)
+        self.assertIn('student2@example.com', content)
+        self.assertNotIn('student3@example.com', content)
+        self.assertIn('ON CONFLICT ("id") DO UPDATE', content)
+        # Dependent rows are replaced for every exported student
+        self.assertIn('DELETE FROM "core_studentprofile_wings"', content)
+        self.assertIn('INSERT INTO "core_studentprofile_wings"', content)
+
+    def test_manifest_chain(self):
+        response, _ = self.download('/api/backup/')
+        manifest = response['X-Backup-Manifest']
+        self.assertEqual(BackupManifest.objects.get(pk=manifest).kind, 'full')
+        self.assertIsNotNone(BackupManifest.objects.get(pk=manifest).completed_at)
+
+        make_student(10)
+        response, content = self.download(f'/api/backup/?manifest={manifest}')
+        self.assertIn('student10@example.com', content)
+        self.assertNotIn('student0@example.com', content)
+        self.assertNotEqual(response['X-Backup-Manifest'], manifest)
+
+    def test_incomplete_manifest_is_rejected(self):
+        def cut_off(*args):
+            yield 'BEGIN;'
+            raise RuntimeError('connection lost')
+
+        with mock.patch.object(backup, 'generate_sql_backup', cut_off):
+            response, content = self.download('/api/backup/')
+        self.assertTrue(content.endswith('ROLLBACK;\n'))
+        manifest = response['X-Backup-Manifest']
+        self.assertIsNone(BackupManifest.objects.get(pk=manifest).completed_at)
+        response = self.client.get(f'/api/backup/?manifest={manifest}')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('did not complete', response.json()['error'])
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'the backup SQL is for PostgreSQL')
+    def test_reregistered_email_replays_onto_older_backup(self):
+        old_id = self.students[0].pk
+        self.students[0].delete()
+        new_id = make_student(0).pk
+        _, content = self.download(f'/api/backup/?since={self.since}')
+
+        # The database as the full backup left it: the old row still holds the e-mail
+        StudentProfile.objects.filter(pk=new_id).delete()
+        old = make_student(0, id=old_id)
+        EmergencyContact.objects.create(student=old, name='Parent', phone='0200000000')
+
+        statements = content.replace('BEGIN;', '').replace('COMMIT;', '')
+        with connection.cursor() as cursor:
+            cursor.execute(statements)
+        self.assertEqual(StudentProfile.objects.get(email='student0@example.com').pk, new_id)
+        self.assertFalse(StudentProfile.objects.filter(pk=old_id).exists())
+
+    def test_invalid_incremental_options(self):
+        self.assertEqual(self.client.get('/api/backup/?manifest=nope').status_code, 400)
+        self.assertEqual(self.client.get('/api/backup/?since=yesterday').status_code, 400)
+        response = self.client.get(f'/api/backup/?format=copy&since={self.since}')
+        self.assertEqual(response.status_code, 400)
+
+
+def make_picture(name='id.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), 'blue').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class IdPictureUploadTests(AdminAPITestCase):
+    """Uploads go to a local FileSystemStorage standing in for Cloudinary"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.media_root = media_root
+        self.staging_root = os.path.join(media_root, 'staging')
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root,
+            ID_PICTURE_STAGING_ROOT=self.staging_root,
+            ID_PICTURE_UPLOAD_RETRIES=2,
+            ID_PICTURE_UPLOAD_RETRY_DELAY=0,
+            ID_PICTURE_PROCESS_WORKERS=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def register(self):
+        data = {
+            'first_name': 'Ama', 'last_name': 'Mensah', 'date_of_birth': '2001-02-03',
+            'gender': 'Female', 'marital_status': 'Single', 'contact': '0240000000',
+            'email': 'ama@example.com', 'place_of_residence': 'Kumasi',
+            'program_id': self.program.id, 'hall_id': self.hall.id,
+            'id_picture': make_picture(),
+        }
+        with mock.patch.object(uploads.upload_pool, 'submit') as submit, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post('/api/students/', data, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return response, submit
+
+    def test_registration_does_not_wait_for_upload(self):
+        response, submit = self.register()
+        self.assertEqual(response.data['id_picture_status'], 'pending')
+        self.assertIsNone(response.data['id_picture'])
+        student = StudentProfile.objects.get(pk=response.data['id'])
+        submit.assert_called_once_with(student.pk)
+        self.assertTrue(os.path.exists(os.path.join(self.staging_root, student.id_picture_staged)))
+
+    def test_upload_moves_picture_to_storage(self):
+        response, _ = self.register()
+        self.assertTrue(uploads.upload_picture(response.data['id']))
+        student = StudentProfile.objects.get(pk=response.data['id'])
+        self.assertEqual(student.id_picture_status, 'ready')
+        self.assertEqual(student.id_picture.name, 'id_pictures/id.jpg')
+        self.assertEqual(student.id_picture_medium.name, 'id_pictures/medium/id.jpg')
+        self.assertEqual(student.id_picture_thumbnail.name, 'id_pictures/thumbnails/id.jpg')
+        for field_file in (student.id_picture, student.id_picture_medium, student.id_picture_thumbnail):
+            self.assertTrue(os.path.exists(os.path.join(self.media_root, field_file.name)))
+        self.assertEqual(os.listdir(self.staging_root), [])
+        # Already uploaded, nothing left to claim
+        self.assertFalse(uploads.upload_picture(student.pk))
+
+        detail = self.client.get(f'/api/students/{student.pk}/').data
+        self.assertEqual(detail['id_picture_status'], 'ready')
+        self.assertTrue(detail['id_picture'].endswith('/id_pictures/id.jpg'))
+        self.assertTrue(detail['id_picture_thumbnail'].endswith('/id_pictures/thumbnails/id.jpg'))
+
+    def test_upload_is_retried(self):
+        response, _ = self.register()
+        storage = StudentProfile._meta.get_field('id_picture').storage
+        real_save = storage.save
+
+        def flaky_save(*args, **kwargs):
+            if save.call_count == 1:
+                raise OSError('timeout')
+            return real_save(*args, **kwargs)
+
+        with mock.patch.object(storage, 'save', side_effect=flaky_save) as save:
+            self.assertTrue(uploads.upload_picture(response.data['id']))
+        # The failed rendition is retried, the others are saved once
+        self.assertEqual(save.call_count, 4)
+        self.assertEqual(StudentProfile.objects.get(pk=response.data['id']).id_picture_status, 'ready')
+
+    def test_upload_fails_after_retries(self):
+        response, _ = self.register()
+        storage = StudentProfile._meta.get_field('id_picture').storage
+        with mock.patch.object(storage, 'save', side_effect=OSError('timeout')) as save:
+            self.assertFalse(uploads.upload_picture(response.data['id']))
+        self.assertEqual(save.call_count, 3)
+        student = StudentProfile.objects.get(pk=response.data['id'])
+        self.assertEqual(student.id_picture_status, 'failed')
+        self.assertEqual(student.id_picture_error, 'timeout')
+
+        # Failing again is picked up by incremental backups
+        long_ago = timezone.now() - datetime.timedelta(days=1)
+        StudentProfile.objects.filter(pk=student.pk).update(updated_at=long_ago)
+        uploads.mark_failed(student.pk, 'timeout')
+        self.assertGreater(StudentProfile.objects.get(pk=student.pk).updated_at, long_ago)
+        # The staged copy is kept for a later retry
+        self.assertTrue(os.path.exists(os.path.join(self.staging_root, student.id_picture_staged)))
+
+    def test_unreadable_picture_is_not_retried(self):
+        response, _ = self.register()
+        student = StudentProfile.objects.get(pk=response.data['id'])
+        with open(os.path.join(self.staging_root, student.id_picture_staged), 'wb') as f:
+            f.write(b'not an image')
+        with self.assertLogs('core.uploads', 'WARNING'):
+            self.assertFalse(uploads.upload_picture(student.pk))
+        self.assertEqual(StudentProfile.objects.get(pk=student.pk).id_picture_status, 'invalid')
+        self.assertFalse(uploads.upload_picture(student.pk))
+        out = io.StringIO()
+        call_command('upload_pending_pictures', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Uploaded 0 of 0 ID pictures')
+
+    def test_stale_claim_is_reclaimed(self):
+        response, _ = self.register()
+        student_id = response.data['id']
+        # Claimed by a worker that died before finishing
+        StudentProfile.objects.filter(pk=student_id).update(
+            id_picture_status='uploading', updated_at=timezone.now() - datetime.timedelta(seconds=60),
+        )
+        with override_settings(ID_PICTURE_UPLOAD_CLAIM_TIMEOUT=120):
+            self.assertFalse(uploads.upload_picture(student_id))
+            call_command('upload_pending_pictures', stdout=io.StringIO())
+        self.assertEqual(StudentProfile.objects.get(pk=student_id).id_picture_status, 'uploading')
+
+        out = io.StringIO()
+        with override_settings(ID_PICTURE_UPLOAD_CLAIM_TIMEOUT=30):
+            call_command('upload_pending_pictures', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Uploaded 1 of 1 ID pictures')
+        self.assertEqual(StudentProfile.objects.get(pk=student_id).id_picture_status, 'ready')
+
+    def test_pool_is_bounded(self):
+        pool = uploads.UploadPool(workers=1, max_pending=1)
+        with mock.patch.object(uploads.UploadPool, 'executor'):
+            self.assertTrue(pool.submit(1))
+            self.assertFalse(pool.submit(2))
+
+
+class PictureRenditionTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'photo.png')
+        # A landscape photo taken with the phone rotated: EXIF orientation 6
+        image = Image.new('RGBA', (2000, 1000), (255, 0, 0, 128))
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        image.save(self.path, 'PNG', exif=exif)
+
+    def test_renditions_are_upright_and_capped(self):
+        renditions = images.render_picture(self.path)
+        sizes = {field: Image.open(io.BytesIO(content)).size for field, content in renditions.items()}
+        self.assertEqual(sizes, {
+            'id_picture': (800, 1600),
+            'id_picture_medium': (300, 600),
+            'id_picture_thumbnail': (80, 160),
+        })
+        thumbnail = Image.open(io.BytesIO(renditions['id_picture_thumbnail']))
+        self.assertEqual(thumbnail.format, 'JPEG')
+        self.assertNotIn(0x0112, thumbnail.getexif())
+
+    def test_rendering_in_process_pool(self):
+        def shutdown_pool():
+            if images._process_pool is not None:
+                images._process_pool.shutdown()
+                images._process_pool = None
+        self.addCleanup(shutdown_pool)
+        with override_settings(ID_PICTURE_PROCESS_WORKERS=1):
+            renditions = images.render_in_pool(self.path)
+        self.assertEqual(renditions, images.render_picture(self.path))
+
+    def test_rendition_name(self):
+        self.assertEqual(images.rendition_name('scan.final.PNG'), 'scan.final.jpg')
+
+
+class StorageURLCacheTests(TestCase):
+
+    def setUp(self):
+        self.storage = mock.Mock()
+        self.storage.url.side_effect = lambda name: f'https://cdn.example.com/{name}'
+
+    def test_urls_are_memoized(self):
+        cache = StorageURLCache(maxsize=10)
+        self.assertEqual(cache.url(self.storage, 'a.jpg'), 'https://cdn.example.com/a.jpg')
+        self.assertEqual(cache.url(self.storage, 'a.jpg'), 'https://cdn.example.com/a.jpg')
+        self.assertEqual(self.storage.url.call_count, 1)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 1, 'maxsize': 10})
+
+    def test_least_recently_used_is_evicted(self):
+        cache = StorageURLCache(maxsize=2)
+        cache.url(self.storage, 'a.jpg')
+        cache.url(self.storage, 'b.jpg')
+        cache.url(self.storage, 'a.jpg')
+        cache.url(self.storage, 'c.jpg')
+        self.storage.url.reset_mock()
+        cache.url(self.storage, 'a.jpg')
+        self.storage.url.assert_not_called()
+        cache.url(self.storage, 'b.jpg')
+        self.storage.url.assert_called_once_with('b.jpg')
+
+    def test_invalidate(self):
+        cache = StorageURLCache(maxsize=10)
+        other = mock.Mock()
+        other.url.return_value = '/media/a.jpg'
+        cache.url(self.storage, 'a.jpg')
+        cache.url(other, 'a.jpg')
+        cache.invalidate('a.jpg', self.storage)
+        self.assertEqual(cache.stats()['size'], 1)
+        cache.invalidate('a.jpg')
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_deleting_a_student_forgets_its_urls(self):
+        student = make_student(1, id_picture='id_pictures/1.jpg')
+        serializer = StudentProfileReadSerializer(student)
+        self.assertEqual(serializer.data['id_picture'], '/media/id_pictures/1.jpg')
+        self.assertIn('id_pictures/1.jpg', [key[1] for key in image_url_cache._urls])
+        student.delete()
+        self.assertNotIn('id_pictures/1.jpg', [key[1] for key in image_url_cache._urls])
+
+
+class LookupCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Program.objects.create(name='Computer Science')
+        Hall.objects.create(name='Main Hall')
+
+    def setUp(self):
+        # Rolled back rows of other tests may still be cached
+        lookup_cache.invalidate()
+        self.client = APIClient()
+
+    def test_repeat_requests_skip_the_database(self):
+        response = self.client.get('/api/programs/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{'id': Program.objects.get().id, 'name': 'Computer Science'}])
+        self.assertIn('no-cache', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            again = self.client.get('/api/programs/', HTTP_AUTHORIZATION='Bearer not-checked')
+        self.assertEqual(again.content, response.content)
+        self.assertEqual(again['ETag'], response['ETag'])
+
+    def test_conditional_get(self):
+        etag = self.client.get('/api/halls/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/halls/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get('/api/halls/', HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_changes_invalidate_the_cache(self):
+        etag = self.client.get('/api/wings/')['ETag']
+        wing = Wing.objects.create(name='Youth Wing')
+        response = self.client.get('/api/wings/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{'id': wing.id, 'name': 'Youth Wing'}])
+        wing.delete()
+        self.assertEqual(self.client.get('/api/wings/').json(), [])
+
+    def test_expired_entry_keeps_validators_when_unchanged(self):
+        first = self.client.get('/api/programs/')
+        with mock.patch.object(lookup_cache, 'ttl', 0):
+            second = self.client.get('/api/programs/')
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second['Last-Modified'], first['Last-Modified'])
+
+    def test_form_bootstrap(self):
+        response = self.client.get('/api/form-bootstrap/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['programs'], [{'id': Program.objects.get().id, 'name': 'Computer Science'}])
+        self.assertEqual(data['halls'], [{'id': Hall.objects.get().id, 'name': 'Main Hall'}])
+        self.assertEqual(data['wings'], [])
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=', response['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            compressed = self.client.get('/api/form-bootstrap/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertEqual(gzip.decompress(compressed.content), response.content)
+        not_modified = self.client.get('/api/form-bootstrap/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        Wing.objects.create(name='Youth Wing')
+        changed = self.client.get('/api/form-bootstrap/').json()
+        self.assertNotEqual(changed['version'], data['version'])
+        self.assertEqual([wing['name'] for wing in changed['wings']], ['Youth Wing'])
+
+
+class StudentImportTests(AdminAPITestCase):
+
+    header = ('first_name,last_name,date_of_birth,gender,marital_status,contact,email,'
+              'place_of_residence,program,hall,wings,emergency_contact_name,emergency_contact_phone\n')
+
+    def csv_row(self, index, **overrides):
+        values = {
+            'first_name': f'First{index}', 'last_name': f'Last{index}', 'date_of_birth': '2001-02-03',
+            'gender': 'Female', 'marital_status': 'Single', 'contact': f'024{index:07d}',
+            'email': f'import{index}@example.com', 'place_of_residence': 'Kumasi',
+            'program': 'computer science', 'hall': 'Main Hall', 'wings': 'Youth Wing',
+            'emergency_contact_name': 'Parent', 'emergency_contact_phone': '0200000000',
+        }
+        values.update(overrides)
+        return ','.join(values[column] for column in self.header.strip().split(',')) + '\n'
+
+    def upload(self, content, query=''):
+        upload = SimpleUploadedFile('students.csv', content.encode(), content_type='text/csv')
+        return self.client.post(f'/api/students/import/{query}', {'file': upload}, format='multipart')
+
+    def test_csv_import(self):
+        content = self.header + self.csv_row(1) + self.csv_row(2, program='Nursing', wings='') \
+            + self.csv_row(3, wings=f'{self.wing.id}; Youth Wing', emergency_contact_name='', emergency_contact_phone='')
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(response.data['programs_created'], 1)
+        first = StudentProfile.objects.get(email='import1@example.com')
+        self.assertEqual(first.program, self.program)
+        self.assertEqual(first.hall_of_affiliation, self.hall)
+        self.assertEqual(list(first.wings.all()), [self.wing])
+        self.assertEqual(first.emergency_contact.name, 'Parent')
+        self.assertEqual(StudentProfile.objects.get(email='import2@example.com').program.name, 'Nursing')
+        third = StudentProfile.objects.get(email='import3@example.com')
+        self.assertEqual(third.wings.count(), 1)
+        self.assertFalse(EmergencyContact.objects.filter(student=third).exists())
+
+    def test_errors_are_reported_per_row(self):
+        make_student(9, email='import9@example.com')
+        content = self.header + self.csv_row(1) + self.csv_row(2, gender='Other', hall='Unknown Hall') \
+            + self.csv_row(3, email='import1@example.com') + self.csv_row(9)
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['created'], 0)
+        errors = {error['row']: error['errors'] for error in response.data['errors']}
+        self.assertEqual(set(errors), {2, 3, 4})
+        self.assertIn('gender', errors[2])
+        self.assertIn('email', errors[3])
+        self.assertIn('email', errors[4])
+        self.assertEqual(StudentProfile.objects.count(), 1)
+
+        partial = self.upload(content, '?partial=true')
+        self.assertEqual(partial.status_code, 201)
+        self.assertEqual(partial.data['created'], 1)
+        self.assertTrue(StudentProfile.objects.filter(email='import1@example.com').exists())
+
+    def test_concurrent_duplicate_is_reported(self):
+        build_batch = importer.build_batch
+
+        def registered_meanwhile(*args):
+            entries = build_batch(*args)
+            # Registered after the batch's e-mails were checked
+            make_student(2, email='import2@example.com')
+            return entries
+
+        content = self.header + self.csv_row(1) + self.csv_row(2) + self.csv_row(3)
+        with mock.patch.object(importer, 'build_batch', registered_meanwhile):
+            response = self.upload(content, '?partial=true')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['errors'], [
+            {'row': 2, 'errors': {'email': 'A student with this email already exists.'}},
+        ])
+        self.assertEqual(StudentProfile.objects.filter(email__startswith='import').count(), 3)
+        self.assertEqual(EmergencyContact.objects.count(), 2)
+
+    def test_hall_errors_after_field_validation(self):
+        response = self.upload(self.header + self.csv_row(1, hall='Unknown Hall', wings='Nope'))
+        self.assertEqual(response.data['errors'][0]['errors'].keys(), {'hall', 'wings'})
+
+    def test_json_body_and_dry_run(self):
+        rows = [{
+            'first_name': 'Kofi', 'last_name': 'Boateng', 'date_of_birth': '2000-05-06', 'gender': 'Male',
+            'marital_status': 'Married', 'contact': '0241111111', 'email': 'kofi@example.com',
+            'place_of_residence': 'Accra', 'program_id': self.program.id, 'hall_id': self.hall.id,
+            'wings': [self.wing.id],
+        }]
+        response = self.client.post('/api/students/import/?dry_run=true', rows, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 1)
+        self.assertFalse(StudentProfile.objects.exists())
+        response = self.client.post('/api/students/import/', rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(StudentProfile.objects.get().wings.get(), self.wing)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def count_queries(size):
+            rows = list(importer.read_csv(io.BytesIO(
+                (self.header + ''.join(self.csv_row(size * 100 + i) for i in range(size))).encode()
+            )))
+            with CaptureQueriesContext(connection) as context:
+                result = importer.import_students(rows)
+            self.assertEqual(result.created, size)
+            return len(context.captured_queries)
+        self.assertEqual(count_queries(5), count_queries(50))
+
+    def test_management_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'cohort.json')
+        with open(path, 'w') as f:
+            f.write(
+                '{"students": [{"first_name": "Esi", "last_name": "Owusu", "date_of_birth": "2002-01-01",'
+                ' "gender": "Female", "marital_status": "Single", "contact": "0242222222",'
+                ' "email": "esi@example.com", "place_of_residence": "Kumasi", "program": "Computer Science",'
+                ' "hall": "main hall", "emergency_contact": {"name": "Mother", "phone": "0203333333"}}]}'
+            )
+        out = io.StringIO()
+        call_command('import_students', path, stdout=out)
+        self.assertIn('Imported 1 of 1 students', out.getvalue())
+        self.assertEqual(StudentProfile.objects.get().emergency_contact.phone, '0203333333')
+        with self.assertRaises(CommandError):
+            call_command('import_students', path, stdout=io.StringIO(), stderr=io.StringIO())
+
+
+class StudentExportTests(AdminAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other_hall = Hall.objects.create(name='Annex')
+        for i in range(4):
+            student = make_student(i, program=self.program, hall_of_affiliation=self.hall if i < 3 else self.other_hall)
+            if i % 2:
+                student.wings.add(self.wing)
+                EmergencyContact.objects.create(student=student, name=f'Parent{i}', phone='0200000000')
+
+    def download(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_export(self):
+        response, content = self.download('/api/students/export/')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('.csv"', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(content.decode())))
+        self.assertEqual(len(rows), 4)
+        by_email = {row['email']: row for row in rows}
+        self.assertEqual(by_email['student1@example.com']['wings'], 'Youth Wing')
+        self.assertEqual(by_email['student1@example.com']['emergency_contact_name'], 'Parent1')
+        self.assertEqual(by_email['student0@example.com']['emergency_contact_name'], '')
+        self.assertEqual(by_email['student3@example.com']['hall'], 'Annex')
+
+    def test_filtered_ndjson_export(self):
+        _, content = self.download(f'/api/students/export/?format=ndjson&hall={self.hall.id}&wing={self.wing.id}')
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([row['email'] for row in rows], ['student1@example.com'])
+        self.assertEqual(rows[0]['wings'], ['Youth Wing'])
+        self.assertEqual(rows[0]['date_of_birth'], '2000-01-01')
+
+    @unittest.skipIf(exports.openpyxl is None, 'openpyxl is not installed')
+    def test_xlsx_export(self):
+        response, content = self.download('/api/students/export/?format=xlsx&gender=Male')
+        self.assertIn('.xlsx"', response['Content-Disposition'])
+        sheet = exports.openpyxl.load_workbook(io.BytesIO(content)).active
+        rows = list(sheet.values)
+        self.assertEqual(list(rows[0]), exports.COLUMNS)
+        self.assertEqual(sorted(row[8] for row in rows[1:]), ['student1@example.com', 'student3@example.com'])
+
+    @unittest.skipIf(exports.openpyxl is None, 'openpyxl is not installed')
+    def test_xlsx_export_drops_control_characters(self):
+        make_student(9, first_name='Ama\x1b[31m', gender='Female')
+        _, content = self.download('/api/students/export/?format=xlsx&gender=Female')
+        sheet = exports.openpyxl.load_workbook(io.BytesIO(content)).active
+        first_names = [row[1] for row in list(sheet.values)[1:]]
+        self.assertIn('Ama[31m', first_names)
+
+    def test_csv_export_escapes_formulas(self):
+        make_student(9, first_name='=HYPERLINK("http://example.com")', last_name='@SUM(A1)', gender='Female')
+        _, content = self.download('/api/students/export/?gender=Female')
+        rows = csv.DictReader(io.StringIO(content.decode()))
+        row = next(row for row in rows if row['email'] == 'student9@example.com')
+        self.assertEqual(row['first_name'], '\'=HYPERLINK("http://example.com")')
+        self.assertEqual(row['last_name'], "'@SUM(A1)")
+        self.assertEqual(row['place_of_residence'], 'Kumasi')
+
+    @unittest.skipIf(exports.openpyxl is None, 'openpyxl is not installed')
+    def test_xlsx_export_writes_formulas_as_text(self):
+        make_student(9, first_name='=1+2', last_name='-5', gender='Female')
+        _, content = self.download('/api/students/export/?format=xlsx&gender=Female')
+        sheet = exports.openpyxl.load_workbook(io.BytesIO(content)).active
+        row = next(row for row in sheet.iter_rows(min_row=2) if row[8].value == 'student9@example.com')
+        self.assertEqual((row[1].value, row[1].data_type), ('=1+2', 's'))
+        self.assertEqual((row[2].value, row[2].data_type), ('-5', 's'))
+
+    def test_query_count_is_constant(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                self.download('/api/students/export/?format=ndjson')
+            return len(context.captured_queries)
+        queries = count_queries()
+        for i in range(10, 30):
+            make_student(i, program=self.program).wings.add(self.wing)
+        self.assertEqual(count_queries(), queries)
+
+    def test_invalid_filter(self):
+        self.assertEqual(self.client.get('/api/students/export/?hall=abc').status_code, 400)
+        self.assertEqual(self.client.get('/api/students/export/?format=pdf').status_code, 404)
+
+
+
+
+class ProgramResolutionTests(AdminAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Rolled back rows of other tests may still be in the map
+        programs.program_names.clear()
+
+    def test_case_insensitive_match(self):
+        program, created = programs.get_or_create_program('  computer   SCIENCE ')
+        self.assertEqual((program, created), (self.program, False))
+        program, created = programs.get_or_create_program('Nursing  Science')
+        self.assertTrue(created)
+        self.assertEqual(program.name, 'Nursing Science')
+        self.assertEqual(programs.get_or_create_program('NURSING SCIENCE'), (program, False))
+
+    def test_known_names_need_no_query(self):
+        programs.get_or_create_program('Computer Science')
+        with self.assertNumQueries(0):
+            self.assertEqual(programs.get_or_create_program('computer science')[0], self.program)
+
+    def test_concurrent_create_returns_winner(self):
+        # Another request inserts the name between our lookup and our insert
+        real_by_keys = programs.by_keys
+        calls = []
+
+        def by_keys(keys):
+            calls.append(keys)
+            if len(calls) == 1:
+                Program.objects.create(name='Public Health')
+                return {}
+            return real_by_keys(keys)
+
+        with mock.patch.object(programs, 'by_keys', by_keys):
+            program, created = programs.get_or_create_program('public health')
+        self.assertFalse(created)
+        self.assertEqual(program.name, 'Public Health')
+        self.assertEqual(Program.objects.filter(name__iexact='public health').count(), 1)
+
+    def test_unique_regardless_of_case(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Program.objects.create(name='COMPUTER SCIENCE')
+        response = self.client.post('/api/programs/', {'name': 'computer science'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_names_are_normalized_on_save(self):
+        response = self.client.post('/api/programs/', {'name': 'Computer  Science'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/programs/', {'name': '  Nursing   Science '}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Program.objects.get(pk=response.data['id']).name, 'Nursing Science')
+        self.assertEqual(programs.get_or_create_program('nursing science')[0].pk, response.data['id'])
+
+    def test_stored_names_are_normalized(self):
+        migration = importlib.import_module('core.migrations.0012_normalize_program_names')
+        spaced = Program.objects.create(name='computer  science')
+        student = make_student(0, program=spaced)
+        migration.normalize_program_names(django_apps, None)
+        [program] = Program.objects.filter(name__iexact='computer science')
+        self.assertEqual((program.pk, program.name), (spaced.pk, 'computer science'))
+        self.assertEqual(StudentProfile.objects.get(pk=student.pk).program_id, spaced.pk)
+
+    def test_registration_reuses_program(self):
+        data = {
+            'first_name': 'Ama', 'last_name': 'Mensah', 'date_of_birth': '2001-02-03',
+            'gender': 'Female', 'marital_status': 'Single', 'contact': '0240000000',
+            'email': 'ama@example.com', 'place_of_residence': 'Kumasi',
+            'custom_program_name': 'computer science', 'hall_id': self.hall.id,
+        }
+        response = APIClient().post('/api/students/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['program']['id'], self.program.id)
+        self.assertEqual(Program.objects.count(), 1)
+
+class StudentSearchTests(AdminAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.kofi = make_student(1, first_name='Kofi', last_name='Mensah', email='kofi.mensah@example.com',
+                                 contact='0241234567', place_of_residence='Ayeduase', hall_of_affiliation=self.hall)
+        self.ama = make_student(2, first_name='Ama', last_name='Owusu', other_name='Kofiwa',
+                                place_of_residence='Bomso')
+        self.yaw = make_student(3, first_name='Yaw', last_name='Boateng', place_of_residence='Kotei')
+
+    def search(self, query, **params):
+        response = self.client.get('/api/students/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results'] if isinstance(response.data, dict) else response.data
+        return [row['email'] for row in results]
+
+    def test_name_search(self):
+        self.assertEqual(self.search('kofi mensah'), [self.kofi.email])
+        self.assertEqual(self.search('BOATENG'), [self.yaw.email])
+        self.assertEqual(self.search('nobody'), [])
+
+    def test_prefix_and_fragment_search(self):
+        self.assertEqual(self.search('Ayed'), [self.kofi.email])
+        self.assertEqual(self.search('1234567'), [self.kofi.email])
+        self.assertEqual(self.search('mensah@example'), [self.kofi.email])
+
+    def test_search_with_filters_and_facets(self):
+        self.assertEqual(self.search('kofi', hall=self.hall.id), [self.kofi.email])
+        facets = self.client.get('/api/students/facets/', {'q': 'kofi'}).data
+        self.assertEqual(facets['total'], 2)
+
+    def test_paginated_search_is_one_page(self):
+        response = self.client.get('/api/students/', {'q': 'o', 'page_size': 1})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+    def test_typo_tolerance_and_ranking(self):
+        self.assertEqual(self.search('Mensha'), [self.kofi.email])
+        self.assertEqual(self.search('Boatang'), [self.yaw.email])
+        # Paginated, through the async list (the typo check queries up front)
+        self.assertEqual(self.search('Mensha', page_size=10), [self.kofi.email])
+        # A whole-word name match ranks above a longer name starting with it
+        self.assertEqual(self.search('kofi'), [self.kofi.email, self.ama.email])
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+    def test_search_uses_indexes(self):
+        from . import search
+        queryset = search.search_students(StudentProfile.objects.all(), 'mensah', ranked=False)
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertIn('core_student_search_idx', plan)
+        self.assertIn('core_student_trgm_idx', plan)
+
+@unittest.skipUnless(rosters.available(), 'reportlab is not installed')
+class RosterPDFTests(AdminAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_root)
+        self.cache_root = cache_root
+        settings_override = override_settings(ROSTER_CACHE_ROOT=cache_root, ROSTER_CACHE_MAX_FILES=3)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        lookup_cache.invalidate()
+        self.students = [make_student(i, program=self.program, hall_of_affiliation=self.hall) for i in range(3)]
+        self.students[0].wings.add(self.wing)
+
+    def download(self, url='/api/students/roster/'):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        return response, b''.join(response.streaming_content)
+
+    def test_roster_is_rendered_once(self):
+        with mock.patch.object(rosters, 'render_roster', wraps=rosters.render_roster) as render:
+            response, content = self.download()
+            self.assertTrue(content.startswith(b'%PDF'))
+            self.assertEqual(render.call_count, 1)
+            with CaptureQueriesContext(connection) as context:
+                repeat, repeat_content = self.download()
+            self.assertEqual(render.call_count, 1)
+        self.assertEqual(repeat_content, content)
+        self.assertEqual(repeat['ETag'], response['ETag'])
+        # The data version aggregate only
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual(len(os.listdir(self.cache_root)), 1)
+
+    def test_version_follows_student_changes(self):
+        etags = [self.download()[0]['ETag']]
+        student = self.students[1]
+        student.contact = '0559999999'
+        student.save()
+        etags.append(self.download()[0]['ETag'])
+        student.wings.add(self.wing)
+        etags.append(self.download()[0]['ETag'])
+        student.delete()
+        etags.append(self.download()[0]['ETag'])
+        self.program.name = 'Computing'
+        self.program.save()
+        etags.append(self.download()[0]['ETag'])
+        self.assertEqual(len(set(etags)), len(etags))
+        # Older files beyond ROSTER_CACHE_MAX_FILES are pruned
+        self.assertEqual(len(os.listdir(self.cache_root)), 3)
+
+    def test_filters_have_their_own_roster(self):
+        all_etag = self.download()[0]['ETag']
+        wing_etag = self.download(f'/api/students/roster/?wing={self.wing.id}&gender=Female')[0]['ETag']
+        self.assertNotEqual(all_etag, wing_etag)
+        self.assertEqual(self.client.get('/api/students/roster/?hall=abc').status_code, 400)
+
+    def test_not_modified(self):
+        etag = self.download()[0]['ETag']
+        response = self.client.get('/api/students/roster/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_title(self):
+        self.assertEqual(rosters.roster_title({}), 'All Registered Members')
+        title = rosters.roster_title({'gender': 'Female', 'wings__id': self.wing.id, 'program_id': self.program.id})
+        self.assertEqual(title, 'All Female Members in Youth Wing studying Computer Science')
+
+
+class RequestMetricsTests(AdminAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.metrics_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.metrics_root)
+        settings_override = override_settings(METRICS_ROOT=self.metrics_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        metrics.metrics.clear()
+        self.addCleanup(metrics.metrics.clear)
+
+    def merged(self):
+        metrics.metrics.flush(force=True)
+        return metrics.merge(metrics.read_snapshots(self.metrics_root))
+
+    def test_requests_are_recorded(self):
+        make_student(0, program=self.program).wings.add(self.wing)
+        response = self.client.get('/api/students/')
+        self.client.get('/api/students/')
+        stats = self.merged()[0][('studentprofile-list', 'GET', '200')]
+        self.assertEqual(sum(stats['latency'][:-1]), 2)
+        self.assertEqual(stats['queries'][-1], 4)
+        self.assertGreater(stats['db_seconds'], 0)
+        self.assertEqual(stats['size'][-1], 2 * len(response.content))
+
+        self.assertEqual(self.client.get('/api/nothing-here/').status_code, 404)
+        self.assertIn(('unmatched', 'GET', '404'), self.merged()[0])
+
+    def test_streamed_size_is_counted_when_sent(self):
+        response = self.client.get('/api/students/export/')
+        stats = self.merged()[0][('studentprofile-export', 'GET', '200')]
+        self.assertEqual(sum(stats['latency'][:-1]), 1)
+        self.assertEqual(sum(stats['size'][:-1]), 0)
+        content = b''.join(response.streaming_content)
+        stats = self.merged()[0][('studentprofile-export', 'GET', '200')]
+        self.assertEqual(sum(stats['size'][:-1]), 1)
+        self.assertEqual(stats['size'][-1], len(content))
+
+    def test_flush_is_off_the_request_thread(self):
+        written = threading.Event()
+        threads = []
+
+        def write(root):
+            threads.append(threading.current_thread())
+            written.set()
+
+        with override_settings(METRICS_FLUSH_INTERVAL=0), \
+                mock.patch.object(metrics.metrics, 'write', side_effect=write):
+            self.client.get('/api/students/')
+            self.assertTrue(written.wait(5))
+        self.assertNotEqual(threads[0], threading.current_thread())
+
+    def test_workers_are_summed(self):
+        self.client.get('/api/students/')
+        other = metrics.Metrics()
+        other.collectors.append(metrics.cache_samples)
+        other.record(('studentprofile-list', 'GET', '200'), latency=0.2, queries=3, db_seconds=0.1, size=100)
+        snapshot = other.snapshot()
+        # Another running worker (pid 1 is always running)
+        with open(os.path.join(self.metrics_root, '1-0.json'), 'w') as f:
+            json.dump(dict(snapshot, pid=1), f)
+        # The file of a worker that has exited is dropped
+        exited = os.path.join(self.metrics_root, 'exited.json')
+        with open(exited, 'w') as f:
+            json.dump(dict(snapshot, pid=2 ** 22 + 1), f)
+
+        requests, samples = self.merged()
+        stats = requests[('studentprofile-list', 'GET', '200')]
+        self.assertEqual(sum(stats['latency'][:-1]), 2)
+        # No students: one query, no wings to prefetch
+        self.assertEqual(stats['queries'][-1], 1 + 3)
+        own = image_url_cache.stats()
+        self.assertEqual(samples['nups_image_url_cache_hits_total'][2], 2 * own['hits'])
+        self.assertEqual(samples['nups_image_url_cache_entries'][2], 2 * own['size'])
+        self.assertFalse(os.path.exists(exited))
+
+    def test_reused_pid_replaces_older_file(self):
+        metrics.metrics.flush(force=True)
+        [own] = os.listdir(self.metrics_root)
+        self.assertRegex(own, rf'^{os.getpid()}-[0-9a-f]+\.json$')
+        # Left by an earlier process that had this pid
+        earlier = os.path.join(self.metrics_root, f'{os.getpid()}-0.json')
+        with open(earlier, 'w') as f:
+            json.dump(metrics.metrics.snapshot(), f)
+        os.utime(earlier, (0, 0))
+        self.assertEqual(len(metrics.read_snapshots(self.metrics_root)), 1)
+        self.assertEqual(os.listdir(self.metrics_root), [own])
+
+    def test_endpoint(self):
+        self.client.get('/api/students/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        text = response.content.decode()
+        labels = 'view="studentprofile-list",method="GET",status="200"'
+        self.assertIn('# TYPE nups_http_request_duration_seconds histogram', text)
+        self.assertIn(f'nups_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1', text)
+        self.assertIn(f'nups_http_request_duration_seconds_count{{{labels}}} 1', text)
+        self.assertIn(f'nups_http_request_db_queries_sum{{{labels}}} 1', text)
+        self.assertIn('# TYPE nups_image_url_cache_hits_total counter', text)
+
+    @unittest.skipUnless(connection.settings_dict['OPTIONS'].get('pool'), 'requires DB_POOL on PostgreSQL')
+    def test_pool_samples(self):
+        self.client.get('/api/students/')
+        samples = {name: value for name, _, _, value in metrics.pool_samples()}
+        # The test case's transaction holds a connection throughout
+        self.assertGreaterEqual(samples['nups_db_pool_connections_in_use'], 1)
+        self.assertGreaterEqual(samples['nups_db_pool_connections'], samples['nups_db_pool_connections_in_use'])
+        self.assertGreaterEqual(samples['nups_db_pool_checkouts_total'], 1)
+        self.assertEqual(samples['nups_db_pool_timeouts_total'], 0)
+
+    def test_no_pool_samples_without_a_pool(self):
+        with mock.patch.dict(connection.settings_dict['OPTIONS']):
+            connection.settings_dict['OPTIONS'].pop('pool', None)
+            self.assertEqual(metrics.pool_samples(), [])
+
+    def test_endpoint_is_staff_only(self):
+        self.assertEqual(APIClient().get('/metrics').status_code, 401)
+        user = get_user_model().objects.create_user(username='member', password='password')
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertEqual(client.get('/metrics').status_code, 403)
+
+
+class BenchmarkTests(TestCase):
+
+    def test_seeding_is_reproducible(self):
+        seeding.seed_students(5)
+        seeding.seed_students(3)
+        self.assertEqual(seeding.seeded_count(), 8)
+        first = list(StudentProfile.objects.order_by('email').values_list('email', 'program__name', 'contact'))
+        wing_links = StudentProfile.wings.through.objects.count()
+        contacts = EmergencyContact.objects.count()
+
+        StudentProfile.objects.all().delete()
+        seeding.seed_students(8)
+        self.assertEqual(
+            list(StudentProfile.objects.order_by('email').values_list('email', 'program__name', 'contact')), first
+        )
+        self.assertEqual(StudentProfile.wings.through.objects.count(), wing_links)
+        self.assertEqual(EmergencyContact.objects.count(), contacts)
+        self.assertEqual(Program.objects.count(), len(seeding.PROGRAMS))
+
+    @unittest.skipUnless(backup.supports_copy(), 'COPY needs PostgreSQL with psycopg 3')
+    def test_copy_matches_bulk_create(self):
+        def seeded():
+            return (
+                list(StudentProfile.objects.order_by('email').values_list(
+                    'email', 'first_name', 'other_name', 'date_of_birth', 'program__name', 'hall_of_affiliation__name',
+                    'emergency_contact__phone', 'id_picture_status',
+                )),
+                sorted(StudentProfile.wings.through.objects.values_list('studentprofile__email', 'wing__name')),
+            )
+        seeding.seed_students(30, use_copy=False)
+        expected = seeded()
+        StudentProfile.objects.all().delete()
+        seeding.seed_students(30, use_copy=True)
+        self.assertEqual(seeded(), expected)
+        # Ids came from the sequence, so later inserts do not collide
+        make_student(1000)
+
+    def test_management_command(self):
+        out = io.StringIO()
+        call_command('seed_students', count=12, stdout=out)
+        self.assertIn('Seeded 12 students', out.getvalue())
+        self.assertEqual(seeding.seeded_count(), 12)
+        with self.assertRaises(CommandError):
+            call_command('seed_students', count=0, stdout=io.StringIO())
+
+    def test_placeholder_pictures(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            seeding.seed_students(3, pictures=2)
+            students = list(StudentProfile.objects.order_by('email'))
+            self.assertEqual({student.id_picture_status for student in students}, {'ready'})
+            self.assertEqual(len({student.id_picture.name for student in students}), 2)
+            for field_name in images.RENDITIONS:
+                field_file = getattr(students[0], field_name)
+                self.assertTrue(field_file.storage.exists(field_file.name))
+
+    def test_summarize(self):
+        summary = benchmarks.summarize([ms / 1000 for ms in range(1, 101)])
+        self.assertEqual(summary['requests'], 100)
+        self.assertEqual(summary['p50_ms'], 50.5)
+        self.assertEqual(summary['p95_ms'], 95.05)
+        self.assertEqual(summary['max_ms'], 100)
+        self.assertAlmostEqual(summary['throughput'], 100 / 5.05, places=1)
+
+    def test_compare(self):
+        def report(p50, p95, queries):
+            return {'results': [{'size': 100, 'endpoint': 'list', 'p50_ms': p50, 'p95_ms': p95, 'queries': queries}]}
+        baseline = report(10, 20, 2)
+        self.assertEqual(benchmarks.compare(report(11, 19, 2), baseline), [])
+        # Within the noise floor, however large in percent
+        self.assertEqual(benchmarks.compare(report(0.5, 1, 2), report(0.2, 0.5, 2)), [])
+        regressions = benchmarks.compare(report(15, 20, 3), baseline)
+        self.assertEqual([(r['metric'], r['change']) for r in regressions], [('p50_ms', 50.0), ('queries', 50.0)])
+        self.assertEqual(benchmarks.compare(report(15, 20, 2), baseline, threshold=60), [])
+
+    def test_run(self):
+        report = benchmarks.run(sizes=[4, 2], endpoints=['list_page', 'retrieve', 'create', 'backup'], iterations=2)
+        self.assertEqual(report['options']['sizes'], [2, 4])
+        self.assertEqual([(r['size'], r['endpoint']) for r in report['results'][:4]],
+                         [(2, 'list_page'), (2, 'retrieve'), (2, 'create'), (2, 'backup')])
+        create = report['results'][2]
+        self.assertEqual(create['requests'], 3)
+        self.assertGreater(create['queries'], 0)
+        # Students registered by the create benchmark are removed again
+        self.assertEqual(StudentProfile.objects.count(), 4)
+        json.dumps(report)
+
+    def test_run_concurrent(self):
+        bench = benchmarks.Benchmark(APIClient())
+        result = asyncio.run(benchmarks.run_concurrent(
+            get_asgi_application(), bench, benchmarks.CONCURRENT_ENDPOINTS['health'], 6, 3, headers=[],
+        ))
+        self.assertEqual(result['requests'], 6)
+        self.assertGreaterEqual(result['threads'], 1)
+        self.assertIn('threads', benchmarks.format_result(dict(result, size=0, endpoint='health')))
+
+
+class LoggingTests(TestCase):
+    def record(self, name='core.views', level=logging.INFO, msg='Served %s', args=('list',), **kwargs):
+        return logging.LogRecord(name, level, __file__, 1, msg, args, None, **kwargs)
+
+    def test_json_formatter(self):
+        record = self.record()
+        record.student_id = 7
+        try:
+            raise ValueError('bad row')
+        except ValueError:
+            record.exc_info = sys.exc_info()
+        entry = json.loads(log.JSONFormatter().format(record))
+        self.assertEqual(entry['level'], 'INFO')
+        self.assertEqual(entry['logger'], 'core.views')
+        self.assertEqual(entry['message'], 'Served list')
+        self.assertEqual(entry['student_id'], 7)
+        self.assertIn('ValueError: bad row', entry['exception'])
+        self.assertTrue(entry['time'].endswith('+00:00'))
+
+    def test_sampling_keeps_a_share_below_warning(self):
+        sampling = log.SamplingFilter({'core.views': 0.1, 'core.views.quiet': 0})
+        kept = [sampling.filter(self.record()) for _ in range(100)]
+        self.assertEqual(sum(kept), 10)
+        self.assertEqual(sampling.dropped, 90)
+        self.assertTrue(all(sampling.filter(self.record(level=logging.WARNING)) for _ in range(5)))
+        self.assertFalse(sampling.filter(self.record('core.views.quiet')))
+        # Loggers without a rate of their own or of a parent keep everything
+        self.assertTrue(all(sampling.filter(self.record('core.viewsets')) for _ in range(5)))
+
+    def test_queue_handler_writes_in_the_background(self):
+        stream = io.StringIO()
+        writers = []
+        target = logging.StreamHandler(stream)
+        target.addFilter(lambda record: writers.append(threading.current_thread()) or True)
+        target.setFormatter(log.JSONFormatter())
+        handler = log.QueueHandler([target])
+        handler.start()
+        logger = logging.getLogger('core.tests.queue')
+        logger.addHandler(handler)
+        logger.propagate = False
+        try:
+            items = ['a']
+            logger.warning('Items: %s', items)
+            items.append('b')
+        finally:
+            logger.removeHandler(handler)
+            handler.stop()
+        entry = json.loads(stream.getvalue())
+        # Formatted with the arguments as they were at the call
+        self.assertEqual(entry['message'], "Items: ['a']")
+        self.assertEqual(entry['thread'], threading.current_thread().name)
+        self.assertEqual(len(writers), 1)
+        self.assertIsNot(writers[0], threading.current_thread())
+
+    def test_full_queue_drops_records(self):
+        handler = log.QueueHandler([logging.NullHandler()], size=1)
+        handler.handle(self.record())
+        handler.handle(self.record())
+        self.assertEqual(handler.dropped, 1)
+
+    def test_configure_queues_the_handlers(self):
+        self.assertTrue(log.queue_handlers)
+        for name in ('', 'core'):
+            self.assertEqual(logging.getLogger(name).handlers, log.queue_handlers[:1])
+        self.assertIsInstance(log.queue_handlers[0].handlers[0], logging.StreamHandler)
+
+
+class AsyncViewTests(AdminAPITestCase):
+    """The async views, served as under ASGI"""
+
+    def setUp(self):
+        super().setUp()
+        self.student = make_student(0, program=self.program)
+        self.student.wings.add(self.wing)
+        self.async_client = AsyncClient()
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.admin)}'}
+
+    def test_views_are_coroutines(self):
+        for path in ('/api/students/', '/api/students/1/', '/api/programs/', '/api/user-info/', '/api/health/'):
+            self.assertTrue(iscoroutinefunction(resolve(path).func), path)
+
+    async def test_list_and_retrieve(self):
+        response = await self.async_client.get('/api/students/', {'page_size': 10}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        [row] = response.json()['results']
+        self.assertEqual(row['program']['name'], 'Computer Science')
+        self.assertEqual(row['wings'], [{'id': self.wing.id, 'name': 'Youth Wing'}])
+
+        response = await self.async_client.get(f'/api/students/{self.student.id}/', headers=self.headers)
+        self.assertEqual(response.json(), row)
+        response = await self.async_client.get('/api/students/999999/', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get('/api/students/', {'gender': 'Other'}, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_authentication(self):
+        response = await self.async_client.get(f'/api/students/{self.student.id}/')
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get('/api/user-info/', headers={'Authorization': 'Bearer nonsense'})
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get('/api/user-info/', headers=self.headers)
+        self.assertEqual(response.json()['username'], 'admin')
+
+    async def test_lookups_and_health(self):
+        response = await self.async_client.get('/api/programs/')
+        self.assertEqual(response.json(), [{'id': self.program.id, 'name': 'Computer Science'}])
+        response = await self.async_client.get(f'/api/halls/{self.hall.id}/')
+        self.assertEqual(response.json(), {'id': self.hall.id, 'name': 'Main Hall'})
+        response = await self.async_client.get('/api/health/')
+        self.assertEqual(response.json()['status'], 'healthy')
+
+    async def test_sync_actions_still_work(self):
+        response = await self.async_client.post('/api/halls/', {'name': 'New Hall'}, headers=self.headers,
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        response = await self.async_client.get('/api/students/facets/', headers=self.headers)
+        self.assertEqual(response.json()['total'], 1)
+
+    async def test_queries_are_counted(self):
+        metrics_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metrics_root)
+        metrics.metrics.clear()
+        self.addCleanup(metrics.metrics.clear)
+        with override_settings(METRICS_ROOT=metrics_root):
+            await self.async_client.get(f'/api/students/{self.student.id}/', headers=self.headers)
+            requests, _ = metrics.merge([metrics.metrics.snapshot()])
+        # The user, the student with its relations, its wings
+        self.assertEqual(requests[('studentprofile-detail', 'GET', '200')]['queries'][-1], 3)
+
+
+class ProbeTests(TestCase):
+
+    def setUp(self):
+        probes.readiness.clear()
+        self.addCleanup(probes.readiness.clear)
+
+    def call(self, application, path, method='GET'):
+        scope = {'type': 'http', 'method': method, 'path': path, 'headers': []}
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(application(scope, receive, send))
+        return messages
+
+    def test_liveness_is_answered_before_django(self):
+        django_application = mock.AsyncMock()
+        application = probes.LivenessProbe(django_application, ['/health/'])
+
+        start, body = self.call(application, '/health/')
+        self.assertEqual(start['status'], 200)
+        self.assertEqual(json.loads(body['body'])['status'], 'healthy')
+        _, body = self.call(application, '/health/', 'HEAD')
+        self.assertEqual(body['body'], b'')
+        django_application.assert_not_called()
+
+        self.call(application, '/health/', 'POST')
+        self.call(application, '/api/students/')
+        self.assertEqual(django_application.await_count, 2)
+
+    def test_readiness(self):
+        response = self.client.get('/ready/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'status': 'ready', 'checks': {'database': 'ok', 'storage': 'ok'}})
+        self.assertEqual(response['Cache-Control'], 'no-store')
+
+    def test_readiness_is_cached(self):
+        runs = probes.readiness.runs
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(3):
+                self.client.get('/ready/')
+        self.assertEqual(probes.readiness.runs, runs + 1)
+        self.assertEqual(len(queries), 1)
+
+        readiness = probes.Readiness(0)
+        readiness.check()
+        readiness.check()
+        self.assertEqual(readiness.runs, 2)
+
+    def test_readiness_failure(self):
+        def unreachable():
+            raise OSError('connection refused')
+
+        with mock.patch.dict(probes.CHECKS, {'database': unreachable}), \
+                self.assertLogs('core.probes', 'ERROR') as logs:
+            response = self.client.get('/ready/')
+        self.assertEqual(response.status_code, 503)
+        # The error is logged, not sent back
+        self.assertEqual(response.json()['checks'], {'database': 'failed', 'storage': 'ok'})
+        self.assertNotIn('connection refused', response.content.decode())
+        self.assertIn('connection refused', logs.output[0])
+
+    def test_readiness_checks_the_picture_storage(self):
+        storage = mock.Mock(location=None)
+        storage.exists.side_effect = ConnectionError('cloudinary unreachable')
+        field = StudentProfile._meta.get_field('id_picture')
+        with mock.patch.object(field, 'storage', storage), self.assertLogs('core.probes', 'ERROR'):
+            response = self.client.get('/ready/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['checks'], {'database': 'ok', 'storage': 'failed'})
+        storage.exists.assert_called_once()
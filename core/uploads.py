@@ -0,0 +1,179 @@
+"""
+Background upload of student ID pictures.
+
+Registration writes the picture to a local staging directory, marks the
+profile "pending" and returns. Once the transaction commits, the upload is
+handed to a small thread pool that resizes the picture (images.py), saves
+the renditions through the id_picture storage (Cloudinary in production),
+retries failures with exponential backoff and records the outcome in
+``StudentProfile.id_picture_status``.
+
+The pool lives in the web process. Uploads that do not make it through (the
+queue was full, the process restarted, every retry failed) stay pending or
+failed and are picked up by ``manage.py upload_pending_pictures``. A row
+left "uploading" by a process that died mid-upload is treated the same once
+its claim is older than ID_PICTURE_UPLOAD_CLAIM_TIMEOUT seconds. A staged
+file that is missing or not a readable image would fail the same way every
+time; it is marked "invalid" instead and left alone.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from . import images
+from .models import StudentProfile
+from .storage_urls import image_url_cache
+
+logger = logging.getLogger(__name__)
+
+
+def staging_storage():
+    return FileSystemStorage(location=settings.ID_PICTURE_STAGING_ROOT)
+
+
+def stage_picture(uploaded_file):
+    """Write an uploaded picture to the staging directory and return its name"""
+    return staging_storage().save(os.path.basename(uploaded_file.name), uploaded_file)
+
+
+def mark_failed(student_id, error, status="failed"):
+    StudentProfile.objects.filter(pk=student_id).update(
+        id_picture_status=status, id_picture_error=str(error)[:1000], updated_at=timezone.now()
+    )
+
+
+def claimable(statuses=("pending", "failed")):
+    """
+    Rows in ``statuses``, or claimed for upload longer ago than the claim
+    timeout: the process uploading them is taken to have died. The claim
+    time is the row's updated_at, set when claiming.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.ID_PICTURE_UPLOAD_CLAIM_TIMEOUT)
+    return Q(id_picture_status__in=statuses) | Q(id_picture_status="uploading", updated_at__lt=stale)
+
+
+def upload_picture(student_id):
+    """
+    Resize a student's staged picture and upload the renditions to storage.
+
+    Returns True once every rendition is stored. The row is claimed by
+    switching it to "uploading", so a picture is not processed twice
+    concurrently unless the claim has gone stale (see claimable()).
+    """
+    claimed = StudentProfile.objects.filter(claimable(), pk=student_id).update(
+        id_picture_status="uploading", updated_at=timezone.now()
+    )
+    if not claimed:
+        return False
+
+    student = StudentProfile.objects.get(pk=student_id)
+    staging = staging_storage()
+    try:
+        renditions = images.render_in_pool(staging.path(student.id_picture_staged))
+    except Exception as e:
+        # Not worth retrying: the staged file is missing or not a readable image.
+        # "invalid" is left out of claimable(), so it is not picked up again
+        logger.warning("Could not process ID picture for student %s: %s", student_id, e)
+        mark_failed(student_id, e, status="invalid")
+        return False
+
+    name = images.rendition_name(student.id_picture_staged)
+    stored = {}
+    attempts = settings.ID_PICTURE_UPLOAD_RETRIES + 1
+    for attempt in range(1, attempts + 1):
+        try:
+            for field_name, content in renditions.items():
+                if field_name not in stored:
+                    field_file = getattr(student, field_name)
+                    field_file.save(name, ContentFile(content), save=False)
+                    stored[field_name] = field_file.name
+                    # The name may belong to a file deleted earlier
+                    image_url_cache.invalidate(field_file.name)
+            break
+        except Exception as e:
+            logger.warning("Upload of ID picture for student %s failed (attempt %s/%s): %s",
+                           student_id, attempt, attempts, e)
+            if attempt == attempts:
+                mark_failed(student_id, e)
+                return False
+            time.sleep(settings.ID_PICTURE_UPLOAD_RETRY_DELAY * 2 ** (attempt - 1))
+
+    StudentProfile.objects.filter(pk=student_id).update(
+        **stored,
+        id_picture_status="ready",
+        id_picture_staged="",
+        id_picture_error="",
+        updated_at=timezone.now(),
+    )
+    try:
+        staging.delete(student.id_picture_staged)
+    except OSError as e:
+        logger.warning("Could not remove staged picture %s: %s", student.id_picture_staged, e)
+    logger.info("Uploaded ID picture for student %s: %s", student_id, stored['id_picture'])
+    return True
+
+
+class UploadPool:
+    """
+    Bounded pool of upload threads.
+
+    At most ``max_pending`` uploads are queued or running at once; submit()
+    refuses further work instead of letting the queue grow without limit.
+    The executor is created on first use so it is never inherited across a
+    fork of the server process.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="id-picture-upload"
+                )
+            return self._executor
+
+    def submit(self, student_id):
+        """Queue an upload; returns False when the pool is full"""
+        if not self.slots.acquire(blocking=False):
+            return False
+        try:
+            self.executor.submit(self._run, student_id)
+        except RuntimeError:  # interpreter shutting down
+            self.slots.release()
+            return False
+        return True
+
+    def _run(self, student_id):
+        try:
+            upload_picture(student_id)
+        except Exception:
+            logger.exception("Unexpected error uploading ID picture for student %s", student_id)
+        finally:
+            self.slots.release()
+            # Each worker thread holds its own database connection
+            connection.close()
+
+
+upload_pool = UploadPool(settings.ID_PICTURE_UPLOAD_WORKERS, settings.ID_PICTURE_UPLOAD_QUEUE_SIZE)
+
+
+def schedule_upload(student_id):
+    """Hand a pending picture to the upload pool (call after commit)"""
+    if not upload_pool.submit(student_id):
+        logger.warning("Upload queue is full; ID picture for student %s stays pending", student_id)
@@ -3,7 +3,7 @@ from django.urls import path
 
 from . import admin
 from .views import StudentViewSet, ProgramViewSet, HallViewSet, WingViewSet, health_check, backup_database, \
-    get_user_info
+    get_user_info, form_bootstrap
 
 router = DefaultRouter()
 router.register(r'students', StudentViewSet)
@@ -16,4 +16,5 @@ urlpatterns = [
     path('health/', health_check, name='health_check'),
     path('backup/', backup_database, name='backup_database'),
     path('user-info/', get_user_info, name='user-info'),
+    path('form-bootstrap/', form_bootstrap, name='form_bootstrap'),
 ] + router.urls
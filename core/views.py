@@ -1,43 +1,118 @@
+import csv
+import hashlib
 import logging
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.mixins import CreateModelMixin, ListModelMixin, RetrieveModelMixin
-from rest_framework.permissions import AllowAny
+from rest_framework.decorators import action, api_view, permission_classes, renderer_classes
+from rest_framework.mixins import CreateModelMixin, ListModelMixin
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
+from . import exports, importer, metrics, rosters
+from .async_views import AsyncAPIView, AsyncRetrieveModelMixin, AsyncViewSetMixin
+from .backup import CopyBackupRenderer, SQLBackupRenderer
+from .filters import StudentFilterBackend
+from .lookups import cached_json_response, lookup_cache
 from .models import Program, Hall, StudentProfile, Wing
-from .serializers import ProgramSerializer, HallSerializer, StudentProfileSerializer, WingSerializer
+from .pagination import StudentCursorPagination
+from .probes import liveness_payload, readiness
+from .serializers import ProgramSerializer, HallSerializer, StudentProfileSerializer, WingSerializer, \
+    StudentProfileReadSerializer
 
 logger = logging.getLogger(__name__)
 
 
-class ProgramViewSet(viewsets.ModelViewSet):
+class CachedListMixin:
+    """
+    Serve list requests for a lookup table from the process-wide lookup
+    cache, with ETag/Last-Modified validators (see lookups.py).
+    """
+
+    async def aperform_authentication(self, request):
+        # Lists are public: skip the JWT user lookup so a cached response
+        # needs no database access at all
+        if self.action != 'list':
+            await super().aperform_authentication(request)
+
+    async def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return await sync_to_async(super().list)(request, *args, **kwargs)
+
+        async def build():
+            rows = [row async for row in await self.afilter_queryset(self.get_queryset())]
+            return self.get_serializer(rows, many=True).data
+
+        payload = await lookup_cache.aget(self.basename, build)
+        # Browsers revalidate on every use and get a 304 while nothing changed
+        return cached_json_response(request, payload, no_cache=True)
+
+
+class ProgramViewSet(CachedListMixin, AsyncRetrieveModelMixin, AsyncViewSetMixin, viewsets.ModelViewSet):
     queryset = Program.objects.all()
     serializer_class = ProgramSerializer
     permission_classes = [AllowAny]
 
 
-class HallViewSet(viewsets.ModelViewSet):
+class HallViewSet(CachedListMixin, AsyncRetrieveModelMixin, AsyncViewSetMixin, viewsets.ModelViewSet):
     queryset = Hall.objects.all()
     serializer_class = HallSerializer
     permission_classes = [AllowAny]
 
 
-class StudentViewSet(CreateModelMixin, ListModelMixin, RetrieveModelMixin, GenericViewSet):
+class StudentViewSet(AsyncRetrieveModelMixin, AsyncViewSetMixin, CreateModelMixin, ListModelMixin, GenericViewSet):
     """
     Student profile endpoints:
     - POST /api/students/ - Submit student profile (public)
     - GET /api/students/ - List all students (admin - for retrieving all submissions)
+    - GET /api/students/?page_size=50 - Cursor-paginated list, follow "next" for more
+    - GET /api/students/?gender=&hall=&program=&wing= - Filtered list
+    - GET /api/students/?q= - Search, best matches first
+    - GET /api/students/facets/ - Per-value counts for each filter (admin)
+    - GET /api/students/export/?format=csv|ndjson|xlsx - Streamed export, same filters (admin)
+    - GET /api/students/roster/ - Roster PDF, same filters, cached on the server (admin)
+    - POST /api/students/import/ - Bulk import from CSV/JSON (admin)
     - GET /api/students/{id}/ - Get single student (admin)
     """
-    queryset = StudentProfile.objects.all().order_by('-created_at')  # Newest first
+    queryset = StudentProfile.objects.all().order_by('-created_at', '-id')  # Newest first
     serializer_class = StudentProfileSerializer
+    pagination_class = StudentCursorPagination
+    filter_backends = [StudentFilterBackend]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve', 'export', 'roster'):
+            # Load every relation the read serializer touches up front:
+            # one query for the rows plus one for the wings, however many rows
+            queryset = queryset.select_related(
+                'program', 'hall_of_affiliation', 'emergency_contact'
+            ).prefetch_related('wings')
+        return queryset
+
+    async def list(self, request, *args, **kwargs):
+        if not self.paginator.is_requested(request):
+            # Every student: too much to serialize without holding up the
+            # event loop, so the whole list is built in a thread
+            return await sync_to_async(super().list)(request, *args, **kwargs)
+        queryset = await self.afilter_queryset(self.get_queryset())
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'retrieve'):
+            return StudentProfileReadSerializer
+        return super().get_serializer_class()
 
     def get_permissions(self):
         """
@@ -49,26 +124,102 @@ class StudentViewSet(CreateModelMixin, ListModelMixin, RetrieveModelMixin, Gener
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Counts per gender, hall, program and wing for the current filters"""
+        return Response(StudentFilterBackend().get_facets(request, self.get_queryset()))
+
+    @action(detail=False, methods=['get'], renderer_classes=[
+        JSONRenderer, exports.CSVExportRenderer, exports.NDJSONExportRenderer, exports.XLSXExportRenderer,
+    ])
+    def export(self, request):
+        """
+        Stream the (filtered) member list as ?format=csv (default), ndjson or xlsx.
+        Takes the same gender/hall/program/wing filters as the list.
+        """
+        export_format = request.query_params.get('format', 'csv')
+        if export_format == 'xlsx' and exports.openpyxl is None:
+            return Response({'error': 'XLSX export requires openpyxl.'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.filter_queryset(self.get_queryset())
+        logger.info("Exporting members as %s", export_format)
+        return exports.streaming_export_response(request, queryset, export_format)
+
+    @action(detail=False, methods=['get'])
+    def roster(self, request):
+        """
+        The (filtered) member list as a PDF. Takes the same filters as the
+        list; a roster is rendered once per filter set and data version and
+        then served from disk (see rosters.py).
+        """
+        if not rosters.available():
+            return Response({'error': 'Roster PDFs require reportlab.'}, status=status.HTTP_400_BAD_REQUEST)
+        backend = StudentFilterBackend()
+        filters = backend.get_filters(request)
+        if backend.get_search(request):
+            filters['search'] = backend.get_search(request)
+        key = rosters.roster_key(filters)
+        not_modified = get_conditional_response(request, etag=f'"{key}"')
+        if not_modified is not None:
+            return not_modified
+        queryset = self.filter_queryset(self.get_queryset())
+        f, hit = rosters.cached_roster(queryset, filters, key)
+        logger.info("Serving roster %s (cached: %s)", key, hit)
+        return rosters.roster_response(request, f, key)
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser, JSONParser])
+    def bulk_import(self, request):
+        """
+        Import students from an uploaded CSV/JSON "file" or a JSON list body.
+
+        ?partial=true imports the valid rows even if others fail;
+        ?dry_run=true validates without saving. See importer.py for the
+        row format.
+        """
+        partial = request.query_params.get('partial') == 'true'
+        dry_run = request.query_params.get('dry_run') == 'true'
+        upload = request.FILES.get('file')
+        if upload is not None:
+            file_format = request.data.get('format') or importer.detect_format(upload.name)
+            if file_format not in importer.FORMATS:
+                return Response({'error': 'Upload a .csv or .json file, or pass format=csv|json.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            rows = importer.read_rows(upload, file_format)
+        elif isinstance(request.data, list):
+            rows = (importer.clean_row(row) if isinstance(row, dict) else row for row in request.data)
+        else:
+            return Response({'error': 'Send a "file" upload or a JSON list of students.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            result = importer.import_students(rows, partial=partial, dry_run=dry_run)
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            return Response({'error': f'Could not read the file: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        logger.info("Student import: %s rows, %s created, %s errors",
+                    result.total, result.created, len(result.errors))
+
+        if result.errors and not partial:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif result.created and not dry_run:
+            response_status = status.HTTP_201_CREATED
+        else:
+            response_status = status.HTTP_200_OK
+        return Response(result.as_dict(), status=response_status)
+
     def create(self, request, *args, **kwargs):
         """Override create to add detailed error logging"""
         try:
-            logger.info(f"Creating student profile. Data keys: {list(request.data.keys())}")
-            logger.info(f"Has file: {'id_picture' in request.FILES}")
+            logger.debug("Creating student profile. Data keys: %s, has file: %s",
+                         request.data.keys(), 'id_picture' in request.FILES)
             
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
-            
-            logger.info("Serializer is valid, saving...")
             self.perform_create(serializer)
             
             headers = self.get_success_headers(serializer.data)
-            logger.info(f"Student profile created successfully: {serializer.data.get('id')}")
             return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
             
         except Exception as e:
-            logger.error(f"Error creating student profile: {str(e)}", exc_info=True)
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.error("Error creating student profile: %s", e, exc_info=True)
             return Response(
                 {'error': str(e), 'detail': 'Failed to create student profile'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -77,35 +228,67 @@ class StudentViewSet(CreateModelMixin, ListModelMixin, RetrieveModelMixin, Gener
     def perform_create(self, serializer):
         # save member profile
         try:
-            logger.info("Saving student profile...")
             student = serializer.save()
-            logger.info(f"Student profile saved successfully. ID: {student.id}, Email: {student.email}")
+            logger.debug("Student profile saved. ID: %s, Email: %s", student.id, student.email)
         except Exception as e:
-            logger.error(f"Error in perform_create: {str(e)}", exc_info=True)
+            logger.error("Error in perform_create: %s", e, exc_info=True)
             raise  # Re-raise to be caught by create() method
 
 
 
 
-class WingViewSet(viewsets.ModelViewSet):
+class WingViewSet(CachedListMixin, AsyncRetrieveModelMixin, AsyncViewSetMixin, viewsets.ModelViewSet):
     queryset = Wing.objects.all()
     serializer_class = WingSerializer
     permission_classes = [AllowAny]
 
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def get_user_info(request):
+async def form_bootstrap_data():
+    lists = {
+        'programs': ProgramSerializer([row async for row in Program.objects.order_by('name', 'id')], many=True).data,
+        'halls': HallSerializer([row async for row in Hall.objects.order_by('name', 'id')], many=True).data,
+        'wings': WingSerializer([row async for row in Wing.objects.order_by('name', 'id')], many=True).data,
+    }
+    # Derived from the content, so every worker reports the same version
+    version = hashlib.sha256(JSONRenderer().render(lists)).hexdigest()[:16]
+    return {'version': version, **lists}
+
+
+@require_safe
+async def form_bootstrap(request):
+    """
+    Everything the registration form needs before it can render, in one
+    request: {"version": ..., "programs": [...], "halls": [...], "wings": [...]}.
+
+    A plain async Django view (public and cached, so DRF's authentication
+    and content negotiation would only add work). The gzipped payload is built
+    once per lookup cache version; clients may reuse it for
+    LOOKUP_CACHE_TTL seconds and for a day while revalidating.
+    """
+    payload = await lookup_cache.aget('form-bootstrap', form_bootstrap_data, compress=True)
+    return cached_json_response(
+        request, payload,
+        public=True, max_age=settings.LOOKUP_CACHE_TTL, stale_while_revalidate=24 * 60 * 60,
+    )
+
+
+class UserInfoView(AsyncAPIView):
     """Get detailed information about the currently authenticated user"""
-    user = request.user
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request):
+        user = request.user
+
+        return Response({
+            'id': user.id,
+            'username': user.username,
+            'is_staff': user.is_staff,
+            'is_superuser': user.is_superuser,
+        }, status=200)
+
 
-    return Response({
-        'id': user.id,
-        'username': user.username,
-        'is_staff': user.is_staff,
-        'is_superuser': user.is_superuser,
-    }, status=200)
+get_user_info = UserInfoView.as_view()
 
 
 
@@ -124,489 +307,128 @@ def get_user_info(request):
 
 
 
-@api_view(['GET'])
-@permission_classes([AllowAny])
-def health_check(request):
+@require_safe
+async def health_check(request):
     """
     Health check endpoint to keep Render service awake.
     To be pinged by external service UptimeRobot
     every 5 minutes to prevent the service from sleeping.
+
+    A plain async view: it needs neither the database nor a worker thread.
+    Under ASGI the request is answered before it gets here (core/probes.py).
     """
-    return Response({
-        'status': 'healthy',
-        'service': 'NUPS API',
-        'timestamp': timezone.now().isoformat(),
-        'message': 'Service is running'
-    }, status=200)
+    return JsonResponse(liveness_payload(), status=200)
 
 
+@require_safe
+async def readiness_check(request):
+    """
+    Whether this worker can serve requests: the database answers and the
+    picture storage can be reached. 503 otherwise, naming the failed check
+    but not its error (which is logged). The outcome is cached for
+    READINESS_CACHE_TTL seconds (core/probes.py).
+    """
+    ready, checks = await sync_to_async(readiness.check)()
+    response = JsonResponse({
+        'status': 'ready' if ready else 'unavailable',
+        'checks': checks,
+    }, status=200 if ready else 503)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def prometheus_metrics(request):
+    """
+    Request latency, database use and response sizes of every worker, in the
+    Prometheus text format (see metrics.py). Staff only; scrape it with the
+    access token of a staff user as bearer token.
+    """
+    return HttpResponse(metrics.exposition(), content_type=metrics.CONTENT_TYPE)
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, SQLBackupRenderer, CopyBackupRenderer])
 def backup_database(request):
     """
     Create a complete SQL backup from Render (production).
     Images are stored in Cloudinary, so only SQL is backed up.
     Image URLs remain accessible after restore.
 
-    GET /api/backup/ - Download SQL backup file
+    The file is streamed as it is generated, so the download starts right
+    away and memory use stays flat however large the tables are.
+
+    GET /api/backup/ - Download SQL backup file (one INSERT per row)
+    GET /api/backup/?format=copy - Fast backup using COPY, gzip-compressed
+    GET /api/backup/?format=copy&compression=zstd - Same, zstd-compressed
+    GET /api/backup/?manifest=<id> - Incremental backup of the changes since
+        an earlier backup (or ?since=<ISO timestamp>)
+
+    ?compression= accepts none, gzip or zstd for either format. Restore a
+    compressed file with e.g. ``gunzip -c backup.sql.gz | psql -d database_name``.
+
+    Every backup is recorded as a BackupManifest; its ID and watermark are
+    returned in the X-Backup-Manifest and X-Backup-Watermark headers. The
+    manifest is marked complete once the last chunk is streamed, and only a
+    complete manifest is accepted by ?manifest=.
     """
-    from django.http import HttpResponse
-    from django.db import connection
-    from django.conf import settings
-    import datetime as dt
     from datetime import datetime as dt_class
+    from . import backup
+    from .models import BackupManifest
+
+    backup_format = request.query_params.get('format', 'sql')
+    compression = request.query_params.get('compression', 'gzip' if backup_format == 'copy' else 'none')
+    error = backup.check_options(backup_format, compression)
+    if error:
+        return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+    since = None
+    since_param = request.query_params.get('since')
+    manifest_param = request.query_params.get('manifest')
+    incremental = bool(since_param or manifest_param)
+    if incremental:
+        if backup_format != 'sql':
+            return Response({'error': "Incremental backups are only available with format=sql."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        since, error = backup.parse_since(since_param, manifest_param)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        sql_content = ["-- NUPS Database Complete Backup", f"-- Generated: {dt_class.now().isoformat()}",
-                       "-- Database: PostgreSQL", "-- ============================================",
-                       "-- STORAGE CONFIGURATION", "-- ============================================"]
-
-        # ============================================
-        # STORAGE CONFIGURATION INFO
-        # ============================================
-
-        # Check storage configuration
-        use_cloudinary = getattr(settings, 'USE_CLOUDINARY', False)
-        storage_backend = getattr(settings, 'DEFAULT_FILE_STORAGE',
-                                  'django.core.files.storage.FileSystemStorage')
-
-        # Convert storage backend to string
-        if hasattr(storage_backend, '__name__'):
-            storage_backend_str = storage_backend.__name__
-        elif hasattr(storage_backend, '__class__'):
-            storage_backend_str = storage_backend.__class__.__name__
-        else:
-            storage_backend_str = str(storage_backend)
-
-        # Determine if using Cloudinary
-        is_cloudinary = use_cloudinary
-        if not is_cloudinary and isinstance(storage_backend_str, str):
-            is_cloudinary = 'cloudinary' in storage_backend_str.lower()
-
-        if is_cloudinary:
-            sql_content.append("-- STORAGE: Cloudinary (Production)")
-            sql_content.append("-- Images are stored in Cloudinary cloud storage")
-            sql_content.append("-- Image URLs will remain accessible after restore")
-
-            # Add Cloudinary config
-            cloudinary_config = getattr(settings, 'CLOUDINARY_STORAGE', {})
-            if cloudinary_config:
-                cloud_name = cloudinary_config.get('CLOUD_NAME', 'dtm2fwxth')
-                sql_content.append(f"-- Cloud Name: {cloud_name}")
-                sql_content.append(f"-- Image URLs format: https://res.cloudinary.com/{cloud_name}/image/upload/...")
-        else:
-            sql_content.append("-- STORAGE: Local (Development)")
-            sql_content.append(f"-- Storage backend: {storage_backend_str}")
-            sql_content.append("-- WARNING: Images are stored locally and NOT included in this backup")
-            sql_content.append("-- To backup images, manually copy the 'media' folder")
-
-        sql_content.append("-- ============================================")
-        sql_content.append("")
-
-        sql_content.append("-- This backup includes schema (CREATE TABLE) and data (INSERT)")
-        sql_content.append("-- Restore using: psql -d database_name < backup.sql")
-        sql_content.append("")
-        sql_content.append("BEGIN;")
-        sql_content.append("")
-
-        # ============================================
-        # PART 1: Generate CREATE TABLE statements
-        # ============================================
-        sql_content.append("-- ============================================")
-        sql_content.append("-- SCHEMA: Table Definitions")
-        sql_content.append("-- ============================================")
-        sql_content.append("")
-
-        # Get all tables and order them to respect dependencies
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                           SELECT table_name
-                           FROM information_schema.tables
-                           WHERE table_schema = 'public'
-                             AND table_name LIKE 'core_%'
-                           ORDER BY table_name;
-                           """)
-            all_tables = [row[0] for row in cursor.fetchall()]
-
-            # We need to sort tables so parent tables come before child tables
-            # Get foreign key dependencies
-            table_dependencies = {}
-            for table in all_tables:
-                cursor.execute(f"""
-                    SELECT
-                        ccu.table_name AS parent_table
-                    FROM information_schema.table_constraints AS tc
-                    JOIN information_schema.key_column_usage AS kcu
-                        ON tc.constraint_name = kcu.constraint_name
-                    JOIN information_schema.constraint_column_usage AS ccu
-                        ON ccu.constraint_name = tc.constraint_name
-                    WHERE tc.constraint_type = 'FOREIGN KEY'
-                        AND tc.table_schema = 'public'
-                        AND tc.table_name = '{table}';
-                """)
-                parents = [row[0] for row in cursor.fetchall()]
-                table_dependencies[table] = parents
-
-            # Sort tables by dependencies (topological sort)
-            sorted_tables = []
-            temp_marked = set()
-            perm_marked = set()
-
-            def visit(table):
-                if table in perm_marked:
-                    return
-                if table in temp_marked:
-                    raise ValueError(f"Circular dependency detected with table {table}")
-
-                temp_marked.add(table)
-                for parent in table_dependencies.get(table, []):
-                    if parent in all_tables:  # Only consider core_ tables
-                        visit(parent)
-                temp_marked.remove(table)
-                perm_marked.add(table)
-                sorted_tables.append(table)
-
-            for table in all_tables:
-                if table not in perm_marked:
-                    visit(table)
-
-            # Create tables in dependency order
-            for table_name in sorted_tables:
-                sql_content.append(f"-- Table: {table_name}")
-                sql_content.append(f"DROP TABLE IF EXISTS \"{table_name}\" CASCADE;")
-
-                # Get column definitions
-                cursor.execute(f"""
-                    SELECT 
-                        column_name,
-                        data_type,
-                        character_maximum_length,
-                        is_nullable,
-                        column_default,
-                        numeric_precision,
-                        numeric_scale
-                    FROM information_schema.columns
-                    WHERE table_schema = 'public' AND table_name = '{table_name}'
-                    ORDER BY ordinal_position;
-                """)
-                columns_data = cursor.fetchall()
-
-                # Get primary key
-                cursor.execute(f"""
-                    SELECT column_name
-                    FROM information_schema.table_constraints tc
-                    JOIN information_schema.key_column_usage kcu 
-                        ON tc.constraint_name = kcu.constraint_name
-                    WHERE tc.table_schema = 'public' 
-                        AND tc.table_name = '{table_name}'
-                        AND tc.constraint_type = 'PRIMARY KEY';
-                """)
-                pk_columns = [row[0] for row in cursor.fetchall()]
-
-                # Get foreign keys
-                cursor.execute(f"""
-                    SELECT
-                        kcu.column_name,
-                        ccu.table_name AS foreign_table_name,
-                        ccu.column_name AS foreign_column_name,
-                        rc.delete_rule,
-                        tc.constraint_name
-                    FROM information_schema.table_constraints AS tc
-                    JOIN information_schema.key_column_usage AS kcu
-                        ON tc.constraint_name = kcu.constraint_name
-                    JOIN information_schema.constraint_column_usage AS ccu
-                        ON ccu.constraint_name = tc.constraint_name
-                    JOIN information_schema.referential_constraints AS rc
-                        ON rc.constraint_name = tc.constraint_name
-                    WHERE tc.constraint_type = 'FOREIGN KEY'
-                        AND tc.table_schema = 'public'
-                        AND tc.table_name = '{table_name}';
-                """)
-                foreign_keys = cursor.fetchall()
-
-                # Build CREATE TABLE statement
-                sql_content.append(f"CREATE TABLE \"{table_name}\" (")
-
-                column_defs = []
-                for col_data in columns_data:
-                    col_name, data_type, max_length, is_nullable, default, precision, scale = col_data
-
-                    col_def = f'"{col_name}"'
-
-                    # Build data type
-                    if data_type == 'character varying':
-                        col_def += f" VARCHAR({max_length})" if max_length else " VARCHAR"
-                    elif data_type == 'character':
-                        col_def += f" CHAR({max_length})" if max_length else " CHAR"
-                    elif data_type == 'numeric':
-                        if precision and scale:
-                            col_def += f" NUMERIC({precision},{scale})"
-                        elif precision:
-                            col_def += f" NUMERIC({precision})"
-                        else:
-                            col_def += " NUMERIC"
-                    elif data_type == 'integer':
-                        col_def += " INTEGER"
-                    elif data_type == 'bigint':
-                        col_def += " BIGINT"
-                    elif data_type == 'smallint':
-                        col_def += " SMALLINT"
-                    elif data_type == 'boolean':
-                        col_def += " BOOLEAN"
-                    elif data_type == 'date':
-                        col_def += " DATE"
-                    elif data_type == 'timestamp with time zone':
-                        col_def += " TIMESTAMP WITH TIME ZONE"
-                    elif data_type == 'timestamp without time zone':
-                        col_def += " TIMESTAMP WITHOUT TIME ZONE"
-                    elif data_type == 'text':
-                        col_def += " TEXT"
-                    else:
-                        col_def += f" {data_type.upper()}"
-
-                    # Primary key
-                    if col_name in pk_columns:
-                        if 'SERIAL' in col_def or 'BIGSERIAL' in col_def:
-                            pass  # Already includes PRIMARY KEY
-                        else:
-                            col_def += " PRIMARY KEY"
-
-                    # NULL/NOT NULL
-                    if is_nullable == 'NO' and col_name not in pk_columns:
-                        col_def += " NOT NULL"
-
-                    # Default value
-                    if default:
-                        # Clean up default (remove ::type casts)
-                        default_clean = default.split('::')[0].strip()
-                        col_def += f" DEFAULT {default_clean}"
-
-                    column_defs.append(col_def)
-
-                sql_content.append(",\n".join(column_defs))
-
-                # Add foreign key constraints AFTER column definitions
-                if foreign_keys:
-                    sql_content.append(",\n")
-                    fk_constraints = []
-                    for fk in foreign_keys:
-                        col_name, foreign_table, foreign_col, delete_rule, constraint_name = fk
-                        delete_action = delete_rule.upper() if delete_rule else 'NO ACTION'
-                        fk_constraints.append(
-                            f'    CONSTRAINT "{constraint_name}" FOREIGN KEY ("{col_name}") '
-                            f'REFERENCES "{foreign_table}" ("{foreign_col}") '
-                            f'ON DELETE {delete_action}'
-                        )
-                    sql_content.append(",\n".join(fk_constraints))
-
-                sql_content.append(");")
-                sql_content.append("")
-
-        # ============================================
-        # PART 2: Generate INSERT statements (data)
-        # ============================================
-        sql_content.append("-- ============================================")
-        sql_content.append("-- DATA: Insert Statements")
-        sql_content.append("-- ============================================")
-        sql_content.append("")
-
-        # We'll query each table directly instead of using dumpdata
-        with connection.cursor() as cursor:
-            for table_name in sorted_tables:
-                # Get column names for this table
-                cursor.execute(f"""
-                    SELECT column_name
-                    FROM information_schema.columns
-                    WHERE table_schema = 'public' AND table_name = '{table_name}'
-                    ORDER BY ordinal_position;
-                """)
-                columns = [row[0] for row in cursor.fetchall()]
-
-                # Get all data from table
-                cursor.execute(f'SELECT * FROM "{table_name}" ORDER BY id;')
-                rows = cursor.fetchall()
-
-                if not rows:
-                    continue
-
-                sql_content.append(f"-- Data for {table_name}")
-                sql_content.append(f"-- {len(rows)} records")
-                sql_content.append("")
-
-                # ============================================
-                # SPECIAL HANDLING FOR STUDENTPROFILE IMAGES
-                # Convert relative image paths to full Cloudinary URLs
-                # ============================================
-                if table_name == 'core_studentprofile' and is_cloudinary:
-                    try:
-                        # Find the index of id_picture column
-                        id_picture_index = columns.index('id_picture')
-
-                        # Get Cloudinary configuration
-                        cloudinary_config = getattr(settings, 'CLOUDINARY_STORAGE', {})
-                        cloud_name = cloudinary_config.get('CLOUD_NAME', 'dtm2fwxth')
-
-                        if cloud_name:
-                            # Process each row to convert paths
-                            processed_rows = []
-                            for row in rows:
-                                row_list = list(row)
-
-                                if row_list[id_picture_index]:  # If there's an image
-                                    image_path = row_list[id_picture_index]
-
-                                    # Only convert if not already a full URL
-                                    if image_path and not str(image_path).startswith('http'):
-                                        # Clean path
-                                        clean_path = str(image_path)
-
-                                        # Remove leading slashes
-                                        if clean_path.startswith('/'):
-                                            clean_path = clean_path[1:]
-
-                                        # Remove 'media/' prefix if present
-                                        if clean_path.startswith('media/'):
-                                            clean_path = clean_path[6:]
-
-                                        # IMPORTANT: DO NOT add file extensions!
-                                        # Cloudinary stores files with their original extensions
-                                        # The database stores paths like:
-                                        # - id_pictures/Screenshot_2025-12-24_074958.png
-                                        # - id_pictures/usted_eFffvfw.png
-                                        # - id_pictures/soy.png
-                                        # - id_pictures/PXL_20251230_071810182.PORTRAIT_qlwj1d
-
-                                        # For paths without standard extensions (like .PORTRAIT files),
-                                        # Cloudinary automatically adds the correct extension when serving
-                                        # We should keep the path exactly as stored
-
-                                        # Convert to full Cloudinary URL
-                                        # Note: Cloudinary may add versioning (v1767259980) automatically
-                                        # But we use the simpler format without version
-                                        full_url = f"https://res.cloudinary.com/{cloud_name}/image/upload/{clean_path}"
-                                        row_list[id_picture_index] = full_url
-                                        logger.info(f"Converted image path: {image_path} -> {full_url}")
-
-                                processed_rows.append(tuple(row_list))
-
-                            # Use processed rows instead of original rows
-                            rows = processed_rows
-
-                    except ValueError:
-                        # id_picture column not found, continue with original rows
-                        logger.warning(f"id_picture column not found in {table_name}")
-                        pass
-                    except Exception as e:
-                        logger.error(f"Error processing image paths: {str(e)}")
-                        # Continue with original rows if there's an error
-
-                # Generate INSERT statements for all rows
-                for row in rows:
-                    values = []
-                    for val in row:
-                        if val is None:
-                            values.append('NULL')
-                        elif isinstance(val, str):
-                            # Escape single quotes and backslashes
-                            escaped = val.replace("\\", "\\\\").replace("'", "''")
-                            values.append(f"'{escaped}'")
-                        elif isinstance(val, bool):
-                            values.append('TRUE' if val else 'FALSE')
-                        elif isinstance(val, (int, float)):
-                            values.append(str(val))
-                        elif isinstance(val, (dt.date, dt_class)):
-                            values.append(f"'{val.isoformat()}'")
-                        else:
-                            # Convert to string and escape
-                            escaped = str(val).replace("\\", "\\\\").replace("'", "''")
-                            values.append(f"'{escaped}'")
-
-                    col_list = ', '.join(f'"{col}"' for col in columns)
-                    val_list = ', '.join(values)
-                    sql_content.append(f'INSERT INTO "{table_name}" ({col_list}) VALUES ({val_list});')
-
-                sql_content.append("")
-
-        # ============================================
-        # PART 3: Add image metadata summary
-        # ============================================
-        if is_cloudinary:
-            sql_content.append("-- ============================================")
-            sql_content.append("-- IMAGE METADATA SUMMARY")
-            sql_content.append("-- ============================================")
-            sql_content.append("")
-
-            with connection.cursor() as cursor:
-                # Count students with ID pictures
-                cursor.execute("""
-                               SELECT COUNT(*)                     as total_students,
-                                      COUNT(id_picture)            as students_with_pictures,
-                                      COUNT(*) - COUNT(id_picture) as students_without_pictures
-                               FROM core_studentprofile
-                               """)
-                counts = cursor.fetchone()
-
-                if counts:
-                    total, with_pics, without_pics = counts
-                    sql_content.append(f"-- Total students: {total}")
-                    sql_content.append(f"-- Students with ID pictures: {with_pics}")
-                    sql_content.append(f"-- Students without ID pictures: {without_pics}")
-                    sql_content.append("")
-
-                # List all image files stored in Cloudinary
-                sql_content.append("-- All images are stored in Cloudinary at:")
-                cloudinary_config = getattr(settings, 'CLOUDINARY_STORAGE', {})
-                cloud_name = cloudinary_config.get('CLOUD_NAME', 'dtm2fwxth')
-                if cloud_name:
-                    sql_content.append(f"-- https://res.cloudinary.com/{cloud_name}/image/upload/")
-                sql_content.append("")
-
-                # Get a few sample image URLs to show format
-                cursor.execute("""
-                               SELECT id, first_name, last_name, id_picture
-                               FROM core_studentprofile
-                               WHERE id_picture IS NOT NULL
-                               LIMIT 3
-                               """)
-                sample_images = cursor.fetchall()
-
-                if sample_images:
-                    sql_content.append("-- Sample image URLs (as stored in database):")
-                    for student_id, first_name, last_name, image_url in sample_images:
-                        if image_url:
-                            # Truncate long URLs for readability
-                            display_url = image_url
-                            if len(display_url) > 80:
-                                display_url = display_url[:77] + "..."
-                            sql_content.append(f"-- Student {student_id}: {first_name} {last_name}")
-                            sql_content.append(f"--   URL: {display_url}")
-                    sql_content.append("")
-
-        sql_content.append("COMMIT;")
-
-        sql_output = '\n'.join(sql_content)
-
-        # Create response
-        timestamp = dt_class.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'nups_backup_{timestamp}.sql'
+        # Read the schema up front so introspection errors still get a 500
+        schema = backup.read_schema()
+        is_cloudinary = backup.is_cloudinary_storage()
+
+        # The watermark is taken before any row is read; the manifest stays
+        # incomplete until the whole backup has been streamed
+        manifest = BackupManifest.objects.create(
+            kind='incremental' if incremental else 'full',
+            since=since,
+            watermark=timezone.now(),
+        )
 
-        response = HttpResponse(sql_output, content_type='application/sql')
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        response['Content-Length'] = len(sql_output.encode('utf-8'))
+        timestamp = dt_class.now().strftime('%Y%m%d_%H%M%S')
+        filename = backup.backup_filename(timestamp, compression, incremental)
 
-        logger.info(f"Database backup created and downloaded: {filename}")
-        logger.info(f"Cloudinary enabled: {is_cloudinary}")
-        logger.info(f"Backup includes full Cloudinary URLs for images")
-        return response
+        if incremental:
+            chunks = backup.iter_chunks(
+                backup.generate_incremental_backup(schema, since, manifest, is_cloudinary)
+            )
+        elif backup_format == 'copy':
+            chunks = backup.generate_copy_backup(schema, is_cloudinary, manifest)
+        else:
+            chunks = backup.iter_chunks(
+                backup.generate_sql_backup(schema, is_cloudinary, manifest)
+            )
+        logger.info("Streaming database backup %s (Cloudinary enabled: %s)", filename, is_cloudinary)
+        return backup.streaming_backup_response(request, chunks, filename, compression, manifest)
 
     except Exception as e:
-        logger.error(f"Backup failed: {str(e)}", exc_info=True)
+        logger.error("Backup failed: %s", e, exc_info=True)
         return Response(
             {'error': str(e), 'detail': 'Failed to create database backup'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
-
-
-
-
@@ -1,162 +1,64 @@
 // src/components/admin/MembersList.tsx
-import {useMemo, useState} from 'react';
-import type {StudentProfile} from '../services/api.ts';
-import {useStudents} from '../hooks/useStudents.ts';
+import {useEffect, useState} from 'react';
+import type {FacetCount, StudentProfile} from '../services/api.ts';
+import {downloadRoster, downloadStudentExport} from '../services/api.ts';
+import {useStudentFacets, useStudents} from '../hooks/useStudents.ts';
 import {Download, Eye} from 'lucide-react';
 import StudentDetailModal from './StudentDetailModal.tsx';
-import {jsPDF} from 'jspdf';
-import autoTable from 'jspdf-autotable';
+import {toAbsoluteBackendUrl} from '../apiConfig.ts';
+
+// Look up the display name of a selected hall/program/wing ID
+const facetName = (options: FacetCount[] | undefined, id: string) =>
+    options?.find((option) => String(option.id) === id)?.name || '';
 
 const MembersList = () => {
-    const {data: studentsData = [], isLoading: loading} = useStudents();
     const [selectedStudent, setSelectedStudent] = useState<StudentProfile | null>(null);
     const [genderFilter, setGenderFilter] = useState<string>("")
     const [hallFilter, setHallFilter] = useState<string>("")
     const [programFilter, setProgramFilter] = useState<string>("")
     const [wingFilter, setWingFilter] = useState("")
-
-    // Memoize filtered students for performance
-    const students = useMemo(() => {
-        return studentsData.filter((student) => {
-            const genderMatch = !genderFilter || student.gender === genderFilter;
-            const hallMatch = !hallFilter || student.hall?.name === hallFilter;
-            const programMatch = !programFilter || student.program?.name === programFilter;
-            // Wing filter: check if student belongs to the selected wing (students can have multiple wings)
-            const wingMatch = !wingFilter || (student.wings && student.wings.some(wing => wing.name === wingFilter));
-
-            return genderMatch && hallMatch && programMatch && wingMatch;
-        });
-    }, [studentsData, genderFilter, hallFilter, programFilter, wingFilter]);
-
-    // Generate dynamic PDF title based on active filters
-    const getPDFTitle = () => {
-        // If no filters, return default title
-        if (!genderFilter && !wingFilter && !hallFilter && !programFilter) {
-            return 'All Registered Members';
-        }
-
-        // Build title parts in order: Gender, Wing, Hall, Program
-        let title = 'All';
-        
-        // Add gender if filtered
-        if (genderFilter) {
-            title += ` ${genderFilter}`;
-        }
-        
-        title += ' Members';
-        
-        // Add wing if filtered
-        if (wingFilter) {
-            title += ` in ${wingFilter}`;
-        }
-        
-        // Add hall if filtered
-        if (hallFilter) {
-            title += ` from ${hallFilter}`;
-        }
-        
-        // Add program if filtered (use "studying" to avoid confusion with "in" for wings)
-        if (programFilter) {
-            title += ` studying ${programFilter}`;
-        }
-        
-        return title;
+    const [searchInput, setSearchInput] = useState("")
+    const [search, setSearch] = useState("")
+
+    // Search once typing pauses instead of on every keystroke
+    useEffect(() => {
+        const timer = setTimeout(() => setSearch(searchInput.trim()), 300);
+        return () => clearTimeout(timer);
+    }, [searchInput]);
+
+    // Filtering, search and dropdown options are computed on the server
+    const filters = {gender: genderFilter, hall: hallFilter, program: programFilter, wing: wingFilter, q: search};
+    const {data: students = [], isLoading: loading} = useStudents(filters);
+    const {data: facets} = useStudentFacets(filters);
+
+    const hallName = facetName(facets?.hall, hallFilter);
+    const programName = facetName(facets?.program, programFilter);
+    const wingName = facetName(facets?.wing, wingFilter);
+
+    const [exporting, setExporting] = useState(false);
+
+    // Generate filename based on active filters
+    const getFileName = () => {
+        const parts: string[] = [];
+        if (genderFilter) parts.push(genderFilter.toLowerCase());
+        if (wingFilter) parts.push(wingName.toLowerCase().replace(/\s+/g, '-'));
+        if (hallFilter) parts.push(hallName.toLowerCase().replace(/\s+/g, '-'));
+        if (programFilter) parts.push(programName.toLowerCase().substring(0, 20).replace(/\s+/g, '-'));
+
+        const filterSuffix = parts.length > 0 ? `-${parts.join('-')}` : '';
+        return `members-list${filterSuffix}-${new Date().toISOString().split('T')[0]}.pdf`;
     };
 
-    const exportToPDF = () => {
-        const doc = new jsPDF({
-            orientation: 'portrait',
-            unit: 'mm',
-            format: 'a4',
-        });
-
-        // Dynamic Title based on filters
-        const pdfTitle = getPDFTitle();
-        doc.setFontSize(18);
-        
-        // Calculate page width A4 portrait
-        const pageWidth = 210;
-        const margin = 14;
-        const maxWidth = pageWidth - (margin * 2);
-        
-        // Split title into multiple lines if it's too long
-        const titleLines = doc.splitTextToSize(pdfTitle, maxWidth);
-        
-        // Draw title with wrapping
-        let currentY = 20;
-        titleLines.forEach((line: string) => {
-            doc.text(line, margin, currentY);
-            currentY += 6; // Line height
-        });
-
-        // Subtitle - adjust position based on title height
-        doc.setFontSize(12);
-        currentY += 3; // Add some spacing after title
-        doc.text(`Total Members: ${students.length}`, margin, currentY);
-        currentY += 6;
-        doc.text(`Generated on: ${new Date().toLocaleDateString('en-GB', {
-            day: 'numeric',
-            month: 'long',
-            year: 'numeric'
-        })}`, margin, currentY);
-
-        const tableColumns = [
-            'Name',
-            'Gender',
-            'Contact',
-            'Residence',
-            'Program',
-            'Hall',
-            'Wings',
-        ];
-
-        const tableRows = students.map((s) => [
-            `${s.first_name} ${s.other_name || ""} ${s.last_name}`,
-            s.gender || '—',
-            s.contact || '—',
-            s.place_of_residence || '—',
-            s.program?.name || '—',
-            s.hall?.name || '—',
-            s.wings && s.wings.length > 0 ? s.wings.map((w) => w.name).join(', ') : '—',
-
-        ]);
-
-
-        // Adjust startY based on title height (add extra space for wrapped titles)
-        const tableStartY = currentY + 8; // Add spacing after subtitle
-        
-        autoTable(doc, {
-            head: [tableColumns],
-            body: tableRows,
-            startY: tableStartY,
-            theme: 'grid',
-            styles: {fontSize: 8, cellPadding: 3, overflow: 'linebreak', valign: 'middle'},
-            headStyles: {fillColor: [30, 64, 175], textColor: 255, fontStyle: 'bold', halign: 'center'},
-            alternateRowStyles: {fillColor: [245, 249, 255]},
-            columnStyles: {
-                0: {fontStyle: 'bold'},
-                10: {cellWidth: 40},
-                11: {cellWidth: 35},
-                12: {cellWidth: 30},
-            },
-            margin: {top: 45, left: 10, right: 10},
-            pageBreak: 'auto',
-            rowPageBreak: 'avoid',
-        });
-
-        // Generate filename based on active filters
-        const getFileName = () => {
-            const parts: string[] = [];
-            if (genderFilter) parts.push(genderFilter.toLowerCase());
-            if (wingFilter) parts.push(wingFilter.toLowerCase().replace(/\s+/g, '-'));
-            if (hallFilter) parts.push(hallFilter.toLowerCase().replace(/\s+/g, '-'));
-            if (programFilter) parts.push(programFilter.toLowerCase().substring(0, 20).replace(/\s+/g, '-'));
-            
-            const filterSuffix = parts.length > 0 ? `-${parts.join('-')}` : '';
-            return `members-list${filterSuffix}-${new Date().toISOString().split('T')[0]}.pdf`;
-        };
-
-        doc.save(getFileName());
+    // The roster PDF is rendered (and cached) on the server
+    const exportToPDF = async () => {
+        setExporting(true);
+        try {
+            await downloadRoster(filters, getFileName());
+        } catch (err) {
+            console.error('Roster download failed', err);
+        } finally {
+            setExporting(false);
+        }
     };
     if (loading) return <p className="text-center py-10">Loading members...</p>;
 
@@ -164,6 +66,14 @@ const MembersList = () => {
         <div>
             <div className="mt-8 mb-6">
                 <div className="grid grid-cols-2 sm:flex sm:flex-wrap gap-3">
+                    <input
+                        type="search"
+                        value={searchInput}
+                        onChange={(e) => setSearchInput(e.target.value)}
+                        placeholder="Search name, email, contact..."
+                        className="col-span-2 w-full sm:w-64 border border-blue-200 px-3 py-2 rounded-lg text-sm focus:outline-none focus:ring-2 focus:ring-blue-400"
+                    />
+
                     <select
                         value={genderFilter}
                         onChange={(e) => setGenderFilter(e.target.value)}
@@ -180,13 +90,11 @@ const MembersList = () => {
                         className="w-full sm:w-auto border border-blue-200 px-3 py-2 rounded-lg text-sm focus:outline-none focus:ring-2 focus:ring-blue-400"
                     >
                         <option value="">All Programs</option>
-                        {[...new Set(studentsData.map(s => s.program?.name).filter(Boolean))].map(
-                            (program) => (
-                                <option key={program} value={program}>
-                                    {program}
-                                </option>
-                            )
-                        )}
+                        {facets?.program.map((program) => (
+                            <option key={program.id} value={String(program.id)}>
+                                {program.name} ({program.count})
+                            </option>
+                        ))}
                     </select>
 
                     <select
@@ -195,13 +103,11 @@ const MembersList = () => {
                         className="w-full sm:w-auto border border-blue-200 px-3 py-2 rounded-lg text-sm focus:outline-none focus:ring-2 focus:ring-blue-400"
                     >
                         <option value="">All Halls</option>
-                        {[...new Set(studentsData.map(s => s.hall?.name).filter(Boolean))].map(
-                            (hall) => (
-                                <option key={hall} value={hall}>
-                                    {hall}
-                                </option>
-                            )
-                        )}
+                        {facets?.hall.map((hall) => (
+                            <option key={hall.id} value={String(hall.id)}>
+                                {hall.name} ({hall.count})
+                            </option>
+                        ))}
                     </select>
 
                     <select
@@ -210,13 +116,11 @@ const MembersList = () => {
                         className="w-full sm:w-auto border border-blue-200 px-3 py-2 rounded-lg text-sm focus:outline-none focus:ring-2 focus:ring-blue-400"
                     >
                         <option value="">All Wings</option>
-                        {[...new Set(studentsData.flatMap(s => s.wings?.map(w => w.name) || []).filter(Boolean))].map(
-                            (wing) => (
-                                <option key={wing} value={wing}>
-                                    {wing}
-                                </option>
-                            )
-                        )}
+                        {facets?.wing.map((wing) => (
+                            <option key={wing.id} value={String(wing.id)}>
+                                {wing.name} ({wing.count})
+                            </option>
+                        ))}
                     </select>
                 </div>
             </div>
@@ -228,13 +132,23 @@ const MembersList = () => {
                     Total Members ({students.length})
                 </h1>
 
-                <button
-                    onClick={exportToPDF}
-                    className="flex items-center gap-2 bg-blue-600 text-white px-3 py-3 rounded-lg hover:bg-blue-700 transition font-medium shadow-md"
-                >
-                    <Download className="w-5 h-5"/>
-                    Export List
-                </button>
+                <div className="flex gap-2">
+                    <button
+                        onClick={exportToPDF}
+                        disabled={exporting}
+                        className="flex items-center gap-2 bg-blue-600 text-white px-3 py-3 rounded-lg hover:bg-blue-700 transition font-medium shadow-md disabled:opacity-60"
+                    >
+                        <Download className="w-5 h-5"/>
+                        {exporting ? 'Preparing...' : 'Export List'}
+                    </button>
+                    <button
+                        onClick={() => downloadStudentExport('xlsx', filters).catch((err) => console.error('Export failed', err))}
+                        className="flex items-center gap-2 bg-white text-blue-700 border border-blue-600 px-3 py-3 rounded-lg hover:bg-blue-50 transition font-medium shadow-md"
+                    >
+                        <Download className="w-5 h-5"/>
+                        Excel
+                    </button>
+                </div>
             </div>
 
             {/* Horizontally Scrollable Table on Mobile */}
@@ -268,6 +182,14 @@ const MembersList = () => {
                             {students.map((student) => (
                                 <tr key={student.id} className="hover:bg-blue-50 transition">
                                     <td className="px-6 py-1 whitespace-nowrap font-medium">
+                                        {student.id_picture_thumbnail && (
+                                            <img
+                                                src={toAbsoluteBackendUrl(student.id_picture_thumbnail)}
+                                                alt=""
+                                                loading="lazy"
+                                                className="inline-block w-8 h-8 mr-3 rounded-full object-cover"
+                                            />
+                                        )}
                                         {student.first_name} {student.last_name}
                                         {student.other_name && ` ${student.other_name}`}
                                     </td>
@@ -121,7 +121,7 @@ const StudentDetailModal = ({student, onClose}: StudentDetailModalProps) => {
                     <div className="md:col-span-1 flex flex-col items-center">
                         {hasImage ? (
                             <img
-                                src={toAbsoluteBackendUrl(student.id_picture as string)}
+                                src={toAbsoluteBackendUrl((student.id_picture_medium || student.id_picture) as string)}
                                 alt={`${student.first_name} ${student.last_name}`}
                                 className="w-48 h-48 object-cover rounded-full border-4 border-blue-200 shadow-xl"
                                 onError={() => setImageError(true)}
@@ -138,6 +138,15 @@ const StudentDetailModal = ({student, onClose}: StudentDetailModalProps) => {
                             {student.first_name} {student.last_name} {student.other_name &&  student.other_name}
                         </h3>
                         <p className="text-sm text-gray-500 mt-1">{student.email}</p>
+                        {(student.id_picture_status === 'pending' || student.id_picture_status === 'uploading') && (
+                            <p className="text-xs text-amber-600 mt-2">ID picture is still uploading</p>
+                        )}
+                        {student.id_picture_status === 'failed' && (
+                            <p className="text-xs text-red-600 mt-2">ID picture upload failed</p>
+                        )}
+                        {student.id_picture_status === 'invalid' && (
+                            <p className="text-xs text-red-600 mt-2">ID picture could not be read</p>
+                        )}
                     </div>
 
                     {/* Details Section */}
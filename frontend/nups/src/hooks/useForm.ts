@@ -1,8 +1,6 @@
 import {type ChangeEvent, type FormEvent, useCallback, useEffect, useState} from "react";
 import {
-    getHalls,
-    getPrograms,
-    getWings,
+    getFormBootstrap,
     type Hall,
     type Program,
     type StudentProfile,
@@ -52,11 +50,8 @@ export const useStudentForm = () => {
         const loadDropdownData = async () => {
             setLoading(true);
             try {
-                const [programsData, hallsData, wingsData] = await Promise.all([
-                    getPrograms(),
-                    getHalls(),
-                    getWings(),
-                ]);
+                // One round trip for all three dropdowns
+                const {programs: programsData, halls: hallsData, wings: wingsData} = await getFormBootstrap();
                 setPrograms(programsData)
                 setHalls(hallsData);
                 setWings(wingsData);
@@ -1,13 +1,31 @@
-import {useQuery} from '@tanstack/react-query';
-import {getAllStudents, type StudentProfile} from '../services/api.ts';
+import {keepPreviousData, useQuery} from '@tanstack/react-query';
+import {
+    getAllStudents,
+    getStudentFacets,
+    type StudentFacets,
+    type StudentFilters,
+    type StudentProfile
+} from '../services/api.ts';
 
 /**
- * React Query hook to fetch all students
+ * React Query hook to fetch all students matching the given filters
  */
-export const useStudents = () => {
+export const useStudents = (filters: StudentFilters = {}) => {
     return useQuery<StudentProfile[]>({
-        queryKey: ['students'],
-        queryFn: getAllStudents,
+        queryKey: ['students', 'list', filters],
+        queryFn: () => getAllStudents(filters),
+        placeholderData: keepPreviousData, // Keep showing the old rows while a new filter loads
+    });
+};
+
+/**
+ * React Query hook to fetch filter dropdown options with their counts
+ */
+export const useStudentFacets = (filters: StudentFilters = {}) => {
+    return useQuery<StudentFacets>({
+        queryKey: ['students', 'facets', filters],
+        queryFn: () => getStudentFacets(filters),
+        placeholderData: keepPreviousData,
     });
 };
 
@@ -42,6 +42,11 @@ export interface StudentProfile {
     wing_ids?: number[];
     emergency_contact_data?: EmergencyContact;
     id_picture?: File | string;
+    // Resized renditions (read-only): detail view and member list
+    id_picture_medium?: string | null;
+    id_picture_thumbnail?: string | null;
+    // Pictures are uploaded to storage in the background after registration
+    id_picture_status?: "none" | "pending" | "uploading" | "ready" | "failed" | "invalid";
     // Read-only fields (returned from API)
     program?: Program;
     hall?: Hall;
@@ -196,11 +201,111 @@ export const submitStudentProfile = async (
     return response.data;
 };
 
+export interface StudentFilters {
+    gender?: string;
+    hall?: string;
+    program?: string;
+    wing?: string;
+    q?: string; // Search over names, e-mail, contact and residence
+}
+
+export interface FacetCount {
+    id: number;
+    name: string;
+    count: number;
+}
+
+export interface StudentFacets {
+    total: number;
+    gender: { value: string; count: number }[];
+    hall: FacetCount[];
+    program: FacetCount[];
+    wing: FacetCount[];
+}
+
+// Drop empty filters so they are not sent as blank query parameters
+const filterParams = (filters: StudentFilters = {}) =>
+    Object.fromEntries(Object.entries(filters).filter(([, value]) => value));
+
 /**
  * Get all student profiles (Admin endpoint)
+ * Filters are applied on the server; hall, program and wing take IDs
+ */
+export const getAllStudents = async (filters: StudentFilters = {}): Promise<StudentProfile[]> => {
+    const response: AxiosResponse<StudentProfile[]> = await api.get("/students/", {
+        params: filterParams(filters),
+    });
+    return response.data;
+};
+
+/**
+ * Get per-value counts for each member list filter (Admin endpoint)
  */
-export const getAllStudents = async (): Promise<StudentProfile[]> => {
-    const response: AxiosResponse<StudentProfile[]> = await api.get("/students/");
+export const getStudentFacets = async (filters: StudentFilters = {}): Promise<StudentFacets> => {
+    const response: AxiosResponse<StudentFacets> = await api.get("/students/facets/", {
+        params: filterParams(filters),
+    });
+    return response.data;
+};
+
+export type StudentExportFormat = "csv" | "xlsx" | "ndjson";
+
+// Save a blob response under the server's filename (or the given one)
+const saveDownload = (response: AxiosResponse<Blob>, fallbackName: string, filename?: string) => {
+    const disposition = response.headers["content-disposition"] as string | undefined;
+    const name = filename || disposition?.match(/filename="([^"]+)"/)?.[1] || fallbackName;
+    const url = URL.createObjectURL(response.data);
+    const link = document.createElement("a");
+    link.href = url;
+    link.download = name;
+    link.click();
+    URL.revokeObjectURL(url);
+};
+
+/**
+ * Download the member list, built on the server with the given filters (Admin endpoint)
+ */
+export const downloadStudentExport = async (
+    format: StudentExportFormat,
+    filters: StudentFilters = {}
+): Promise<void> => {
+    const response: AxiosResponse<Blob> = await api.get("/students/export/", {
+        params: {...filterParams(filters), format},
+        responseType: "blob",
+        timeout: 0, // Large memberships take a while to stream
+    });
+    saveDownload(response, `members.${format}`);
+};
+
+/**
+ * Download the roster PDF for the given filters, rendered and cached on the server (Admin endpoint)
+ */
+export const downloadRoster = async (filters: StudentFilters = {}, filename?: string): Promise<void> => {
+    const response: AxiosResponse<Blob> = await api.get("/students/roster/", {
+        params: filterParams(filters),
+        responseType: "blob",
+        timeout: 0, // The first download of a large roster renders it
+    });
+    saveDownload(response, "members-list.pdf", filename);
+};
+
+export interface StudentPage {
+    next: string | null;
+    page_size: number;
+    results: StudentProfile[];
+}
+
+/**
+ * Get one page of student profiles (Admin endpoint)
+ * Pass the previous page's `next` URL as `cursorUrl` to fetch the following page
+ */
+export const getStudentsPage = async (
+    pageSize: number = 50,
+    cursorUrl?: string | null
+): Promise<StudentPage> => {
+    const response: AxiosResponse<StudentPage> = cursorUrl
+        ? await api.get(cursorUrl)
+        : await api.get("/students/", {params: {page_size: pageSize}});
     return response.data;
 };
 
@@ -214,6 +319,21 @@ export const getStudentById = async (id: number): Promise<StudentProfile> => {
     return response.data;
 };
 
+export interface FormBootstrap {
+    version: string;
+    programs: Program[];
+    halls: Hall[];
+    wings: Wing[];
+}
+
+/**
+ * Get programs, halls and wings for the registration form in one request
+ */
+export const getFormBootstrap = async (): Promise<FormBootstrap> => {
+    const response: AxiosResponse<FormBootstrap> = await api.get("/form-bootstrap/");
+    return response.data;
+};
+
 /**
  * Get all programs (for dropdown)
  */
@@ -1,5 +1,6 @@
 import json
 import os
+import tempfile
 from datetime import timedelta
 from pathlib import Path
 
@@ -91,8 +92,11 @@ else:
 # Middleware
 # --------------------------------------------------
 MIDDLEWARE = [
+    # First, so that its latency covers every other middleware
+    "core.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    # WhiteNoise, able to run async; see core/middleware.py
+    "core.middleware.WhiteNoiseMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -139,6 +143,47 @@ DATABASES = {
     )
 }
 
+# Typo tolerance of the student search (core/search.py): pg_trgm's word
+# similarity threshold (its default, 0.6, misses most one-letter typos)
+SEARCH_SIMILARITY_THRESHOLD = get_env("SEARCH_SIMILARITY_THRESHOLD", 0.5, cast=float)
+
+# Connection reuse on PostgreSQL. With DB_POOL, each worker process keeps a
+# psycopg pool of DB_POOL_MIN_SIZE to DB_POOL_MAX_SIZE connections, checked
+# before being handed out; a request waits up to DB_POOL_TIMEOUT seconds for
+# one. WEB_CONCURRENCY * DB_POOL_MAX_SIZE must stay below the server's
+# connection limit. Idle connections beyond the minimum are closed after
+# DB_POOL_MAX_IDLE seconds, and every connection after DB_POOL_MAX_LIFETIME.
+DB_POOL = get_env("DB_POOL", True, cast=bool)
+DB_POOL_MIN_SIZE = get_env("DB_POOL_MIN_SIZE", 2, cast=int)
+DB_POOL_MAX_SIZE = get_env("DB_POOL_MAX_SIZE", 5, cast=int)
+DB_POOL_TIMEOUT = get_env("DB_POOL_TIMEOUT", 10, cast=float)
+DB_POOL_MAX_IDLE = get_env("DB_POOL_MAX_IDLE", 300, cast=float)
+DB_POOL_MAX_LIFETIME = get_env("DB_POOL_MAX_LIFETIME", 1800, cast=float)
+# Without the pool: seconds a thread keeps its connection. Only for WSGI;
+# under ASGI every request has a thread of its own, so connections would
+# pile up instead of being reused.
+DB_CONN_MAX_AGE = get_env("DB_CONN_MAX_AGE", 0, cast=int)
+
+if DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql":
+    database_options = DATABASES["default"].setdefault("OPTIONS", {})
+    # Added to any options given in DATABASE_URL (e.g. ?options=-c statement_timeout=5000)
+    database_options["options"] = " ".join(filter(None, [
+        database_options.get("options"),
+        f"-c pg_trgm.word_similarity_threshold={SEARCH_SIMILARITY_THRESHOLD}",
+    ]))
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+    if DB_POOL:
+        database_options["pool"] = {
+            "name": "default",
+            "min_size": DB_POOL_MIN_SIZE,
+            "max_size": max(DB_POOL_MAX_SIZE, DB_POOL_MIN_SIZE),
+            "timeout": DB_POOL_TIMEOUT,
+            "max_idle": DB_POOL_MAX_IDLE,
+            "max_lifetime": DB_POOL_MAX_LIFETIME,
+        }
+    else:
+        DATABASES["default"]["CONN_MAX_AGE"] = DB_CONN_MAX_AGE
+
 # --------------------------------------------------
 # Password Validation
 # --------------------------------------------------
@@ -154,7 +199,8 @@ AUTH_PASSWORD_VALIDATORS = [
 # --------------------------------------------------
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        # simplejwt's, with a user lookup for the async views
+        "core.authentication.AsyncJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -231,7 +277,7 @@ if USE_CLOUDINARY:
     # Log Cloudinary config (without secrets)
     import logging
     logger = logging.getLogger(__name__)
-    logger.info(f"Cloudinary enabled. Cloud name: {cloud_name}, API key set: {bool(api_key)}")
+    logger.info("Cloudinary enabled. Cloud name: %s, API key set: %s", cloud_name, bool(api_key))
     
     CLOUDINARY_STORAGE = {
         'CLOUD_NAME': cloud_name,
@@ -248,30 +294,86 @@ if USE_CLOUDINARY:
     
     print(f"[SETTINGS] DEFAULT_FILE_STORAGE set to: {DEFAULT_FILE_STORAGE}")
     print(f"[SETTINGS] DEFAULT_FILE_STORAGE class: {type(DEFAULT_FILE_STORAGE)}")
-    logger.info(f"Cloudinary enabled. Cloud name: {cloud_name}, API key set: {bool(api_key)}")
-    logger.info(f"DEFAULT_FILE_STORAGE set to: {DEFAULT_FILE_STORAGE}")
+    logger.info("Cloudinary enabled. Cloud name: %s, API key set: %s", cloud_name, bool(api_key))
+    logger.info("DEFAULT_FILE_STORAGE set to: %s", DEFAULT_FILE_STORAGE)
 else:
     # Local filesystem storage for development
     MEDIA_URL = "/media/"
     MEDIA_ROOT = BASE_DIR / "media"
 
+# ID pictures are written here at registration and uploaded to the media
+# storage by a background worker pool (core/uploads.py)
+ID_PICTURE_STAGING_ROOT = get_env("ID_PICTURE_STAGING_ROOT", BASE_DIR / "media" / "staging")
+ID_PICTURE_UPLOAD_WORKERS = get_env("ID_PICTURE_UPLOAD_WORKERS", 2, cast=int)
+# Uploads waiting beyond this stay pending for `manage.py upload_pending_pictures`
+ID_PICTURE_UPLOAD_QUEUE_SIZE = get_env("ID_PICTURE_UPLOAD_QUEUE_SIZE", 100, cast=int)
+ID_PICTURE_UPLOAD_RETRIES = get_env("ID_PICTURE_UPLOAD_RETRIES", 3, cast=int)
+# Seconds before the first retry; doubled for each further attempt
+ID_PICTURE_UPLOAD_RETRY_DELAY = get_env("ID_PICTURE_UPLOAD_RETRY_DELAY", 2, cast=float)
+# Seconds after which a picture still "uploading" is taken to have been left
+# by a process that died, and may be claimed again
+ID_PICTURE_UPLOAD_CLAIM_TIMEOUT = get_env("ID_PICTURE_UPLOAD_CLAIM_TIMEOUT", 900, cast=int)
+# Processes resizing pictures before upload (core/images.py); 0 resizes on
+# the upload thread itself
+ID_PICTURE_PROCESS_WORKERS = get_env("ID_PICTURE_PROCESS_WORKERS", 1, cast=int)
+
+# Resolved media URLs kept in memory per process (core/storage_urls.py)
+IMAGE_URL_CACHE_SIZE = get_env("IMAGE_URL_CACHE_SIZE", 4096, cast=int)
+
+# Seconds a worker keeps the program/hall/wing lists (core/lookups.py);
+# bounds how long other workers serve a list after a change
+LOOKUP_CACHE_TTL = get_env("LOOKUP_CACHE_TTL", 300, cast=int)
+
+# Rendered roster PDFs (core/rosters.py), shared by the workers on a machine
+ROSTER_CACHE_ROOT = get_env("ROSTER_CACHE_ROOT", BASE_DIR / "media" / "rosters")
+ROSTER_CACHE_MAX_FILES = get_env("ROSTER_CACHE_MAX_FILES", 50, cast=int)
+
+# Request metrics (core/metrics.py): each worker writes its numbers here at
+# most every METRICS_FLUSH_INTERVAL seconds, and /metrics adds up those of
+# the running workers (deleting the files of exited ones)
+METRICS_ROOT = get_env("METRICS_ROOT", Path(tempfile.gettempdir()) / "nups-metrics")
+METRICS_FLUSH_INTERVAL = get_env("METRICS_FLUSH_INTERVAL", 5, cast=float)
+
+# Paths answered by the ASGI application itself, before Django runs
+# (core/probes.py); for the keep-alive pinger and liveness probes
+LIVENESS_PATHS = json.loads(get_env("LIVENESS_PATHS", '["/health/", "/api/health/"]'))
+# Seconds a worker keeps the outcome of the /ready/ database and storage checks
+READINESS_CACHE_TTL = get_env("READINESS_CACHE_TTL", 5, cast=float)
+
 
 # --------------------------------------------------
 # Logging
 # --------------------------------------------------
+# Log lines are JSON objects (one per line), or "text" for reading in a terminal
+LOG_FORMAT = get_env("LOG_FORMAT", "json")
+# Level of the core app's loggers; DEBUG adds a line per step of some requests
+LOG_LEVEL = get_env("LOG_LEVEL", "INFO")
+# Share of records below WARNING to keep, by logger name (and its children),
+# e.g. '{"core.views": 0.1}'; see core/log.py
+LOG_SAMPLING = json.loads(get_env("LOG_SAMPLING", "{}"))
+# Records are written by a background thread; set to false to write them in
+# the calling thread instead
+LOG_QUEUE = get_env("LOG_QUEUE", True, cast=bool)
+# Records waiting to be written beyond which new ones are dropped
+LOG_QUEUE_SIZE = get_env("LOG_QUEUE_SIZE", 10000, cast=int)
+
+LOGGING_CONFIG = "core.log.configure"
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'formatters': {
-        'verbose': {
+        'text': {
             'format': '{levelname} {asctime} {module} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'core.log.JSONFormatter',
+        },
     },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+            'formatter': LOG_FORMAT,
         },
     },
     'root': {
@@ -281,7 +383,7 @@ LOGGING = {
     'loggers': {
         'core': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
             'propagate': False,
         },
     },
@@ -5,28 +5,33 @@ from django.urls import path, include
 from django.http import JsonResponse
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from core.probes import liveness_payload
+from core.views import prometheus_metrics, readiness_check
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('core.urls')),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    # Staff-only request metrics in the Prometheus text format
+    path('metrics', prometheus_metrics, name='metrics'),
     # path("create-superuser/", create_superuser_view),
     # path('populate-initial-data/', populate_initial_data, name='populate-initial-data'),
-    # Health check endpoint for keeping service awake (ping this every 10-14 minutes)
-    path('health/', lambda request: JsonResponse({
-        'status': 'healthy',
-        'service': 'NUPS API',
-        'timestamp': __import__('datetime').datetime.now().isoformat(),
-        'message': 'Service is running'
-    }), name='health'),
+    # Health check endpoint for keeping service awake (ping this every 10-14 minutes).
+    # Under ASGI it is answered before Django runs (core/probes.py); this is for WSGI
+    path('health/', lambda request: JsonResponse(liveness_payload()), name='health'),
+    # Database and storage checks, cached for READINESS_CACHE_TTL seconds
+    path('ready/', readiness_check, name='ready'),
     # Root URL - return simple API info (frontend is served separately on Render)
     path('', lambda request: JsonResponse({
         'message': 'NUPS API',
         'endpoints': {
             'admin': '/admin/',
             'api': '/api/',
-            'health': '/health/'
+            'health': '/health/',
+            'ready': '/ready/',
+            'metrics': '/metrics'
         }
     }), name='root'),
 ]